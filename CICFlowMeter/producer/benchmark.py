@@ -0,0 +1,88 @@
+"""
+Benchmark de publicação no RabbitMQ.
+
+Compara o caminho antigo (uma conexão AMQP aberta e fechada por mensagem)
+com o publicador persistente de `producer.message_broker`, publicando
+mensagens sintéticas no mesmo formato do producer.
+
+Uso:
+    PYTHONPATH=/app python3 -m producer.benchmark --host rabbitmq -n 20000
+"""
+import argparse
+import json
+import random
+import time
+
+import pika
+
+from producer.message_broker import MessageBroker
+
+N_FEATURES = 78
+
+
+def synthetic_messages(n):
+    rng = random.Random(42)
+    for i in range(n):
+        yield json.dumps({
+            "IP Src":   f"10.0.{(i >> 8) & 255}.{i & 255}",
+            "Port Src": rng.randint(1024, 65535),
+            "IP Dst":   "192.168.0.1",
+            "id":       f"bench-{i}",
+            "features": [rng.random() for _ in range(N_FEATURES)],
+        })
+
+
+def per_message_connection(host, queue, bodies):
+    """Caminho antigo: conecta, declara, publica e fecha para cada mensagem."""
+    for body in bodies:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+        channel = connection.channel()
+        channel.queue_declare(queue=queue, durable=True)
+        channel.basic_publish(exchange='', routing_key=queue, body=body, properties=pika.BasicProperties(delivery_mode=2))
+        connection.close()
+
+
+def persistent_batched(host, queue, bodies, batch_size):
+    broker = MessageBroker(host=host, queue=queue)
+    try:
+        for i in range(0, len(bodies), batch_size):
+            broker.publish_batch(bodies[i:i + batch_size])
+    finally:
+        broker.close()
+
+
+def purge(host, queue):
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+    channel = connection.channel()
+    channel.queue_declare(queue=queue, durable=True)
+    channel.queue_purge(queue=queue)
+    connection.close()
+
+
+def run(name, fn, n):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {n:>8} msgs  {elapsed:8.2f} s  {n / elapsed:10.1f} msgs/s")
+    return n / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='rabbitmq')
+    parser.add_argument('--queue', default='benchmark-queue', help='fila descartável; é esvaziada ao final')
+    parser.add_argument('-n', type=int, default=20000, help='mensagens no caminho persistente')
+    parser.add_argument('--per-message-n', type=int, default=1000, help='mensagens no caminho antigo (lento)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 500, 2000])
+    args = parser.parse_args()
+
+    bodies = list(synthetic_messages(max(args.n, args.per_message_n)))
+    purge(args.host, args.queue)
+
+    try:
+        baseline = run("conexão por mensagem", lambda: per_message_connection(args.host, args.queue, bodies[:args.per_message_n]), args.per_message_n)
+        for batch_size in args.batch_sizes:
+            rate = run(f"persistente, lote={batch_size}", lambda: persistent_batched(args.host, args.queue, bodies[:args.n], batch_size), args.n)
+            print(f"{'':<28} speedup: {rate / baseline:.1f}x")
+    finally:
+        purge(args.host, args.queue)
@@ -3,34 +3,79 @@ import time
 import json
 
 class MessageBroker:
-    def __init__(self, host='rabbitmq', queue='model-queue'):
+    """
+    Publicador com conexão e canal de longa duração.
+
+    O canal é aberto uma única vez e reaproveitado por todas as publicações.
+    Em `publish_batch` o canal opera em modo transacional: um único
+    `tx_commit` confirma o lote inteiro, então o custo de ida e volta ao
+    broker é pago por lote e não por mensagem. Se a conexão cair, ela é
+    refeita de forma transparente e o lote é republicado (at-least-once).
+    """
+
+    def __init__(self, host='rabbitmq', queue='model-queue', max_retries=10, retry_delay=3):
+        self.host = host
         self.queue = queue
-        max_retries = 10
-        for attempt in range(max_retries):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.connection = None
+        self.channel = None
+        self.connect()
+
+    def connect(self):
+        for attempt in range(self.max_retries):
             try:
-                self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=host))
+                self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host))
                 self.channel = self.connection.channel()
                 self.channel.queue_declare(queue=self.queue, durable=True)
+                self.channel.tx_select()
                 print("[INFO] Conexão com RabbitMQ estabelecida.")
                 return
             except pika.exceptions.AMQPConnectionError as e:
-                print(f"[WARN] Tentativa {attempt + 1}/{max_retries} falhou: RabbitMQ não está pronto. Aguardando 3s...")
-                time.sleep(3)
+                print(f"[WARN] Tentativa {attempt + 1}/{self.max_retries} falhou: RabbitMQ não está pronto. Aguardando {self.retry_delay}s...")
+                time.sleep(self.retry_delay)
         raise ConnectionError("[ERRO] Não foi possível conectar ao RabbitMQ após várias tentativas.")
 
-    def publish_message(self, message):
-        try:
-            self.channel.basic_publish(
-                exchange='',
-                routing_key=self.queue,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2  # persistente
-                )
+    def _ensure_channel(self):
+        if self.connection is None or self.connection.is_closed or self.channel is None or self.channel.is_closed:
+            print("[WARN] Conexão com RabbitMQ perdida, reconectando...")
+            self.close()
+            self.connect()
+
+    def _publish(self, body, content_type=None):
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=self.queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=content_type,
+                delivery_mode=2  # persistente
             )
-            print("[DEBUG] Publicando mensagem no RabbitMQ:", message)
-        except pika.exceptions.AMQPError as e:
-            print(f"[ERROR] Falha ao publicar mensagem: {e}")
+        )
+
+    def publish_message(self, message):
+        self.publish_batch([json.dumps(message)])
+
+    def publish_batch(self, bodies, content_type=None):
+        """Publica uma lista de corpos já serializados e confirma o lote com um único commit."""
+        if not bodies:
+            return
+        for attempt in range(self.max_retries):
+            try:
+                self._ensure_channel()
+                for body in bodies:
+                    self._publish(body, content_type)
+                self.channel.tx_commit()
+                return
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError, pika.exceptions.StreamLostError) as e:
+                print(f"[WARN] Falha ao publicar lote de {len(bodies)} mensagens ({e}), tentativa {attempt + 1}/{self.max_retries}")
+                self.channel = None
+                time.sleep(self.retry_delay)
+            except pika.exceptions.AMQPError as e:
+                print(f"[ERROR] Falha ao publicar lote de {len(bodies)} mensagens: {e}")
+                return
+        raise ConnectionError(f"[ERRO] Não foi possível publicar lote de {len(bodies)} mensagens.")
 
     def close(self):
-        self.connection.close()
+        if self.connection is not None and self.connection.is_open:
+            self.connection.close()
@@ -2,67 +2,136 @@ import csv
 import json
 from datetime import datetime, timezone
 import os
+import numpy as np
+import pandas as pd
 from producer.message_broker import MessageBroker
+from producer import wire_format
 
-def process_csv_file(filepath, broker):
+PUBLISH_BATCH_SIZE       = int(os.getenv("PUBLISH_BATCH_SIZE", 500))
+CSV_CHUNK_SIZE           = int(os.getenv("CSV_CHUNK_SIZE", 10000))
+MESSAGE_FORMAT           = os.getenv("MESSAGE_FORMAT", "json").lower()
+BINARY_FLOWS_PER_MESSAGE = int(os.getenv("BINARY_FLOWS_PER_MESSAGE", 256))
+
+def read_flow_chunks(filepath, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Lê o `*.pcap_Flow.csv` em blocos colunares.
+
+    Para cada bloco devolve um DataFrame com os metadados do fluxo
+    (IP/porta de origem, IP de destino e Flow ID) e a matriz float32 de
+    features, já sem as colunas excluídas. Como no parser linha a linha,
+    células vazias viram 0.0, "NaN" e "Infinity" são mantidos como float e
+    linhas com outros valores não numéricos nas features são descartadas.
+    """
     with open(filepath, 'r') as file:
-        reader = csv.reader(file)
-        header = next(reader)
-        
-        # Índices dinâmicos
-        IDX_FLOW_ID   = header.index("Flow ID")
-        IDX_IP_SRC    = header.index("Src IP")
-        IDX_PORT_SRC  = header.index("Src Port")
-        IDX_IP_DST    = header.index("Dst IP")
-        # IDX_PORT_DST  = header.index("Dst Port")
-        IDX_TIMESTAMP = header.index("Timestamp")
-        # IDX_PROTOCOL  = header.index("Protocol")
-        IDX_LABEL     = header.index("Label")
+        header = next(csv.reader(file))
+
+    # Índices dinâmicos
+    IDX_FLOW_ID   = header.index("Flow ID")
+    IDX_IP_SRC    = header.index("Src IP")
+    IDX_PORT_SRC  = header.index("Src Port")
+    IDX_IP_DST    = header.index("Dst IP")
+    # IDX_PORT_DST  = header.index("Dst Port")
+    IDX_TIMESTAMP = header.index("Timestamp")
+    # IDX_PROTOCOL  = header.index("Protocol")
+    IDX_LABEL     = header.index("Label")
 
-        # Colunas que não entram no vetor de features
-        excluded_indices = {
-            IDX_FLOW_ID,
-            IDX_IP_SRC,
-            IDX_PORT_SRC,
-            IDX_IP_DST,
-            # IDX_PORT_DST,
-            IDX_TIMESTAMP,
-            # IDX_PROTOCOL,
-            IDX_LABEL
-        }
-        
-        for row in reader:
-            try:
-                ip_src   = row[IDX_IP_SRC]
-                port_src = int(row[IDX_PORT_SRC]) if row[IDX_PORT_SRC] else 0
-                ip_dst   = row[IDX_IP_DST]
+    # Colunas que não entram no vetor de features
+    excluded_indices = {
+        IDX_FLOW_ID,
+        IDX_IP_SRC,
+        IDX_PORT_SRC,
+        IDX_IP_DST,
+        # IDX_PORT_DST,
+        IDX_TIMESTAMP,
+        # IDX_PROTOCOL,
+        IDX_LABEL
+    }
+    feature_indices = [idx for idx in range(len(header)) if idx not in excluded_indices]
 
-                features = []
-                for idx, val in enumerate(row):
-                    if idx in excluded_indices:
-                        continue
-                    col_name = header[idx]
-                    try:
-                        f = float(val) if val else 0.0
-                    except ValueError:
-                        print(f"[ERROR] coluna '{col_name}' idx {idx} → '{val}' não é float")
-                        raise
-                    features.append(f)
+    # Colunas nomeadas pela posição: o header do CICFlowMeter tem nomes repetidos
+    chunks = pd.read_csv(
+        filepath,
+        header=None,
+        skiprows=1,
+        names=range(len(header)),
+        dtype={IDX_FLOW_ID: str, IDX_IP_SRC: str, IDX_IP_DST: str, IDX_TIMESTAMP: str, IDX_LABEL: str},
+        chunksize=chunk_size,
+        # Só células vazias são NA; um "NaN" literal é um valor da feature, não um campo ausente
+        keep_default_na=False,
+        na_values=[''],
+        on_bad_lines='warn',
+        low_memory=False,
+    )
 
-                # Cria mensagem JSON
-                message = {
-                    "IP Src":   ip_src,
-                    "Port Src": port_src,
-                    "IP Dst":   ip_dst,
-                    "id":       row[IDX_FLOW_ID],
-                    "features": features
-                }
+    for chunk in chunks:
+        block = chunk[feature_indices]
+        empty = block.isna().to_numpy()
+        text_columns = [col for col in feature_indices if not pd.api.types.is_numeric_dtype(block[col])]
+        if text_columns:
+            # Só as colunas que o parser não reconheceu como numéricas precisam de conversão
+            raw = block[text_columns]
+            numeric = raw.apply(pd.to_numeric, errors='coerce')
+            # to_numeric também devolve NA para "NaN", que float() aceita
+            literal_nan = raw.apply(lambda col: col.str.strip().str.lower().isin(['nan', '+nan', '-nan']))
+            bad_cells = numeric.isna() & raw.notna() & ~literal_nan
+            invalid = bad_cells.any(axis=1)
+            for idx in bad_cells.columns[bad_cells.any(axis=0)]:
+                print(f"[ERROR] coluna '{header[idx]}' idx {idx} → '{raw[idx][bad_cells[idx]].iloc[0]}' não é float; {int(bad_cells[idx].sum())} linha(s) ignorada(s)")
+            block = block.copy()
+            block[text_columns] = numeric
+            block = block[~invalid]
+            chunk = chunk[~invalid]
+            empty = empty[~invalid.to_numpy()]
 
-                print(json.dumps(message))
-                broker.publish_message(message)
+        features = block.to_numpy(dtype=np.float32, na_value=np.nan)
+        features[empty] = 0.0
+        meta = pd.DataFrame({
+            "IP Src":   chunk[IDX_IP_SRC].fillna(''),
+            "Port Src": pd.to_numeric(chunk[IDX_PORT_SRC], errors='coerce').fillna(0).astype(int),
+            "IP Dst":   chunk[IDX_IP_DST].fillna(''),
+            "id":       chunk[IDX_FLOW_ID].fillna(''),
+        })
+        yield meta, features
 
-            except Exception as e:
-                print(f"[ERROR] Linha ignorada por erro: {e}")  
+def serialize_chunk(meta, features):
+    """Serializa um bloco inteiro em mensagens JSON, uma por fluxo."""
+    return [
+        json.dumps({
+            "IP Src":   ip_src,
+            "Port Src": port_src,
+            "IP Dst":   ip_dst,
+            "id":       flow_id,
+            "features": row,
+        })
+        for ip_src, port_src, ip_dst, flow_id, row in zip(
+            meta["IP Src"].tolist(),
+            meta["Port Src"].tolist(),
+            meta["IP Dst"].tolist(),
+            meta["id"].tolist(),
+            features.tolist(),
+        )
+    ]
+
+def serialize_chunk_binary(meta, features, flows_per_message=BINARY_FLOWS_PER_MESSAGE):
+    """Serializa um bloco no formato binário, com até `flows_per_message` fluxos por mensagem."""
+    return [
+        wire_format.encode_flows(meta.iloc[i:i + flows_per_message], features[i:i + flows_per_message])
+        for i in range(0, len(features), flows_per_message)
+    ]
+
+def process_csv_file(filepath, broker):
+    total = 0
+    for meta, features in read_flow_chunks(filepath):
+        if MESSAGE_FORMAT == "binary":
+            messages = serialize_chunk_binary(meta, features)
+            content_type = wire_format.CONTENT_TYPE
+        else:
+            messages = serialize_chunk(meta, features)
+            content_type = None
+        for i in range(0, len(messages), PUBLISH_BATCH_SIZE):
+            broker.publish_batch(messages[i:i + PUBLISH_BATCH_SIZE], content_type)
+        total += len(features)
+        print(f"[DEBUG] {total} fluxos publicados de {filepath}")
 
     # delete file after processing
     try:
@@ -0,0 +1,47 @@
+"""
+Formato binário de fluxos enviado ao Oráculo.
+
+Uma mensagem carrega vários fluxos. Layout (little-endian):
+
+    cabeçalho (16 bytes): magic b"MPCF", versão u16, n_flows u32, n_features u16, reservado u32
+    features:  n_flows * n_features float32, em ordem C (linha = fluxo)
+    metadados: por fluxo, porta de origem u16 e, prefixados pelo tamanho,
+               IP de origem (u8), IP de destino (u8) e Flow ID (u16) em UTF-8
+
+O bloco de features começa alinhado em 16 bytes, então o Oráculo o lê sem
+cópia com `np.frombuffer`. O tipo é anunciado no `content_type` da mensagem
+AMQP; mensagens sem ele continuam sendo tratadas como JSON.
+
+O decodificador correspondente está em Oraculo/app/application/flow_codec.py.
+"""
+import struct
+
+import numpy as np
+
+CONTENT_TYPE = "application/x-mpc-flows"
+MAGIC = b"MPCF"
+VERSION = 1
+HEADER = struct.Struct("<4sHIHI")
+
+
+def _pack_str(value, length_format):
+    data = str(value).encode("utf-8")
+    return struct.pack(length_format, len(data)) + data
+
+
+def encode_flows(meta, features):
+    """Codifica um bloco (metadados do `read_flow_chunks`, matriz float32) em uma única mensagem."""
+    features = np.ascontiguousarray(features, dtype="<f4")
+    n_flows, n_features = features.shape
+    parts = [HEADER.pack(MAGIC, VERSION, n_flows, n_features, 0), features.tobytes()]
+    for ip_src, port_src, ip_dst, flow_id in zip(
+        meta["IP Src"].tolist(),
+        meta["Port Src"].tolist(),
+        meta["IP Dst"].tolist(),
+        meta["id"].tolist(),
+    ):
+        parts.append(struct.pack("<H", port_src & 0xFFFF))
+        parts.append(_pack_str(ip_src, "<B"))
+        parts.append(_pack_str(ip_dst, "<B"))
+        parts.append(_pack_str(flow_id, "<H"))
+    return b"".join(parts)
@@ -1,41 +1,153 @@
 import logging
 import os
+import threading
+from contextlib import contextmanager
 from typing import Tuple
 import numpy
 import json
 import joblib
 from pathlib import Path
 from domain.entities.predictor import Predictor
+from domain.entities.loggers.tracing import TRACER
+from application import flow_codec
+
+class LoadedModel:
+    """A predictor and the scaler it was calibrated with, plus the batches currently using them."""
+    def __init__(self, predictor: Predictor, scaler, version: int):
+        self.predictor = predictor
+        self.scaler = scaler
+        self.version = version
+        self.in_flight = 0
+
 
 class ClassificationService:
 
     def __init__(self, predictor: Predictor):
         self.__gating_strategy = os.getenv("GATING_METHOD", 'soft')
-        self.predictor = predictor
-        preprocessor_path = Path("data/models/preprocessor/pipeline.pkl")
+
+        try: predictor.build()
+        except RuntimeError: pass    
+        # The scaler ships with the model set, so it is read from wherever the predictor was built from
+        scaler = self.load_scaler(predictor.model_dir)
+
+        # The active model is only replaced as a whole, under the lock, so a batch pinned to it
+        # (see `pinned_model`) keeps using the same predictor and scaler even across a hot swap.
+        self.__model_lock = threading.Lock()
+        self.__drained = threading.Condition(self.__model_lock)
+        self.__local = threading.local()
+        self.__model = LoadedModel(predictor, scaler, version=1)
+
+    @staticmethod
+    def load_scaler(base_path: str | Path = "data/models"):
+        preprocessor_path = Path(base_path) / "preprocessor" / "pipeline.pkl"
         if not preprocessor_path.exists():
             raise RuntimeError("Preprocessor not found. Please build the Predictor first.")
+        return joblib.load(preprocessor_path)
 
-        self.__scaler = joblib.load(preprocessor_path)
+    @property
+    def predictor(self) -> Predictor:
+        return self.__model.predictor
 
-        
-        try: self.predictor.build()
-        except RuntimeError: pass    
+    @property
+    def model_version(self) -> int:
+        return self.__model.version
+
+    @contextmanager
+    def pinned_model(self):
+        """Pin the active model to the current thread for the duration of a message or batch."""
+        pinned = getattr(self.__local, 'model', None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        with self.__model_lock:
+            model = self.__model
+            model.in_flight += 1
+        self.__local.model = model
+        try:
+            yield model
+        finally:
+            self.__local.model = None
+            with self.__model_lock:
+                model.in_flight -= 1
+                if model.in_flight == 0:
+                    self.__drained.notify_all()
+
+    def swap_model(self, predictor: Predictor, scaler) -> LoadedModel:
+        """Make `predictor`/`scaler` the active model for new batches and return the one it replaced."""
+        with self.__model_lock:
+            old = self.__model
+            self.__model = LoadedModel(predictor, scaler, version=old.version + 1)
+        return old
+
+    def wait_drained(self, model: LoadedModel, timeout: float | None = None) -> bool:
+        """Wait until no batch is using `model`; False if `timeout` seconds pass first."""
+        with self.__drained:
+            return self.__drained.wait_for(lambda: model.in_flight == 0, timeout)
 
     def pre_processing(self, message: dict) -> Tuple[str, numpy.ndarray]:
         try:
-            data = json.loads(message)
-            ip = data["IP Src"]
-            features = data["features"]
-            id = data.get('id')
-            X = numpy.array([features], dtype=float)
-            return ip, id, self.__scaler.transform(X)
+            with TRACER.span("decode", 1):
+                data = json.loads(message)
+                ip = data["IP Src"]
+                features = data["features"]
+                id = data.get('id')
+                X = numpy.array([features], dtype=float)
+            with self.pinned_model() as model, TRACER.span("scale", 1):
+                return ip, id, model.scaler.transform(X)
         except Exception as e:
             logging.error(f"Classification Service could not pre-process message: {message}, with error:")
             logging.error(e)
             raise e
 
+    def pre_processing_batch(self, messages: list[Tuple[str|None, bytes]]) -> Tuple[list[str], list[str|None], numpy.ndarray]:
+        """Decode a batch of `(content_type, body)` messages and scale all their flows as a single matrix.
+
+        Binary flow batches (see `flow_codec`) are decoded zero-copy; any other content type is parsed as JSON.
+        Malformed messages are logged and dropped so they don't poison the rest of the batch.
+        """
+        with TRACER.span("decode", len(messages)):
+            ips, ids, blocks = self.__decode_batch(messages)
+        if not blocks:
+            return ips, ids, numpy.empty((0, 0))
+
+        # Blocks are appended in message order, matching the order of ips/ids
+        X = blocks[0] if len(blocks) == 1 else numpy.concatenate(blocks)
+        with self.pinned_model() as model, TRACER.span("scale", len(X)):
+            return ips, ids, model.scaler.transform(X)
+
+    @staticmethod
+    def __decode_batch(messages: list[Tuple[str|None, bytes]]) -> Tuple[list[str], list[str|None], list[numpy.ndarray]]:
+        ips, ids, blocks = [], [], []
+        json_features = []
+        for content_type, body in messages:
+            try:
+                if flow_codec.is_flow_batch(content_type):
+                    batch = flow_codec.decode_flow_batch(body)
+                    if json_features:
+                        blocks.append(numpy.array(json_features, dtype=float))
+                        json_features = []
+                    ips.extend(batch.ips_src)
+                    ids.extend(batch.ids)
+                    blocks.append(batch.features)
+                    continue
+                data = json.loads(body)
+                ip, flow_features = data["IP Src"], data["features"]
+            except Exception as e:
+                logging.error(f"Classification Service could not pre-process message: {body[:200]!r}, with error:")
+                logging.error(e)
+                continue
+            ips.append(ip)
+            ids.append(data.get('id'))
+            json_features.append(flow_features)
+
+        if json_features:
+            blocks.append(numpy.array(json_features, dtype=float))
+        return ips, ids, blocks
+
     def classification(self, input_data: numpy.ndarray, id: str|None=None) -> list[Tuple[str, float]]:
-        return self.predictor.predict(input_data, id=id, strategy=self.__gating_strategy)
+        # Classify the whole matrix in one MoE pass instead of the predictor's default chunks of 32
+        with self.pinned_model() as model, TRACER.span("classify", len(input_data)):
+            return model.predictor.predict(input_data, id=id, strategy=self.__gating_strategy, batch_size=max(len(input_data), 1))
 
     
\ No newline at end of file
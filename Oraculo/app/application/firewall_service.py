@@ -1,25 +1,160 @@
+import copy
 import json
 import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
 
+from domain.entities.loggers.metrics import Timer
+from domain.entities.loggers.registry import REGISTRY, RegistryLogger
 from interfaces.rest_client import RESTClient
 
+RULE_TEMPLATE_PATH = Path(__file__).resolve().parents[1] / 'data' / 'rules' / 'block.json'
+PFSENSE_API_LATENCY = REGISTRY.histogram("pfsense_api_latency_seconds", "Latency of pfSense rule requests.")
+
 class FirewallService:
+    """
+    Blocks source IPs on pfSense without stalling the caller.
+
+    `block_source_ip` only enqueues the IP. A background worker takes the IPs in batches (up to
+    `batch_size`, waiting at most `linger_ms` for a batch to fill) and posts one rule per IP from the
+    cached template, asking pfSense to apply the filter only with the last rule of the batch, so a
+    burst costs one filter reload. IPs that are queued or were blocked less than `block_ttl` seconds
+    ago are skipped. An IP only counts as blocked once its batch was applied: the applying rule is
+    retried once, and if it still fails the whole batch is forgotten so later verdicts retry it.
+    """
 
-    def __init__(self, pfsense_client: RESTClient):
+    def __init__(self, pfsense_client: RESTClient, rule_path: str | Path = RULE_TEMPLATE_PATH, block_ttl=None,
+                 batch_size=None, linger_ms=None, queue_size=10000):
         self.__pfsense_client = pfsense_client
+        self.__rule_template = self.__load_rule_template(rule_path)
+        self.__block_ttl = block_ttl if block_ttl is not None else float(os.getenv("FIREWALL_BLOCK_TTL_SECONDS", 3600))
+        self.__batch_size = batch_size or int(os.getenv("FIREWALL_BATCH_SIZE", 32))
+        self.__linger = (linger_ms if linger_ms is not None else int(os.getenv("FIREWALL_BATCH_LINGER_MS", 200))) / 1000
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__lock = threading.Lock()
+        self.__blocked: dict[str, float] = {}  # ip -> until when it is considered blocked
+        self.__pending: set[str] = set()
+        self.__worker = None
+        self.__logger = RegistryLogger(job="firewall")
+        REGISTRY.gauge("firewall_pending_blocks", "Source IPs queued for blocking.").set_function(lambda: len(self.__pending))
+        self.blocked = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.dropped = 0
 
-    def __create_blocking_rule(self, ip):
+    @staticmethod
+    def __load_rule_template(rule_path):
         try:
-            with open('app/data/rules/block.json') as f:
-                rule = json.load(f)
-                rule['src'] = ip
-
-            return rule 
-
+            with open(rule_path) as f:
+                return json.load(f)
         except Exception as e:
             logging.error(f'Error accessing rule file: {e}')
 
+    def __create_blocking_rule(self, ip, apply=True):
+        rule = copy.deepcopy(self.__rule_template)
+        rule['src'] = ip
+        rule['apply'] = apply
+        return rule
+
     def block_source_ip(self, ip):
-        logging.info(f'Creating blocking rule for source IP: {ip}')
-        rule = self.__create_blocking_rule(ip)
-        self.__pfsense_client.post(data=rule)
+        now = time.monotonic()
+        with self.__lock:
+            if ip in self.__pending or self.__blocked.get(ip, 0) > now:
+                self.deduplicated += 1
+                return
+            self.__pending.add(ip)
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, name="firewall-blocker", daemon=True)
+                self.__worker.start()
+        try:
+            self.__queue.put_nowait(ip)
+            logging.info(f'Queued blocking rule for source IP: {ip}')
+        except queue.Full:
+            with self.__lock:
+                self.__pending.discard(ip)
+            self.dropped += 1
+            logging.warning(f'Firewall queue is full, not blocking {ip} this time')
+
+    def flush(self, timeout: float = 30.0):
+        """Wait until every queued IP has been sent to pfSense."""
+        deadline = time.monotonic() + timeout
+        while self.__worker is not None and self.__queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def __post_rule(self, ip, apply, latencies) -> bool:
+        with Timer() as timer:
+            response = self.__pfsense_client.post(data=self.__create_blocking_rule(ip, apply=apply))
+        latencies.append(timer.elapsed_time)
+        PFSENSE_API_LATENCY.observe(timer.elapsed_time / 1e9)
+        return response is not None and response.ok
+
+    @property
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    def __run(self):
+        while True:
+            batch = [self.__queue.get()]
+            deadline = time.monotonic() + self.__linger
+            while len(batch) < self.__batch_size:
+                try:
+                    batch.append(self.__queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.__block_batch(batch)
+            except Exception as e:
+                logging.error(f'Error blocking {len(batch)} source IPs: {e}')
+                with self.__lock:
+                    self.__pending.difference_update(batch)
+            finally:
+                for _ in batch:
+                    self.__queue.task_done()
+
+    def __block_batch(self, batch):
+        latencies = []
+        with Timer() as batch_timer:
+            staged = []
+            for i, ip in enumerate(batch):
+                logging.info(f'Creating blocking rule for source IP: {ip}')
+                last = i == len(batch) - 1
+                # The apply rides on the last rule; retry it once, since the rules staged before it depend on it
+                for _ in range(2 if last else 1):
+                    ok = self.__post_rule(ip, apply=last, latencies=latencies)
+                    if ok or not last:
+                        break
+                if ok:
+                    staged.append(ip)
+                elif not last:
+                    self.failed += 1
+            applied = ok
+
+            now = time.monotonic()
+            with self.__lock:
+                self.__pending.difference_update(batch)
+                # Staged rules only take effect once applied; otherwise forget them so later verdicts retry
+                if applied:
+                    for ip in staged:
+                        self.__blocked[ip] = now + self.__block_ttl
+                for ip in [ip for ip, until in self.__blocked.items() if until <= now]:
+                    del self.__blocked[ip]
+            if applied:
+                self.blocked += len(staged)
+            else:
+                self.failed += len(staged) + 1
+                logging.error(f'Applying the firewall rules failed, {len(batch)} source IPs are not blocked yet')
+
+        self.__logger.log(latency=batch_timer.elapsed_time, variant="block_batch", metrics={
+            'batch_size': len(batch),
+            'pending_blocks': self.__queue.qsize(),
+            'api_latency_seconds': sum(latencies) / len(latencies) / 1e9,
+            'api_latency_max_seconds': max(latencies) / 1e9,
+            'blocked_total': self.blocked,
+            'deduplicated_total': self.deduplicated,
+            'failed_total': self.failed,
+            'dropped_total': self.dropped,
+            'blocked_ips': len(self.__blocked),
+        })
@@ -0,0 +1,84 @@
+"""
+Binary flow-batch wire format shared with the CICFlowMeter producer.
+
+One message carries many flows. Layout (little-endian):
+
+    header (16 bytes): magic b"MPCF", version u16, n_flows u32, n_features u16, reserved u32
+    features:          n_flows * n_features float32, C order (one row per flow)
+    metadata:          per flow, source port u16 then length-prefixed UTF-8
+                       source IP (u8), destination IP (u8) and flow id (u16)
+
+The feature block starts 16-byte aligned right after the header, so it is
+decoded without copying through `numpy.frombuffer`. Messages advertise the
+format through their AMQP `content_type`; anything else is treated as JSON.
+
+The producer-side encoder lives in CICFlowMeter/producer/wire_format.py.
+"""
+import struct
+from typing import NamedTuple
+
+import numpy
+
+CONTENT_TYPE = "application/x-mpc-flows"
+MAGIC = b"MPCF"
+VERSION = 1
+HEADER = struct.Struct("<4sHIHI")
+_PORT = struct.Struct("<H")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+
+
+class FlowBatch(NamedTuple):
+    ips_src: list[str]
+    ips_dst: list[str]
+    ports_src: list[int]
+    ids: list[str]
+    features: numpy.ndarray
+
+
+def is_flow_batch(content_type: str | None) -> bool:
+    return content_type == CONTENT_TYPE
+
+
+def encode_flow_batch(ips_src, ips_dst, ports_src, ids, features: numpy.ndarray) -> bytes:
+    features = numpy.ascontiguousarray(features, dtype="<f4")
+    n_flows, n_features = features.shape
+    parts = [HEADER.pack(MAGIC, VERSION, n_flows, n_features, 0), features.tobytes()]
+    for ip_src, ip_dst, port_src, id in zip(ips_src, ips_dst, ports_src, ids):
+        parts.append(_PORT.pack(int(port_src) & 0xFFFF))
+        for value, length in ((ip_src, _U8), (ip_dst, _U8), (id, _U16)):
+            data = str(value).encode("utf-8")
+            parts.append(length.pack(len(data)))
+            parts.append(data)
+    return b"".join(parts)
+
+
+def decode_flow_batch(body: bytes) -> FlowBatch:
+    """Decode a binary flow batch. The returned feature matrix is a read-only view over `body`."""
+    magic, version, n_flows, n_features, _ = HEADER.unpack_from(body, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Not a flow batch message (magic {magic!r})")
+    if version != VERSION:
+        raise ValueError(f"Unsupported flow batch version: {version}")
+
+    offset = HEADER.size
+    features = numpy.frombuffer(body, dtype="<f4", count=n_flows * n_features, offset=offset).reshape(n_flows, n_features)
+    offset += features.nbytes
+
+    view = memoryview(body)
+    ips_src, ips_dst, ports_src, ids = [], [], [], []
+    for _ in range(n_flows):
+        (port_src,) = _PORT.unpack_from(body, offset)
+        offset += _PORT.size
+        fields = []
+        for length in (_U8, _U8, _U16):
+            (size,) = length.unpack_from(body, offset)
+            offset += length.size
+            fields.append(str(view[offset:offset + size], "utf-8"))
+            offset += size
+        ports_src.append(port_src)
+        ips_src.append(fields[0])
+        ips_dst.append(fields[1])
+        ids.append(fields[2])
+
+    return FlowBatch(ips_src, ips_dst, ports_src, ids, features)
@@ -1,8 +1,13 @@
 import logging
+import os
+import threading
+from concurrent.futures import Future
 from typing import Any
+from application import flow_codec
 from application.classification_service import ClassificationService
 from application.firewall_service import FirewallService
 from application.package_service import PackageService
+from domain.entities.loggers.tracing import TRACER
 from interfaces.messenger import Messenger
 
 class MessengerService:
@@ -12,21 +17,100 @@ class MessengerService:
         self.__classification_service = classification_service
         self.__firewall_service = firewall_service
         self.__package_service = package_service
+        self.__batch_size = int(os.getenv("BATCH_SIZE", 1))
+        self.__batch_linger_ms = int(os.getenv("BATCH_LINGER_MS", 50))
+        self.__firewall_blocking = os.getenv("FIREWALL_BLOCKING", "false").lower() == "true"
+
+    # The handlers return a Future when the packages they created are still being persisted; in manual-ack
+    # mode the broker only acks the messages once it resolves (None: ack right away)
+    def __handle_message(self, ch, method, properties, body: bytes) -> Future | None:
+        # Pre-processing and classification of a message use the same model, even across a hot swap
+        with TRACER.trace("message", 1), self.__classification_service.pinned_model():
+            return self.__process_message(properties, body)
+
+    def __process_message(self, properties, body: bytes) -> Future | None:
+        if flow_codec.is_flow_batch(properties.content_type):
+            # A binary message already carries a whole batch of flows
+            return self.__process_batch([(properties, body)])
 
-    def __handle_message(self, ch, method, properties, body: bytes):
         try:
-    
             message: dict[str, Any] = body.decode('utf-8')
             ip, id, input_data = self.__classification_service.pre_processing(message)
-            prediction = self.__classification_service.classification(input_data, id)
-            max_score_label = prediction[0][0]
-            max_score_confidence = prediction[0][1]
-            if(max_score_label != "Benign"): 
-                # self.__firewall_service.block_source_ip(ip)
-                self.__package_service.create_package(ip, id, max_score_label, max_score_confidence)
-
         except Exception as e:
-            logging.error(f"Error processing message: {str(e)}")
+            # Malformed payloads are dropped; retrying them can't succeed
+            logging.error(f"Discarding message that could not be pre-processed: {str(e)}")
+            return None
+
+        # Classification and persistence errors propagate so the broker can nack and requeue
+        prediction = self.__classification_service.classification(input_data, id)
+        max_score_label = prediction[0][0]
+        max_score_confidence = prediction[0][1]
+        if(max_score_label != "Benign"): 
+            with TRACER.span("persist", 1):
+                if self.__firewall_blocking:
+                    self.__firewall_service.block_source_ip(ip)
+                return self.__package_service.create_package(ip, id, max_score_label, max_score_confidence)
+        return None
+
+    def __handle_batch(self, messages: list[tuple[Any, bytes]]) -> Future | None:
+        with TRACER.trace("batch", len(messages)), self.__classification_service.pinned_model():
+            return self.__process_batch(messages)
+
+    def __process_batch(self, messages: list[tuple[Any, bytes]]) -> Future | None:
+        payloads = [(properties.content_type, body) for properties, body in messages]
+        ips, ids, input_data = self.__classification_service.pre_processing_batch(payloads)
+        if not ips:
+            return None
+
+        predictions = self.__classification_service.classification(input_data)
+        persisted = []
+        with TRACER.span("persist", len(ips)):
+            for ip, id, (label, confidence) in zip(ips, ids, predictions):
+                if(label != "Benign"):
+                    if self.__firewall_blocking:
+                        self.__firewall_service.block_source_ip(ip)
+                    persisted.append(self.__package_service.create_package(ip, id, label, confidence))
+        return _all_persisted(persisted)
+
+    def stop(self):
+        """Stop consuming after the message or batch in progress."""
+        self.__messenger.stop_consuming()
 
     def consume_message(self, queue_name):
-        self.__messenger.receive_message(queue_name, self.__handle_message)
+        try:
+            if self.__batch_size > 1:
+                self.__messenger.receive_batch(queue_name, self.__handle_batch, self.__batch_size, self.__batch_linger_ms)
+            else:
+                self.__messenger.receive_message(queue_name, self.__handle_message)
+        finally:
+            # Don't lose the verdicts still being aggregated, or the blocks still queued, when consumption stops
+            self.__package_service.flush()
+            self.__firewall_service.flush()
+
+
+def _all_persisted(results: list[Future | None]) -> Future | None:
+    """One Future resolved once every Future in `results` is, failing with the first error; None if none is pending."""
+    pending = [result for result in results if result is not None and not (result.done() and result.exception() is None)]
+    if not pending:
+        return None
+    if len(pending) == 1:
+        return pending[0]
+
+    combined = Future()
+    remaining = [len(pending)]
+    lock = threading.Lock()
+
+    def on_done(result: Future):
+        with lock:
+            if combined.done():
+                return
+            if result.exception() is not None:
+                combined.set_exception(result.exception())
+                return
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                combined.set_result(None)
+
+    for result in pending:
+        result.add_done_callback(on_done)
+    return combined
@@ -0,0 +1,84 @@
+import gc
+import logging
+import os
+import threading
+from application.classification_service import ClassificationService
+from domain.entities.loggers.metrics import Timer
+from domain.entities.loggers.registry import RegistryLogger
+from domain.entities.predictor import MLFlowModelConfig, PathModelConfig, Predictor
+
+class ModelReloadService:
+    """
+    Hot-swaps the model set served by a ClassificationService without stopping consumption.
+
+    The new Predictor is built and calibrated on a background thread while the current one keeps
+    serving. It is then swapped in atomically; batches already running finish on the old model,
+    which is released once they drain (or after MODEL_DRAIN_TIMEOUT_SECONDS).
+    """
+
+    def __init__(self, classification_service: ClassificationService):
+        self.__classification_service = classification_service
+        self.__drain_timeout = float(os.getenv("MODEL_DRAIN_TIMEOUT_SECONDS", 60))
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+        self.__logger = RegistryLogger(job="model_reload")
+        self.status = {
+            "state": "idle",
+            "version": classification_service.model_version,
+            "source": None,
+            "last_error": None,
+            "metrics": {},
+        }
+
+    def request_reload(self, config: PathModelConfig | MLFlowModelConfig) -> bool:
+        """Start building `config` in the background. False if a reload is already running."""
+        with self.__lock:
+            if self.__thread is not None and self.__thread.is_alive():
+                return False
+            self.status.update(state="building", source=self.describe(config), last_error=None)
+            self.__thread = threading.Thread(target=self.__reload, args=(config,), name="model-reload", daemon=True)
+            self.__thread.start()
+            return True
+
+    @staticmethod
+    def describe(config: PathModelConfig | MLFlowModelConfig) -> str:
+        if isinstance(config, PathModelConfig):
+            return config.base_path
+        selector = f"v{config.version}" if config.version else f"@{config.alias}" if config.alias else config.stage
+        return f"mlflow:{config.model_name} {selector}"
+
+    def __reload(self, config: PathModelConfig | MLFlowModelConfig):
+        source = self.describe(config)
+        try:
+            with Timer() as build_timer:
+                predictor = Predictor(config).build()
+                scaler = ClassificationService.load_scaler(predictor.model_dir)
+
+            # The swap only holds the model lock for an assignment; this is the longest a consumer can wait on it
+            with Timer() as swap_timer:
+                old = self.__classification_service.swap_model(predictor, scaler)
+            del predictor, scaler
+            self.status.update(state="draining", version=self.__classification_service.model_version)
+            logging.info(f"Swapped in model version {self.status['version']} from {source}, draining version {old.version}")
+
+            with Timer() as drain_timer:
+                drained = self.__classification_service.wait_drained(old, self.__drain_timeout)
+            if not drained:
+                logging.warning(f"Model version {old.version} still in use after {self.__drain_timeout}s, releasing it anyway")
+            del old
+            gc.collect()
+
+            metrics = {
+                "model_build_seconds": build_timer.elapsed_time / 1e9,
+                # From the reload request until new batches are served by the new model
+                "model_swap_latency_seconds": (build_timer.elapsed_time + swap_timer.elapsed_time) / 1e9,
+                "consumer_pause_seconds": swap_timer.elapsed_time / 1e9,
+                "model_drain_seconds": drain_timer.elapsed_time / 1e9,
+                "model_drained": float(drained),
+                "model_version": float(self.status["version"]),
+            }
+            self.status.update(state="idle", metrics=metrics)
+            self.__logger.log(latency=build_timer.elapsed_time + swap_timer.elapsed_time, variant="hot_swap", metrics=metrics)
+        except Exception as e:
+            logging.error(f"Model reload from {source} failed, keeping model version {self.status['version']}: {e}")
+            self.status.update(state="failed", last_error=str(e))
@@ -1,15 +1,45 @@
+import os
+from concurrent.futures import Future
 from datetime import datetime
+from domain.entities.verdict_aggregator import VerdictAggregator, VerdictWindow
 from interfaces.repositories.package_repository import PackageRepository
 
 class PackageService:
-    
-    def __init__(self, repository: PackageRepository):
+
+    def __init__(self, repository: PackageRepository, window_seconds: float | None = None, durable: bool = False):
         self.__db = repository
+        # With `durable`, creating a package returns a Future of its persistence (see PackageRepository.create)
+        self.__durable = durable
+        if window_seconds is None:
+            window_seconds = float(os.getenv("VERDICT_WINDOW_SECONDS", 0))
+        # With a window, repeated verdicts for one (ip, attack_type) become their first package plus one summary per window
+        self.__aggregator = VerdictAggregator(window_seconds, self.__create_window_package) if window_seconds > 0 else None
+
+    def get_packages(self, ip: str | None = None, attack_type: str | None = None, since: datetime | None = None,
+                     until: datetime | None = None, limit: int = 100, cursor: int | None = None):
+        """Newest matching packages first, with the cursor of the next page (None on the last one)."""
+        return self.__db.query(ip, attack_type, self.__timestamp(since), self.__timestamp(until), limit, cursor)
+
+    @staticmethod
+    def __timestamp(value: datetime | None) -> str | None:
+        # Packages carry naive local ISO timestamps, so bounds are compared in that same form
+        if value is None:
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value.isoformat()
 
-    def get_packages(self):
-        return self.__db.get_all()
-    
-    def create_package(self, ip: str, id: str, attack_type: str, confidence: float=0): # remove default arg later
+    def create_package(self, ip: str, id: str, attack_type: str, confidence: float=0) -> Future | None: # remove default arg later
+        """
+        Store the verdict. With `durable`, returns a Future resolved once its package is persisted, or None
+        if it already is. A verdict rolled up into an open window returns the Future of the window's opening
+        package: the alert is then on disk, while its count only reaches the window summary.
+        """
+        if self.__aggregator is not None:
+            return self.__aggregator.add(ip, id, attack_type, confidence)
+        return self.__create(ip, id, attack_type, confidence)
+
+    def __create(self, ip: str, id: str, attack_type: str, confidence: float) -> Future | None:
         package = {
             "ids": "oraculo",
             "ip": ip,
@@ -18,4 +48,30 @@ class PackageService:
             "confidence": confidence, # float
             "timestamp": datetime.now().isoformat(),
         }
-        self.__db.create(package)
\ No newline at end of file
+        return self.__db.create(package, durable=self.__durable)
+
+    def flush(self):
+        """
+        Stop the verdict aggregator's thread, write out the packages of every open window and wait for
+        the repository to persist them. Later verdicts start a new aggregation thread.
+        """
+        if self.__aggregator is not None:
+            self.__aggregator.stop()
+        self.__db.flush()
+
+    def __create_window_package(self, window: VerdictWindow):
+        if window.count == 1:
+            # The opening verdict of a window is stored like any other verdict
+            return self.__create(window.ip, window.first_id, window.attack_type, window.max_confidence)
+        package = {
+            "ids": "oraculo",
+            "ip": window.ip,
+            "id": window.first_id,
+            "attack_type": window.attack_type,
+            "confidence": window.max_confidence,
+            "count": window.count,
+            "first_seen": datetime.fromtimestamp(window.first_seen).isoformat(),
+            "last_seen": datetime.fromtimestamp(window.last_seen).isoformat(),
+            "timestamp": datetime.now().isoformat(),
+        }
+        self.__db.create(package)
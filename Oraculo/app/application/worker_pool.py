@@ -0,0 +1,289 @@
+import gc
+import logging
+import os
+import select
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from application.model_reload_service import ModelReloadService
+from domain.entities.loggers.metrics import Timer
+from domain.entities.loggers.registry import MetricsPusher, RegistryLogger
+from domain.entities.predictor import MLFlowModelConfig, PathModelConfig, Predictor
+
+
+@dataclass
+class _Worker:
+    pid: int
+    generation: int
+    # Read end of the readiness pipe. Only `__mark_exited` closes it, under the pool lock and after
+    # setting `exited`, so readers holding the lock may use it while `exited` is not set
+    ready_fd: int
+    started: float
+    exited: threading.Event = field(default_factory=threading.Event)
+    retiring: bool = False
+    # Replacements started by a reload are not restarted by the supervisor until their model is ready
+    probation: bool = False
+
+
+class WorkerPool:
+    """
+    Runs `n_workers` consumer processes on the same queue from one supervisor process.
+
+    With `share_models` (the TFLite backend) the supervisor builds the Predictor once and forks the
+    workers from it: the model buffers, calibrator and scaler are inherited copy-on-write, so each extra
+    worker only adds its interpreter arenas to the RSS. TensorFlow is not fork-safe once its runtime
+    has run an op, so with the Keras backend the supervisor never builds a model and every worker
+    builds its own Predictor after the fork (reading the persisted calibrator instead of refitting).
+    That multiplies the memory of the model set by `n_workers`, so the service (main.py) only runs the
+    pool with shared models.
+
+    Workers that die are restarted. Reloads roll through the workers one at a time, so the queue
+    always has consumers; a worker is only retired once its replacement has its model ready.
+    Worker processes stop with SIGTERM after finishing the message or batch in progress.
+    """
+
+    def __init__(self, n_workers: int, config: PathModelConfig | MLFlowModelConfig, run_worker: Callable[[Predictor], None],
+                 share_models: bool, drain_timeout: float | None = None, ready_timeout: float = 600):
+        self.n_workers = n_workers
+        self.share_models = share_models
+        self.__config = config
+        self.__run_worker = run_worker
+        self.__drain_timeout = drain_timeout if drain_timeout is not None else float(os.getenv("MODEL_DRAIN_TIMEOUT_SECONDS", 60))
+        self.__ready_timeout = ready_timeout
+        self.__predictor: Predictor | None = None
+        self.__generation = 0
+        self.__workers: dict[int, _Worker] = {}
+        self.__lock = threading.Lock()
+        self.__reload_thread: threading.Thread | None = None
+        self.__stopping = False
+        self.__logger = RegistryLogger(job="worker_pool")
+        self.restarts = 0
+        self.status = {
+            "state": "idle",
+            "version": 0,
+            "source": ModelReloadService.describe(config),
+            "last_error": None,
+            "workers": [],
+            "metrics": {},
+        }
+
+    def start(self):
+        """Load the shared model (if any) and fork the workers."""
+        if self.share_models:
+            self.__predictor = self.__build_shared(self.__config)
+        self.__generation = 1
+        for _ in range(self.n_workers):
+            self.__spawn()
+        self.__update_status(version=self.__generation)
+
+    def supervise(self):
+        """Reap workers on the calling (main) thread, restarting the ones that die, until `stop()`."""
+        while not self.__stopping:
+            try:
+                pid, wait_status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                # No children right now, e.g. while a reload is replacing the last worker
+                time.sleep(0.5)
+                continue
+
+            with self.__lock:
+                worker = self.__workers.get(pid)
+            if worker is None or not self.__mark_exited(worker):
+                continue
+            if worker.retiring or worker.probation or self.__stopping:
+                continue
+
+            exit_code = os.waitstatus_to_exitcode(wait_status)
+            self.restarts += 1
+            logging.error(f"Worker {pid} exited with code {exit_code}, restarting it")
+            if time.monotonic() - worker.started < 10:
+                # Don't fork in a tight loop when workers can't even start (broker down, broken model set)
+                time.sleep(min(30, 2 ** min(self.restarts, 5)))
+            if not self.__stopping:
+                self.__spawn()
+            self.__update_status()
+
+    def stop(self, timeout: float = 30):
+        """SIGTERM every worker, wait up to `timeout` seconds for them to drain, then SIGKILL the rest."""
+        self.__stopping = True
+        with self.__lock:
+            workers = list(self.__workers.values())
+        for worker in workers:
+            self.__signal(worker.pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            while not self.__reap(worker) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            if not self.__reap(worker):
+                logging.warning(f"Worker {worker.pid} did not stop within {timeout}s, killing it")
+                self.__signal(worker.pid, signal.SIGKILL)
+                self.__reap(worker, block=True)
+
+    def request_reload(self, config: PathModelConfig | MLFlowModelConfig) -> bool:
+        """Roll the workers onto `config` in the background. False if a reload is already running."""
+        with self.__lock:
+            if self.__reload_thread is not None and self.__reload_thread.is_alive():
+                return False
+            self.status.update(state="building", source=ModelReloadService.describe(config), last_error=None)
+            self.__reload_thread = threading.Thread(target=self.__reload, args=(config,), name="worker-reload", daemon=True)
+            self.__reload_thread.start()
+            return True
+
+    def __reload(self, config: PathModelConfig | MLFlowModelConfig):
+        source = ModelReloadService.describe(config)
+        previous = (self.__config, self.__predictor, self.__generation)
+        try:
+            with Timer() as build_timer:
+                if self.share_models:
+                    self.__predictor = self.__build_shared(config)
+            self.__config = config
+            self.__generation += 1
+            self.status.update(state="rolling")
+
+            with self.__lock:
+                old_workers = [w for w in self.__workers.values() if w.generation < self.__generation]
+            with Timer() as roll_timer:
+                for old in old_workers:
+                    if old.exited.is_set():
+                        # It crashed meanwhile and the supervisor already replaced it on the new model
+                        continue
+                    new = self.__spawn(probation=True)
+                    if not self.__wait_ready(new):
+                        raise RuntimeError(f"Worker {new.pid} exited or timed out ({self.__ready_timeout}s) before its model was ready")
+                    new.probation = False
+                    old.retiring = True
+                    self.__signal(old.pid, signal.SIGTERM)
+                    if not old.exited.wait(self.__drain_timeout):
+                        logging.warning(f"Worker {old.pid} still draining after {self.__drain_timeout}s, killing it")
+                        self.__signal(old.pid, signal.SIGKILL)
+                    self.__update_status()
+
+            # The old model set is only referenced by the retired workers, which are gone now
+            previous = None
+            gc.unfreeze()
+            gc.collect()
+            gc.freeze()
+
+            metrics = {
+                "model_build_seconds": build_timer.elapsed_time / 1e9,
+                "worker_roll_seconds": roll_timer.elapsed_time / 1e9,
+                "model_version": float(self.__generation),
+                "workers": float(self.n_workers),
+            }
+            self.__update_status(state="idle", version=self.__generation, metrics=metrics)
+            self.__logger.log(latency=build_timer.elapsed_time + roll_timer.elapsed_time, variant="rolling_reload", metrics=metrics)
+            logging.info(f"Rolled {self.n_workers} workers onto model version {self.__generation} from {source}")
+        except Exception as e:
+            logging.error(f"Worker reload from {source} failed: {e}")
+            if previous is not None:
+                # Roll back so replacements for crashed workers keep using the model set that works
+                self.__config, self.__predictor, generation = previous
+                with self.__lock:
+                    new_workers = [w for w in self.__workers.values() if w.generation > generation]
+                for worker in new_workers:
+                    worker.retiring = True
+                    self.__signal(worker.pid, signal.SIGTERM)
+                self.__generation = generation
+                # Old workers that were already retired are replaced on the restored model set
+                for _ in range(self.n_workers - len(self.__workers) + len(new_workers)):
+                    self.__spawn()
+            self.__update_status(state="failed", last_error=str(e))
+
+    def __build_shared(self, config: PathModelConfig | MLFlowModelConfig) -> Predictor:
+        predictor = Predictor(config).build()
+        if predictor.backend != "tflite":
+            raise RuntimeError("Sharing models across workers needs the TFLite backend, but the export is missing "
+                               "or stale; run export_models.py on the model set")
+        # Keep the cyclic GC from touching (and so un-sharing) the pages of everything loaded so far
+        gc.freeze()
+        return predictor
+
+    def __spawn(self, probation: bool = False) -> _Worker:
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            self.__worker_main(ready_w)
+
+        os.close(ready_w)
+        worker = _Worker(pid=pid, generation=self.__generation, ready_fd=ready_r, started=time.monotonic(), probation=probation)
+        with self.__lock:
+            self.__workers[pid] = worker
+        logging.info(f"Started worker {pid} (model version {worker.generation})")
+        return worker
+
+    def __worker_main(self, ready_w: int):
+        exit_code = 0
+        try:
+            # Ctrl+C reaches the whole process group; the supervisor stops workers with SIGTERM instead
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            predictor = self.__predictor or Predictor(self.__config).build()
+            os.write(ready_w, b"1")
+            os.close(ready_w)
+            self.__run_worker(predictor)
+        except BaseException as e:
+            logging.error(f"Worker {os.getpid()} failed: {e}")
+            exit_code = 1
+        finally:
+            # Never fall back into the supervisor's stack
+            os._exit(exit_code)
+
+    def __wait_ready(self, worker: _Worker) -> bool:
+        """Whether `worker` reported its model ready within the timeout; False once it has exited."""
+        deadline = time.monotonic() + self.__ready_timeout
+        while True:
+            # The supervisor may reap the worker meanwhile; the lock keeps its fd open while polled
+            with self.__lock:
+                if worker.exited.is_set():
+                    return False
+                readable, _, _ = select.select([worker.ready_fd], [], [], 0)
+                if readable:
+                    # A worker that died before writing leaves the pipe at EOF
+                    return os.read(worker.ready_fd, 1) == b"1"
+            if time.monotonic() >= deadline or worker.exited.wait(0.1):
+                return False
+
+    def __reap(self, worker: _Worker, block: bool = False) -> bool:
+        if worker.exited.is_set():
+            return True
+        try:
+            pid, _ = os.waitpid(worker.pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            pid = worker.pid
+        if pid == 0:
+            return False
+        self.__mark_exited(worker)
+        return True
+
+    def __mark_exited(self, worker: _Worker) -> bool:
+        """Record that `worker` was reaped. False if another thread already did."""
+        with self.__lock:
+            if worker.exited.is_set():
+                return False
+            self.__workers.pop(worker.pid, None)
+            os.close(worker.ready_fd)
+            worker.exited.set()
+        self.__delete_metrics(worker)
+        return True
+
+    @staticmethod
+    def __delete_metrics(worker: _Worker):
+        # Workers push their metrics under their pid (see main.run_worker); drop the group of a dead one
+        MetricsPusher(0, pid=worker.pid).delete()
+
+    @staticmethod
+    def __signal(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def __update_status(self, **values):
+        with self.__lock:
+            workers = [{"pid": w.pid, "model_version": w.generation} for w in self.__workers.values()]
+        self.status.update(workers=workers, restarts=self.restarts, **values)
@@ -0,0 +1,60 @@
+import gc
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Callable, List
+
+
+class ExpertCache(Mapping):
+    """
+    Expert models materialized on first routing and kept in a bounded LRU cache.
+
+    Behaves like the `{class: model}` dict MoEPredictor expects: a lookup of an expert that is not
+    loaded calls `loader(name)` and, once more than `capacity` experts are resident, the least
+    recently used one is dropped. A capacity below the number of experts routed in a single batch
+    makes every batch reload experts, so size it from the traffic mix.
+    """
+    def __init__(self, names: List[str], loader: Callable[[str], object], capacity: int):
+        self._names = list(names)
+        self._loader = loader
+        self.capacity = max(int(capacity), 1)
+        self._models: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getitem__(self, name: str):
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                self.hits += 1
+                return self._models[name]
+            if name not in self._names:
+                raise KeyError(name)
+
+            self.misses += 1
+            model = self._loader(name)
+            self._models[name] = model
+            while len(self._models) > self.capacity:
+                evicted, _ = self._models.popitem(last=False)
+                self.evictions += 1
+                logging.info(f"Evicted expert {evicted} from the expert cache")
+                gc.collect()
+            return model
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+    @property
+    def loaded(self) -> List[str]:
+        """Resident experts, least recently used first."""
+        with self._lock:
+            return list(self._models)
@@ -0,0 +1,292 @@
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from interfaces.extensions.loggers.metrics import MetricLoggingExtension
+
+# Seconds, from 50 us (a cached or gate-skipped batch) to 10 s (a model build)
+LATENCY_BUCKETS = (5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+BATCH_SIZE_BUCKETS = tuple(float(2 ** i) for i in range(14))  # 1 .. 8192
+
+
+class _Cells:
+    """
+    Per-thread accumulators. A thread only ever writes to its own cell, so updates need no lock;
+    the cells are summed when the registry is collected. Cells of finished threads are kept, so
+    counters never go backwards.
+    """
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0.0] * self._size
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            cells = list(self._cells)
+        return [sum(column) for column in zip(*cells)] if cells else [0.0] * self._size
+
+    def reset(self):
+        # New lock too: a forked child may inherit this one held by a thread that no longer exists
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+
+
+class Counter:
+    def __init__(self):
+        self._cells = _Cells(1)
+        self._local = self._cells._local
+
+    def inc(self, amount: float = 1.0):
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._cells.cell()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+    def reset(self):
+        self._cells.reset()
+        self._local = self._cells._local
+
+
+class Gauge:
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from `function` at collection time instead of on every change."""
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float('nan')
+        return self._value
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket, +Inf, then sum and count
+        self._cells = _Cells(len(self.buckets) + 3)
+        self._local = self._cells._local
+
+    def observe(self, value: float, count: int = 1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.cell()
+        cell[bisect_left(self.buckets, value)] += count
+        cell[-2] += value * count
+        cell[-1] += count
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """Cumulative bucket counts (ending with +Inf), sum and count."""
+        totals = self._cells.totals()
+        cumulative, running = [], 0.0
+        for n in totals[:-2]:
+            running += n
+            cumulative.append(running)
+        return cumulative, totals[-2], totals[-1]
+
+    def reset(self):
+        self._cells.reset()
+        self._local = self._cells._local
+
+
+class _Family:
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str], factory: Callable[[], object]):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **labels):
+        key = values if values else tuple(labels[n] for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            key = tuple(str(v) for v in key)
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def __getattr__(self, attr):
+        # Families without labels forward inc/set/observe/... to their single child
+        if attr.startswith('_') or self.labelnames:
+            raise AttributeError(attr)
+        return getattr(self.labels(), attr)
+
+    def children(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class MetricsRegistry:
+    """
+    In-process metric store rendered in the Prometheus text format, either scraped from `/metrics`
+    or pushed by a MetricsPusher. Recording a value only touches memory.
+    """
+    def __init__(self, namespace: str = "oraculo"):
+        self.namespace = namespace
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> _Family:
+        return self._family("counter", name, documentation, labelnames, Counter)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> _Family:
+        return self._family("gauge", name, documentation, labelnames, Gauge)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> _Family:
+        return self._family("histogram", name, documentation, labelnames, lambda: Histogram(buckets))
+
+    def _family(self, kind, name, documentation, labelnames, factory) -> _Family:
+        name = _sanitize(f"{self.namespace}_{name}")
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(kind, name, documentation, labelnames, factory)
+            elif family.kind != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family.kind}")
+            return family
+
+    def reset(self):
+        """
+        Zero every counter and histogram; gauges keep their value. A forked worker calls this first,
+        or it would report the values its parent recorded before the fork as its own.
+        """
+        self._lock = threading.Lock()
+        for family in list(self._families.values()):
+            family._lock = threading.Lock()
+            for _, child in family.children():
+                if family.kind != "gauge":
+                    child.reset()
+
+    def exposition(self) -> str:
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, child in family.children():
+                labels = dict(zip(family.labelnames, key))
+                if family.kind == "histogram":
+                    cumulative, total, count = child.snapshot()
+                    for bound, n in zip([*child.buckets, float('inf')], cumulative):
+                        lines.append(f"{family.name}_bucket{_labels({**labels, 'le': _fmt(bound)})} {_fmt(n)}")
+                    lines.append(f"{family.name}_sum{_labels(labels)} {_fmt(total)}")
+                    lines.append(f"{family.name}_count{_labels(labels)} {_fmt(count)}")
+                else:
+                    lines.append(f"{family.name}{_labels(labels)} {_fmt(child.value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _sanitize(name: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in ":_" else "_" for ch in name)
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _fmt(x: float) -> str:
+    if x == float('inf'):
+        return "+Inf"
+    return f"{x:.10g}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RegistryLogger(MetricLoggingExtension):
+    """
+    Drop-in for PrometheusPushLogger that records into the registry instead of pushing.
+
+    `log(latency, variant, metrics)` observes the latency (nanoseconds, as measured by Timer) in the
+    `<job>_latency_seconds` histogram and sets one `<job>_<name>` gauge per extra metric.
+    """
+    def __init__(self, job: str = "inference", registry: MetricsRegistry = REGISTRY):
+        self.job = job
+        self.registry = registry
+        self._latency = registry.histogram(f"{job}_latency_seconds", f"Latency of {job} operations.", ["variant"])
+
+    def new_experiment(self, experiment_name: str):
+        pass
+
+    def log(self, latency: float, ids_version: str = "Oraculo", variant: str | None = None, wait_time: int | None = None,
+            metrics: Dict[str, float] | None = None):
+        self._latency.labels(variant or "").observe(latency / 1e9)
+        for name, value in (metrics or {}).items():
+            self.registry.gauge(f"{self.job}_{name}", f"Last {name} reported by {self.job}.", ["variant"]).labels(variant or "").set(value)
+
+
+class MetricsPusher:
+    """
+    Pushes the registry to the Pushgateway every `interval` seconds from a daemon thread, for
+    processes nobody scrapes (e.g. ORACULO_WORKERS workers). Each process (`pid`, this one by
+    default) is its own `<hostname>-<pid>` instance; `delete` removes its group once it has exited,
+    so the Pushgateway doesn't keep serving the last values of dead processes.
+    """
+    def __init__(self, interval: float, registry: MetricsRegistry = REGISTRY, job: str = "oraculo", timeout_sec: float = 3.0,
+                 pid: int | None = None):
+        self.interval = interval
+        self.registry = registry
+        instance = f"{socket.gethostname()}-{pid or os.getpid()}"
+        self.url = f"{os.getenv('PUSHGATEWAY_URL', 'http://pushgateway:9091')}/metrics/job/{job}/instance/{instance}"
+        self.timeout_sec = timeout_sec
+        self._session = requests.Session()
+
+    def start(self) -> 'MetricsPusher':
+        threading.Thread(target=self._run, name="metrics-pusher", daemon=True).start()
+        return self
+
+    def delete(self):
+        try:
+            self._session.delete(self.url, timeout=self.timeout_sec).raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Deleting the metrics group {self.url} failed: {e}")
+
+    def push(self):
+        try:
+            self._session.put(self.url, data=self.registry.exposition().encode("utf-8"), timeout=self.timeout_sec).raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Metrics push to {self.url} failed: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.push()
@@ -0,0 +1,85 @@
+import os
+import random
+import threading
+from contextlib import nullcontext
+from time import perf_counter_ns
+
+from domain.entities.loggers.registry import BATCH_SIZE_BUCKETS, REGISTRY, MetricsRegistry
+
+# Returned whenever nothing is recorded; entering and leaving it does nothing
+_NOT_SAMPLED = nullcontext()
+
+
+class _TraceState(threading.local):
+    # Class-level default: reading it on a thread that never traced doesn't raise
+    active = False
+
+
+class _Span:
+    __slots__ = ("tracer", "stage", "rows", "start", "root")
+
+    def __init__(self, tracer: 'Tracer', stage: str, rows: int | None, root: bool = False):
+        self.tracer = tracer
+        self.stage = stage
+        self.rows = rows
+        self.root = root
+
+    def __enter__(self):
+        if self.root:
+            self.tracer._local.active = True
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter_ns() - self.start
+        if self.root:
+            self.tracer._local.active = False
+        self.tracer._record(self.stage, elapsed, self.rows)
+        return False
+
+
+class Tracer:
+    """
+    Sampling tracer for the classification path.
+
+    `trace(name)` opens the root span of a message or batch and decides, with probability
+    `sample_rate` (TRACE_SAMPLE_RATE, off by default), whether it is recorded. Inside a sampled trace,
+    `span(stage)` times one stage on the same thread; outside one it returns a shared no-op context,
+    so instrumented code costs a thread-local lookup when sampling is off.
+
+    Every span is observed in the `stage_latency_seconds{stage}` histogram, and spans given `rows`
+    also in `stage_rows{stage}`. Their `_count` series are the per-stage (e.g. per-expert) call counts
+    of the sampled traces.
+    """
+    def __init__(self, sample_rate: float | None = None, registry: MetricsRegistry = REGISTRY):
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", 0))
+        self._local = _TraceState()
+        self._latency = registry.histogram("stage_latency_seconds", "Latency of the stages of sampled traces.", ["stage"])
+        self._rows = registry.histogram("stage_rows", "Rows handled by the stages of sampled traces.", ["stage"],
+                                        buckets=BATCH_SIZE_BUCKETS)
+
+    def trace(self, name: str, rows: int | None = None):
+        if self._local.active:
+            # A trace opened inside a sampled one is recorded as one of its spans
+            return _Span(self, name, rows)
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return _NOT_SAMPLED
+        return _Span(self, name, rows, root=True)
+
+    def span(self, stage: str, rows: int | None = None):
+        if self._local.active:
+            return _Span(self, stage, rows)
+        return _NOT_SAMPLED
+
+    @property
+    def active(self) -> bool:
+        """Whether the current thread is inside a sampled trace."""
+        return self._local.active
+
+    def _record(self, stage: str, elapsed_ns: int, rows: int | None):
+        self._latency.labels(stage).observe(elapsed_ns / 1e9)
+        if rows is not None:
+            self._rows.labels(stage).observe(rows)
+
+
+TRACER = Tracer()
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Sequence
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Bounded LRU + TTL cache of predictions keyed by the scaled feature vector.
+
+    Vectors are rounded to `decimals` before hashing, so flows that only differ below that precision
+    share an entry: during floods the same attacker emits thousands of such vectors, which then skip
+    the gate and the experts. Entries older than `ttl_seconds` are treated as misses, and once more
+    than `capacity` entries are stored the least recently used one is dropped.
+    """
+    def __init__(self, capacity: int, ttl_seconds: float = 60, decimals: int = 4):
+        self.capacity = max(int(capacity), 1)
+        self.ttl_seconds = ttl_seconds
+        self.decimals = decimals
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def keys(self, X: np.ndarray, context: Hashable = None) -> List[bytes]:
+        """
+        One key per row of `X`. `context` holds whatever else changes the prediction (strategy,
+        threshold, ...), so the same vector predicted with other settings gets another entry.
+        """
+        # Adding 0.0 folds -0.0 into 0.0 so both round to the same bytes
+        quantized = np.ascontiguousarray(np.round(np.asarray(X, dtype=np.float32), self.decimals) + np.float32(0.0))
+        salt = hashlib.blake2b(repr(context).encode(), digest_size=32).digest()
+        return [hashlib.blake2b(row.tobytes(), digest_size=16, key=salt).digest() for row in quantized]
+
+    def get_many(self, keys: Sequence[bytes]) -> List[object | None]:
+        """Cached predictions for `keys`, with None for misses and expired entries."""
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    found.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found.append(entry[0])
+        return found
+
+    def put_many(self, keys: Sequence[bytes], values: Sequence[object]):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,21 +1,34 @@
 import gc
+import json
 import logging
 import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from domain.entities.loggers.metrics import PrometheusPushLogger, Timer
+from domain.entities.expert_cache import ExpertCache
+from domain.entities.prediction_cache import PredictionCache
+from domain.entities.loggers.metrics import Timer
+from domain.entities.loggers.registry import BATCH_SIZE_BUCKETS, REGISTRY
+from domain.entities.loggers.tracing import TRACER
 import joblib
 import numpy as np
 import pandas as pd
-from tensorflow.keras.models import load_model
 from pydantic import BaseModel, Field, model_validator
 from typing import Dict, List, Tuple
 from moe.src.moe.predictors import MoEPredictor
-from moe.src.moe.calibration import GateCalibrator
+from moe.src.moe.calibration import GateCalibrator, load_calibrator, save_calibrator, to_closed_form
+from moe.src.moe.export import TFLiteModel, file_sha256
 from moe.src.data_preprocessing import DataProcessor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 
 
+PREDICT_LATENCY = REGISTRY.histogram("predict_latency_seconds", "Latency of Predictor.predict calls.", ["strategy"])
+PREDICT_BATCH_SIZE = REGISTRY.histogram("predict_batch_size", "Flows per Predictor.predict call.", buckets=BATCH_SIZE_BUCKETS)
+PREDICTIONS = REGISTRY.counter("predictions_total", "Predicted flows per class.", ["label"])
+GATE_SKIPPED = REGISTRY.counter("gate_skipped_total", "Flows answered by the gate alone (GATE_CONFIDENCE_BOUND).")
+CACHE_SERVED = REGISTRY.counter("prediction_cache_served_total", "Flows answered from the prediction cache.")
+
 
 class PathModelConfig(BaseModel):
     base_path: str = Field(..., description="Base directory where all models are stored.")
@@ -56,17 +69,31 @@ class PathModelConfig(BaseModel):
         return values
     
 class MLFlowModelConfig(BaseModel):
-    pass
+    model_name: str = Field(default_factory=lambda: os.getenv("MLFLOW_MODEL_NAME", "oraculo-moe"), description="Registered model holding the model sets.")
+    alias: str | None = Field(default_factory=lambda: os.getenv("MLFLOW_MODEL_ALIAS", "production"), description="Registry alias to serve.")
+    stage: str | None = Field(None, description="Registry stage to serve when no alias is given.")
+    version: str | None = Field(None, description="Exact version to serve; takes precedence over alias and stage.")
+    tracking_uri: str | None = Field(default_factory=lambda: os.getenv("MLFLOW_TRACKING_URI"), description="MLflow tracking/registry URI, e.g. a file: store offline.")
+    cache_dir: str = Field(default_factory=lambda: os.getenv("MLFLOW_MODEL_CACHE", "data/models/mlflow_cache"), description="Local content-addressed artifact cache.")
 
 class Predictor:
     def __init__(self, config: PathModelConfig|MLFlowModelConfig=PathModelConfig(base_path='data/models')):
         self._config = config  # Store the validated config
+        self.source_config = config  # Where the models came from; differs from `config` for MLflow sources
         self._built = False  # Track if models have been loaded
         self.id2lbl = {}
         self.lbl2id = {}
         self.experts: List = []
+        self.expert_models: Dict[str, object] = {}
         self.gate_model = None
-        self._logger = PrometheusPushLogger()
+        self.load_report: Dict = {}
+        cache_size = int(os.getenv("PREDICTION_CACHE_SIZE", 0))
+        self.prediction_cache = PredictionCache(cache_size, float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 60)),
+                                                int(os.getenv("PREDICTION_CACHE_DECIMALS", 4))) if cache_size > 0 else None
+        if self.prediction_cache is not None:
+            cache = self.prediction_cache
+            REGISTRY.gauge("prediction_cache_entries", "Entries in the prediction cache.").set_function(lambda: len(cache))
+            REGISTRY.gauge("prediction_cache_hit_ratio", "Share of prediction cache lookups that hit.").set_function(lambda: cache.hit_rate)
 
     @property
     def config(self) -> PathModelConfig:
@@ -86,7 +113,25 @@ class Predictor:
         return self
             
     def _load_mlflow_model(self):
-        pass
+        """Materialize the registered model set in the local cache and build from that directory."""
+        from infrastructure.adapters.mlflow_registry import MLflowModelRegistry
+
+        registry = MLflowModelRegistry(self._config.tracking_uri, self._config.cache_dir)
+        model_dir = registry.fetch(self._config.model_name, self._config.alias, self._config.stage, self._config.version)
+        # A registered version is immutable, so falling back to Keras would be silent for its whole lifetime
+        if os.getenv("INFERENCE_BACKEND", "keras").lower() == "tflite" and not (model_dir / "tflite" / "manifest.json").exists():
+            raise FileNotFoundError(f"INFERENCE_BACKEND=tflite but {self._config.model_name} was published without a TFLite "
+                                    "export; run export_models.py on the model set and publish it again")
+        self.source_config = self._config
+        self._config = PathModelConfig(base_path=str(model_dir))
+        self._build_from_dir()
+
+    @property
+    def model_dir(self) -> Path:
+        """Directory the models were loaded from (the local cache entry for MLflow sources)."""
+        if not isinstance(self._config, PathModelConfig):
+            raise RuntimeError("Model is not built. Call `build()` first.")
+        return Path(self._config.base_path)
     
     def _build_label_maps(self):
         self.id2lbl = {i: attack for i, attack in enumerate(self._config.experts_models_path.keys())}
@@ -94,11 +139,101 @@ class Predictor:
         self.classes = list(self.lbl2id.keys())
         
     def _load_from_dir(self):
-        self.experts = [load_model(path) for path in self._config.experts_models_path.values()]
-        self.gate_model = load_model(self._config.gate_model_path)
+        """
+        Load the gate and the experts for INFERENCE_BACKEND across a pool of MODEL_LOAD_WORKERS threads.
+        With EXPERT_CACHE_SIZE > 0 experts are not loaded here but on first routing, into an LRU cache
+        holding at most that many of them. Load time and parameter memory end up in `load_report`.
+        """
+        self.backend = os.getenv("INFERENCE_BACKEND", "keras").lower()
+        sources = self._tflite_sources() if self.backend == "tflite" else None
+        if sources is None:
+            self.backend = "keras"
+            sources = (self._config.gate_model_path, dict(self._config.experts_models_path), self._load_keras_model)
+        gate_path, expert_paths, loader = sources
+
+        cache_size = int(os.getenv("EXPERT_CACHE_SIZE", 0))
+        workers = int(os.getenv("MODEL_LOAD_WORKERS", 8))
+        self.load_report = {"gate": {}, "experts": {}}
+        with Timer() as timer:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                gate = pool.submit(self._timed_load, loader, gate_path, "gate", self.load_report)
+                experts = {} if cache_size > 0 else {
+                    name: pool.submit(self._timed_load, loader, path, name, self.load_report["experts"])
+                    for name, path in expert_paths.items()
+                }
+                self.gate_model = gate.result()
+                self.experts = [future.result() for future in experts.values()]
+
+        if cache_size > 0:
+            self.expert_models = ExpertCache(
+                list(expert_paths),
+                lambda name: self._timed_load(loader, expert_paths[name], name, self.load_report["experts"]),
+                cache_size,
+            )
+        else:
+            self.expert_models = dict(zip(expert_paths, self.experts))
+        self.load_report["startup_seconds"] = timer.elapsed_time / 1e9
+        self._log_load_report(workers, cache_size)
+
+    @staticmethod
+    def _load_keras_model(path: str):
+        # TensorFlow is only imported for the Keras backend; TFLite models run on tflite_runtime when installed
+        from tensorflow.keras.models import load_model
+        return load_model(path)
+
+    def _tflite_sources(self):
+        """
+        Gate path, expert paths and loader for the TFLite export written by `export_models.py`
+        (base_path/tflite/manifest.json). None, so the Keras models are used instead, when the export
+        is missing or was made from different .h5 files than the ones currently configured.
+        """
+        export_dir = Path(self._config.base_path) / "tflite"
+        manifest_path = export_dir / "manifest.json"
+        if not manifest_path.exists():
+            logging.warning(f"INFERENCE_BACKEND=tflite but no export found at {manifest_path}, falling back to Keras")
+            return None
+
+        manifest = json.loads(manifest_path.read_text())
+        sources = {"gate": (self._config.gate_model_path, manifest["gate"])}
+        sources.update({name: (path, manifest["experts"].get(name)) for name, path in self._config.experts_models_path.items()})
+        stale = [name for name, (path, entry) in sources.items() if entry is None or entry["source_sha256"] != file_sha256(path)]
+        if stale:
+            logging.warning(f"TFLite export is stale or incomplete for {', '.join(stale)}, falling back to Keras")
+            return None
+
+        max_batch_size = int(os.getenv("TFLITE_MAX_BATCH_SIZE", 1024))
+        num_threads = int(os.getenv("TFLITE_NUM_THREADS")) if os.getenv("TFLITE_NUM_THREADS") else None
+        return (
+            str(export_dir / manifest["gate"]["path"]),
+            {name: str(export_dir / manifest["experts"][name]["path"]) for name in self._config.experts_models_path},
+            lambda path: TFLiteModel(path, max_batch_size, num_threads),
+        )
+
+    @staticmethod
+    def _param_bytes(model) -> int:
+        if isinstance(model, TFLiteModel):
+            return model.size_bytes
+        return sum(w.numpy().nbytes for w in model.weights)
+
+    @classmethod
+    def _timed_load(cls, loader, path: str, name: str, report: dict):
+        with Timer() as timer:
+            model = loader(path)
+        report[name] = {"seconds": timer.elapsed_time / 1e9, "param_bytes": cls._param_bytes(model)}
+        return model
+
+    def _log_load_report(self, workers: int, cache_size: int):
+        experts = "lazily, on first routing" if cache_size > 0 else "eagerly"
+        logging.info(f"Loaded models with the {self.backend} backend in {self.load_report['startup_seconds']:.2f}s "
+                     f"({workers} workers, experts loaded {experts})")
+        for name, entry in [("gate", self.load_report["gate"]), *self.load_report["experts"].items()]:
+            logging.info(f"  {name}: {entry['seconds']:.2f}s, {entry['param_bytes'] / 2**20:.2f} MiB of parameters")
+
+    def _calibration_data_path(self) -> Path:
+        return Path(self._config.base_path) / "calibrate" / "CICIDS2018_preprocessed_test_reduced.parquet"
 
     def _load_data_from_dir(self) -> tuple[np.ndarray, np.ndarray]:
-        calibration_data_path = Path(self._config.base_path) / "calibrate" / "CICIDS2018_preprocessed_test_reduced.parquet"
+        calibration_data_path = self._calibration_data_path()
 
         if not calibration_data_path.exists():
             raise FileNotFoundError(f"Calibration data file not found: {calibration_data_path}")
@@ -146,26 +281,74 @@ class Predictor:
         y_calibrate = y.to_numpy()
         return X_calibrate, y_calibrate
     
-    def _save_on_mlflow(self):
-        pass
-    
+    def _calibrator_key(self, method: str) -> dict | None:
+        """
+        Everything the fitted calibrator depends on: the gate weights, the calibration data, the
+        scaler applied to it, the method and the class order. None while the scaler does not exist yet.
+        """
+        preprocessor_path = Path(self._config.base_path) / "preprocessor" / "pipeline.pkl"
+        calibration_data_path = self._calibration_data_path()
+        if not preprocessor_path.exists():
+            return None
+        return {
+            'gate_sha256': file_sha256(self._config.gate_model_path),
+            'calibration_data_sha256': file_sha256(calibration_data_path) if calibration_data_path.exists() else None,
+            'pipeline_sha256': file_sha256(preprocessor_path),
+            'method': method,
+            'classes': list(self.classes),
+        }
+
+    def _calibrate_from_dir(self):
+        """Load the persisted calibrator when its inputs are unchanged, otherwise refit and persist it."""
+        method = os.getenv("CALIBRATION_METHOD", 'isotonic').lower()
+        calibrator_path = Path(self._config.base_path) / "preprocessor" / "calibrator.pkl"
+
+        key = self._calibrator_key(method)
+        if key is not None:
+            # Without the parquet the artifact can only be checked against the remaining inputs
+            ignore = ('calibration_data_sha256',) if key['calibration_data_sha256'] is None else ()
+            calibrator = load_calibrator(str(calibrator_path), self.gate_model, key, ignore=ignore)
+            if calibrator is not None:
+                logging.info(f"Loaded calibrator from {calibrator_path}")
+                return calibrator
+
+        X_calibrate, y_calibrate = self._import_calibration_data()
+        calibrator = GateCalibrator(self.gate_model, self.classes, method=method).calibrate(X_calibrate, y_calibrate)
+        del X_calibrate, y_calibrate
+        gc.collect()
+
+        save_calibrator(calibrator, str(calibrator_path), self._calibrator_key(method))
+        logging.info(f"Saved calibrator to {calibrator_path}")
+        return calibrator
+
+    def publish_to_mlflow(self, model_name: str, alias: str | None = None, tracking_uri: str | None = None) -> str:
+        """
+        Register the model set this predictor was built from (gate, experts, scaler and fitted
+        calibrator) as a new version of `model_name`, optionally moving `alias` to it.
+        """
+        from infrastructure.adapters.mlflow_registry import MLflowModelRegistry
+
+        if not self._built:
+            raise RuntimeError("Model is not built. Call `build()` first.")
+        return MLflowModelRegistry(tracking_uri).publish(str(self.model_dir), model_name, alias)
+
     def _build_from_dir(self):
         """Load models only if they haven't been built yet."""
         self._build_label_maps()
 
         self._load_from_dir()
         
-        X_calibrate, y_calibrate = self._import_calibration_data()
-        
-        self._calibrator = GateCalibrator(self.gate_model, self.classes, method=os.getenv("CALIBRATION_METHOD", 'isotonic').lower()).calibrate(X_calibrate, y_calibrate)
-        
-        del X_calibrate, y_calibrate
-        gc.collect()        
-        
-        self.predictor = MoEPredictor(self._calibrator, {cls: expert for cls, expert in zip(self.classes, self.experts)}, self.classes)
-        
-        self._save_on_mlflow()
+        self._calibrator = self._calibrate_from_dir()
+        if os.getenv("CALIBRATION_RUNTIME", "closed_form").lower() == "closed_form":
+            self._calibrator = to_closed_form(self._calibrator, self.gate_model)
         
+        # The fused graph needs every expert materialized, so it is not used with the lazy expert cache
+        self.predictor = MoEPredictor(self._calibrator, self.expert_models, self.classes,
+                                      fused=self.backend == "keras" and not isinstance(self.expert_models, ExpertCache)
+                                      and os.getenv("MOE_FUSED_INFERENCE", "false").lower() == "true",
+                                      gate_confidence_bound=float(os.getenv("GATE_CONFIDENCE_BOUND")) if os.getenv("GATE_CONFIDENCE_BOUND") else None,
+                                      tracer=TRACER)
+
         return self
 
     def predict(self, X_input: np.ndarray, strategy: str = 'soft', id:str|None=None, threshold: float = 0.1, batch_size: int = 32, **kwargs) -> List[Tuple[str, float]]:
@@ -185,10 +368,92 @@ class Predictor:
         if not self._built:
             raise RuntimeError("Model is not built. Call `build()` first.")
 
-        with Timer() as timer:
-            preds = self.predictor.predict(X_input, strategy, threshold, batch_size, **kwargs)
-        
-        self._logger.log(latency=timer.elapsed_time,
-                         variant=strategy, metrics={'threshold': threshold, 'batch_size': batch_size})
+        if self.prediction_cache is None:
+            with Timer() as timer:
+                preds = self.predictor.predict(X_input, strategy, threshold, batch_size, **kwargs)
+            skipped = self.predictor.last_gate_skipped
+        else:
+            with Timer() as timer:
+                preds, skipped, served = self._cached_predict(X_input, strategy, threshold, batch_size, **kwargs)
+            CACHE_SERVED.inc(served)
+
+        # In-memory updates only; the registry is scraped from /metrics or pushed in the background
+        PREDICT_LATENCY.labels(strategy).observe(timer.elapsed_time / 1e9)
+        PREDICT_BATCH_SIZE.observe(len(X_input))
+        GATE_SKIPPED.inc(skipped)
+        for label, count in Counter(label for label, _ in preds).items():
+            PREDICTIONS.labels(label).inc(count)
         return preds
 
+    def _cached_predict(self, X_input: np.ndarray, strategy: str, threshold: float, batch_size: int, **kwargs):
+        """
+        Predict through the prediction cache: only vectors that are neither cached nor repeated earlier in
+        the batch reach the MoE. Returns the predictions, the gate-skipped count and how many rows were served
+        without running the models.
+        """
+        X_input = np.asarray(X_input)
+        with TRACER.span("cache_lookup", len(X_input)):
+            keys = self.prediction_cache.keys(X_input, (strategy, threshold, sorted(kwargs.items())))
+            unique = list(dict.fromkeys(keys))
+            cached = dict(zip(unique, self.prediction_cache.get_many(unique)))
+
+        missing = [key for key in unique if cached[key] is None]
+        skipped = 0
+        if missing:
+            first_row = {}
+            for i, key in enumerate(keys):
+                first_row.setdefault(key, i)
+            fresh = self.predictor.predict(X_input[[first_row[key] for key in missing]], strategy, threshold, batch_size, **kwargs)
+            skipped = self.predictor.last_gate_skipped
+            with TRACER.span("cache_store", len(missing)):
+                self.prediction_cache.put_many(missing, fresh)
+            cached.update(zip(missing, fresh))
+
+        return [cached[key] for key in keys], skipped, len(keys) - len(missing)
+
+    def validate_gate_bound(self, bounds: List[float], strategy: str = 'soft', threshold: float = 0.1, batch_size: int = 1024,
+                            sample_size: int | None = None, **kwargs) -> List[Dict[str, float]]:
+        """
+        Measure the gate-confidence fast path on the calibration data before enabling it.
+
+        Runs the full MoE once (bound None) and then once per bound, reporting accuracy, agreement
+        with the full MoE, the share of samples that skipped the experts and throughput.
+        The calibrator is fitted on this same data, so gate accuracy here is an optimistic estimate.
+
+        Args:
+            bounds (List[float]): Confidence bounds to evaluate.
+            sample_size (int | None): Evaluate on a random subsample of this size instead of the whole file.
+
+        Returns:
+            List[Dict[str, float]]: One row of results per bound.
+        """
+        if not self._built:
+            raise RuntimeError("Model is not built. Call `build()` first.")
+
+        X, y = self._import_calibration_data()
+        if sample_size is not None and sample_size < len(X):
+            idx = np.random.default_rng(42).choice(len(X), size=sample_size, replace=False)
+            X, y = X[idx], y[idx]
+        y_true = np.array([self.id2lbl[i] for i in y])
+
+        configured_bound = self.predictor.gate_confidence_bound
+        results = []
+        try:
+            for bound in [None, *bounds]:
+                self.predictor.gate_confidence_bound = bound
+                with Timer() as timer:
+                    preds = self.predictor.predict(X, strategy, threshold, batch_size, **kwargs)
+                labels = np.array([pred[0] for pred in preds])
+                if bound is None:
+                    reference = labels
+                results.append({
+                    'bound': bound,
+                    'accuracy': float(np.mean(labels == y_true)),
+                    'agreement': float(np.mean(labels == reference)),
+                    'skip_rate': self.predictor.last_gate_skipped / len(X),
+                    'samples_per_sec': len(X) / (timer.elapsed_time / 1e9),
+                })
+        finally:
+            self.predictor.gate_confidence_bound = configured_bound
+        return results
+
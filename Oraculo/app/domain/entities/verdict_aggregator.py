@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, List, Tuple
+
+
+@dataclass
+class VerdictWindow:
+    ip: str
+    attack_type: str
+    first_id: str
+    count: int
+    first_seen: float
+    last_seen: float
+    max_confidence: float
+    closes_at: float
+    # What `emit` returned for the opening verdict (e.g. a Future of its persistence)
+    opened: Any = None
+
+
+class VerdictAggregator:
+    """
+    Collapses repeated verdicts for the same `(ip, attack_type)` into one record per window.
+
+    The first verdict of a key is handed to `emit` right away (a window with `count` 1) and opens a
+    window of `window_seconds`; every verdict for that key until it closes only bumps its count,
+    last-seen time and max confidence. When a window that rolled up later verdicts closes, a background
+    thread emits it again as the summary of the whole window (`count` includes the opening verdict), so
+    an alert storm from one source becomes its first alert plus one summary per window. At most
+    `max_keys` windows are kept open; past that the oldest ones are closed early (e.g. spoofed sources).
+    `clock` gives the current time in seconds since the epoch.
+
+    `add` returns what `emit` returned for the opening verdict of the window, both for that verdict and
+    for the ones rolled up into it, so callers can wait for the alert to be persisted. If emitting the
+    opening verdict fails, `add` raises and the window is discarded.
+    """
+    def __init__(self, window_seconds: float, emit: Callable[[VerdictWindow], Any], max_keys: int = 100_000,
+                 clock: Callable[[], float] = time.time):
+        self.window_seconds = window_seconds
+        self._emit = emit
+        self.max_keys = max_keys
+        self._clock = clock
+        self._windows: Dict[Tuple[str, str], VerdictWindow] = {}
+        self._lock = threading.Lock()
+        self._flusher: threading.Thread | None = None
+        self._stopping: threading.Event | None = None
+        self.verdicts = 0
+        self.emitted = 0
+
+    def add(self, ip: str, id: str, attack_type: str, confidence: float) -> Any:
+        now = self._clock()
+        opened = None
+        overflow = []
+        with self._lock:
+            self.verdicts += 1
+            window = self._windows.get((ip, attack_type))
+            if window is None:
+                window = VerdictWindow(ip, attack_type, id, 1, now, now, confidence, now + self.window_seconds)
+                self._windows[(ip, attack_type)] = window
+                # A copy: later verdicts keep updating the open window while it is being emitted
+                opened = replace(window)
+                while len(self._windows) > self.max_keys:
+                    # Dicts keep insertion order, so the first window is the oldest one
+                    overflow.append(self._windows.pop(next(iter(self._windows))))
+            else:
+                window.count += 1
+                window.last_seen = now
+                window.max_confidence = max(window.max_confidence, confidence)
+                result = window.opened
+            if self._flusher is None:
+                self._stopping = threading.Event()
+                self._flusher = threading.Thread(target=self._run, args=(self._stopping,), name="verdict-flusher", daemon=True)
+                self._flusher.start()
+        self._emit_all(self._summaries(overflow))
+        if opened is None:
+            return result
+        try:
+            result = self._emit(opened)
+        except Exception:
+            with self._lock:
+                if self._windows.get((ip, attack_type)) is window:
+                    del self._windows[(ip, attack_type)]
+            raise
+        self.emitted += 1
+        window.opened = result
+        return result
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Close the windows that have expired (every open window with `force`) and emit the summaries of
+        those that rolled up later verdicts. Returns how many summaries were emitted.
+        """
+        now = self._clock()
+        with self._lock:
+            closed = [key for key, window in self._windows.items() if force or window.closes_at <= now]
+            windows = self._summaries([self._windows.pop(key) for key in closed])
+        self._emit_all(windows)
+        return len(windows)
+
+    def stop(self, timeout: float | None = None) -> int:
+        """
+        Stop the background thread, waiting up to `timeout` seconds for it, then close every open window.
+        A later `add` starts a new thread. Returns how many summaries were emitted.
+        """
+        with self._lock:
+            flusher, stopping = self._flusher, self._stopping
+            self._flusher = self._stopping = None
+        if flusher is not None:
+            stopping.set()
+            flusher.join(timeout)
+        return self.flush(force=True)
+
+    @staticmethod
+    def _summaries(windows: List[VerdictWindow]) -> List[VerdictWindow]:
+        # The opening verdict was emitted already; a window without later ones has nothing to add
+        return [window for window in windows if window.count > 1]
+
+    def _emit_all(self, windows: List[VerdictWindow]):
+        for window in windows:
+            try:
+                self._emit(window)
+                self.emitted += 1
+            except Exception as e:
+                logging.error(f"Failed to emit verdict window for {window.ip} ({window.attack_type}): {e}")
+
+    def _run(self, stopping: threading.Event):
+        tick = min(max(self.window_seconds / 4, 0.05), 1.0)
+        while not stopping.wait(tick):
+            self.flush()
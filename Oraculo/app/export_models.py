@@ -0,0 +1,27 @@
+"""
+Export the gate and expert models found under the models directory to TFLite, for INFERENCE_BACKEND=tflite.
+
+Each exported model is checked against its Keras original; the export fails if any output deviates
+by more than --tolerance. Results go to <base-path>/tflite with a manifest.json that the Predictor
+uses to detect exports made from different .h5 files.
+
+Usage (from Oraculo/app):
+    python export_models.py --base-path data/models
+"""
+import argparse
+from pathlib import Path
+
+from domain.entities.predictor import PathModelConfig
+from moe.src.moe.export import export_models
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-path', default='data/models')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='maximum absolute difference to Keras')
+    parser.add_argument('--n-samples', type=int, default=4096, help='verification inputs per model')
+    args = parser.parse_args()
+
+    config = PathModelConfig(base_path=args.base_path)
+    export_models(config.gate_model_path, config.experts_models_path, str(Path(config.base_path) / "tflite"),
+                  tolerance=args.tolerance, n_samples=args.n_samples)
@@ -2,14 +2,19 @@ import logging
 import os
 import pika
 import time
+from concurrent.futures import Future
 
 from interfaces.messenger import Messenger
 
 class MessageBroker(Messenger):
     
-    def __init__(self, server='rabbitmq', port=5672, user=None, password=None, virtual_host='/', max_retries=3, retry_delay=5):
+    def __init__(self, server='rabbitmq', port=5672, user=None, password=None, virtual_host='/', max_retries=3, retry_delay=5, manual_ack=None, prefetch_count=None):
         user = user or os.getenv("RABBITMQ_DEFAULT_USER", "guest")
         password = password or os.getenv("RABBITMQ_DEFAULT_PASSWORD", "guest")
+        if manual_ack is None:
+            manual_ack = os.getenv("RABBITMQ_ACK_MODE", "auto").lower() == "manual"
+        if prefetch_count is None:
+            prefetch_count = int(os.getenv("RABBITMQ_PREFETCH_COUNT", 256))
         
         self.__server = server
         self.__port = port
@@ -18,9 +23,20 @@ class MessageBroker(Messenger):
         self.__virtual_host = virtual_host
         self.__max_retries = max_retries
         self.__retry_delay = retry_delay
+        self.__manual_ack = manual_ack
+        self.__prefetch_count = prefetch_count
         self.__connection = None
         self.__channel = None
-        
+        self.__declared_queues = set()
+        self.__stopping = False
+        self.__flush_pending = None
+        # Deliveries whose callback returned a Future that has not resolved yet (connection thread only)
+        self.__unsettled = 0
+
+    @property
+    def manual_ack(self) -> bool:
+        return self.__manual_ack
+
     def connect(self):
         # Connect to RMQ 
         logging.info(f'Connecting to {self.__server}')
@@ -31,6 +47,7 @@ class MessageBroker(Messenger):
                 params = pika.ConnectionParameters(host=self.__server, port=self.__port, virtual_host=self.__virtual_host, credentials=credentials)
                 self.__connection = pika.BlockingConnection(params)
                 self.__channel = self.__connection.channel()
+                self.__declared_queues = set()
                 return
 
             # Do not recover on channel errors
@@ -47,26 +64,146 @@ class MessageBroker(Messenger):
         raise Exception("Max retries reached. Unable to connect to RabbitMQ.")
 
     def publish_message(self, queue_name, message):
-        try:
-            self.connect()
-            self.__channel.queue_declare(queue=queue_name, durable=True) 
-            self.__channel.basic_publish(exchange='', routing_key=queue_name, body=message)
-            logging.debug(f"Sent '{message[:100]}...'")
-            self.__retry_delay = 5  # Reset retry delay on success
+        # Reuse the open connection; only (re)connect when it was never opened or has dropped
+        for attempt in range(2):
+            try:
+                if self.__connection is None or self.__connection.is_closed or self.__channel is None or self.__channel.is_closed:
+                    self.connect()
+                if queue_name not in self.__declared_queues:
+                    self.__channel.queue_declare(queue=queue_name, durable=True)
+                    self.__declared_queues.add(queue_name)
+                self.__channel.basic_publish(exchange='', routing_key=queue_name, body=message)
+                logging.debug(f"Sent '{message[:100]}...'")
+                self.__retry_delay = 5  # Reset retry delay on success
+                return
+
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.StreamLostError) as e:
+                logging.warning(f"Connection lost while publishing, reconnecting: {str(e)}")
+                self.__channel = None
 
-        except pika.exceptions.AMQPError as e:
-            logging.error(f"Error publishing message: {str(e)}")
+            except pika.exceptions.AMQPError as e:
+                logging.error(f"Error publishing message: {str(e)}")
+                return
 
-        finally:
-            self.close_connection()
+        logging.error("Error publishing message: connection could not be re-established")
         
     def receive_message(self, queue_name, callback):
-        while True:
+        """
+        Consume `queue_name` one message at a time. In manual-ack mode a message is acked once `callback`
+        returns, or, when it returns a Future, once that resolves (nacked if it fails).
+        """
+        def on_message(ch, method, properties, body):
+            try:
+                result = callback(ch, method, properties, body)
+            except Exception as e:
+                logging.error(f"Error handling message {method.delivery_tag}: {str(e)}")
+                if self.__manual_ack:
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+                return
+
+            if not self.__manual_ack:
+                return
+            if isinstance(result, Future):
+                self.__settle_when_done(ch, [method], result)
+            else:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        self.__consume(queue_name, lambda: on_message, 'Waiting for messages. To exit press CTRL+C')
+
+    def receive_batch(self, queue_name, callback, batch_size=64, linger_ms=50):
+        """
+        Consume `queue_name` in micro-batches.
+
+        Deliveries are buffered until `batch_size` messages have arrived or
+        `linger_ms` milliseconds have passed since the first buffered message,
+        whichever comes first. `callback` is then called once with the list of
+        `(properties, body)` tuples of the batch.
+
+        In manual-ack mode the whole batch is acknowledged with a single
+        multiple-ack once `callback` returns. If it returns a Future, the batch
+        is only acked once that resolves, message by message. If it raises (or
+        the Future fails), every message is nacked and requeued once; messages
+        that were already redelivered are dropped instead so a poison batch
+        can't loop forever.
+        """
+        if self.__manual_ack and self.__prefetch_count and self.__prefetch_count < batch_size:
+            logging.warning(f"Prefetch window ({self.__prefetch_count}) is smaller than the batch size ({batch_size}); batches will only be flushed by linger time.")
+
+        def on_message_factory():
+            batcher = _MessageBatcher(self.__connection, self.__channel, callback, batch_size, linger_ms, self.__manual_ack,
+                                      self.__settle_when_done, lambda: self.__unsettled > 0)
+            self.__flush_pending = batcher.flush
+            return batcher.on_message
+
+        self.__consume(
+            queue_name,
+            on_message_factory,
+            f'Waiting for messages in batches of up to {batch_size} ({linger_ms} ms linger). To exit press CTRL+C',
+        )
+
+    def stop_consuming(self):
+        """
+        Make the consume loop return once the message or batch being handled is done, flushing any
+        partially filled batch first. Safe to call from another thread or a signal handler.
+        """
+        self.__stopping = True
+        connection = self.__connection
+        if connection is not None and connection.is_open:
+            connection.add_callback_threadsafe(self.__stop)
+
+    def __stop(self):
+        if self.__flush_pending is not None:
+            self.__flush_pending()
+        if self.__channel is not None and self.__channel.is_open:
+            self.__channel.stop_consuming()
+
+    def __settle_when_done(self, channel, methods, result: Future):
+        """Ack `methods` once `result` resolves, or nack them if it fails, back on the connection thread."""
+        connection = self.__connection
+        self.__unsettled += len(methods)
+
+        def settle():
+            self.__unsettled -= len(methods)
+            if not channel.is_open:
+                # RabbitMQ requeues the deliveries of a closed channel by itself
+                return
+            error = result.exception()
+            if error is None:
+                for method in methods:
+                    channel.basic_ack(delivery_tag=method.delivery_tag)
+                return
+            logging.error(f"Failed to persist the packages of {len(methods)} messages: {str(error)}")
+            for method in methods:
+                channel.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+
+        def on_done(_):
+            try:
+                connection.add_callback_threadsafe(settle)
+            except Exception:
+                # The connection is gone, and its unacked deliveries were requeued with it
+                pass
+
+        result.add_done_callback(on_done)
+
+    def __settle_pending(self, timeout: float = 10.0):
+        # Give the packages still being persisted a chance to be acked before the connection closes
+        deadline = time.monotonic() + timeout
+        while self.__unsettled and self.__connection.is_open and time.monotonic() < deadline:
+            self.__connection.process_data_events(time_limit=0.1)
+        if self.__unsettled:
+            logging.warning(f"Closing the connection with {self.__unsettled} messages still unacked; RabbitMQ will redeliver them")
+
+    def __consume(self, queue_name, on_message_factory, description):
+        while not self.__stopping:
+            self.__unsettled = 0
             try:
                 self.connect()
                 self.__channel.queue_declare(queue=queue_name, durable=True)
-                self.__channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
-                logging.info('Waiting for messages. To exit press CTRL+C')
+                if self.__manual_ack:
+                    # Bound the unacked deliveries RabbitMQ pushes to us, giving back-pressure from the predictor
+                    self.__channel.basic_qos(prefetch_count=self.__prefetch_count)
+                self.__channel.basic_consume(queue=queue_name, on_message_callback=on_message_factory(), auto_ack=not self.__manual_ack)
+                logging.info(description)
                 self.__channel.start_consuming()
 
             except KeyboardInterrupt:
@@ -80,10 +217,76 @@ class MessageBroker(Messenger):
                 continue
 
             finally:
+                self.__flush_pending = None
+                if self.__unsettled and self.__connection is not None:
+                    try:
+                        self.__settle_pending()
+                    except pika.exceptions.AMQPError:
+                        pass
                 self.close_connection()
 
     def close_connection(self):
         if self.__connection and self.__connection.is_open:
             self.__connection.close()
             logging.info("Connection closed.")
-        
\ No newline at end of file
+        
+
+class _MessageBatcher:
+    """Buffers deliveries on the connection thread and flushes them by size or linger time."""
+
+    def __init__(self, connection, channel, callback, batch_size, linger_ms, manual_ack=False, settle_when_done=None,
+                 has_unsettled=lambda: False):
+        self.__connection = connection
+        self.__channel = channel
+        self.__callback = callback
+        self.__batch_size = max(1, int(batch_size))
+        self.__linger = max(0, linger_ms) / 1000
+        self.__manual_ack = manual_ack
+        self.__settle_when_done = settle_when_done
+        self.__has_unsettled = has_unsettled
+        self.__methods = []
+        self.__messages = []
+        self.__timer = None
+
+    def on_message(self, ch, method, properties, body):
+        self.__methods.append(method)
+        self.__messages.append((properties, body))
+        if len(self.__messages) >= self.__batch_size:
+            self.flush()
+        elif self.__timer is None:
+            # BlockingConnection dispatches timers from start_consuming, on this same thread
+            self.__timer = self.__connection.call_later(self.__linger, self.__on_linger)
+
+    def __on_linger(self):
+        self.__timer = None
+        self.flush()
+
+    def flush(self):
+        if self.__timer is not None:
+            self.__connection.remove_timeout(self.__timer)
+            self.__timer = None
+        if not self.__messages:
+            return
+        methods, self.__methods = self.__methods, []
+        messages, self.__messages = self.__messages, []
+
+        try:
+            result = self.__callback(messages)
+        except Exception as e:
+            logging.error(f"Error handling batch of {len(messages)} messages: {str(e)}")
+            if self.__manual_ack:
+                for method in methods:
+                    self.__channel.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+            return
+
+        if not self.__manual_ack:
+            return
+        if isinstance(result, Future):
+            self.__settle_when_done(self.__channel, methods, result)
+        elif self.__has_unsettled():
+            # A multiple-ack would also ack earlier batches still waiting for their packages to be persisted
+            for method in methods:
+                self.__channel.basic_ack(delivery_tag=method.delivery_tag)
+        else:
+            # Deliveries are flushed in order, so acking the last tag acknowledges the whole batch
+            self.__channel.basic_ack(delivery_tag=methods[-1].delivery_tag, multiple=True)
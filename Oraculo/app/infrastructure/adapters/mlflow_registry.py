@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import mlflow
+from mlflow.tracking import MlflowClient
+
+from moe.src.moe.export import file_sha256
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# Everything a model set needs at serving time, in the layout PathModelConfig expects, including
+# the TFLite export of export_models.py when there is one (INFERENCE_BACKEND=tflite)
+MODEL_SET_PATTERNS = ("gate/*.h5", "experts/*/*.h5", "preprocessor/pipeline.pkl", "preprocessor/calibrator.pkl",
+                      "tflite/manifest.json", "tflite/gate/*.tflite", "tflite/experts/*/*.tflite")
+
+
+class MLflowModelRegistry:
+    """
+    Stores Oraculo model sets (gate, experts, scaler, calibrator) as MLflow registered model versions
+    and materializes them locally.
+
+    Every version carries a manifest with the sha256 of each file. Files are downloaded into a
+    content-addressed cache (`<cache_dir>/objects/<sha256>`) and verified, then linked into
+    `<cache_dir>/sets/<manifest sha256>/` in the directory layout `Predictor` already reads. Restarts
+    and replicas sharing the cache only fetch the manifest when nothing changed.
+    Works with any tracking URI, including a local `file:` store for offline use (recent MLflow
+    releases also need MLFLOW_ALLOW_FILE_STORE=true for that).
+    """
+
+    def __init__(self, tracking_uri: str | None = None, cache_dir: str = "data/models/mlflow_cache"):
+        self.tracking_uri = tracking_uri or os.getenv("MLFLOW_TRACKING_URI")
+        self.cache_dir = Path(cache_dir)
+        self.client = MlflowClient(tracking_uri=self.tracking_uri, registry_uri=self.tracking_uri)
+
+    def resolve(self, model_name: str, alias: str | None = None, stage: str | None = None, version: str | None = None):
+        """The registered model version selected by `version`, else `alias`, else the latest in `stage`."""
+        if version is not None:
+            return self.client.get_model_version(model_name, str(version))
+        if alias is not None:
+            return self.client.get_model_version_by_alias(model_name, alias)
+        if stage is not None:
+            versions = self.client.get_latest_versions(model_name, stages=[stage])
+            if not versions:
+                raise LookupError(f"No version of {model_name} in stage {stage}")
+            return versions[0]
+        raise ValueError("One of version, alias or stage is required")
+
+    def fetch(self, model_name: str, alias: str | None = None, stage: str | None = None, version: str | None = None) -> Path:
+        """Download (or reuse from the cache) a model set and return its local directory."""
+        model_version = self.resolve(model_name, alias, stage, version)
+        source = model_version.source.rstrip("/")
+
+        with tempfile.TemporaryDirectory(dir=self._ensure_dir("tmp")) as tmp:
+            manifest_path = Path(mlflow.artifacts.download_artifacts(
+                artifact_uri=f"{source}/{MANIFEST_NAME}", dst_path=tmp, tracking_uri=self.tracking_uri))
+            manifest_bytes = manifest_path.read_bytes()
+        manifest = json.loads(manifest_bytes)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported model set manifest version: {manifest.get('version')}")
+
+        set_dir = self._ensure_dir("sets") / hashlib.sha256(manifest_bytes).hexdigest()
+        if set_dir.exists() and not self._verify(set_dir, manifest):
+            logging.warning(f"Cached model set {set_dir} does not match its manifest, fetching it again")
+            shutil.rmtree(set_dir, ignore_errors=True)
+        if not set_dir.exists():
+            staging = Path(tempfile.mkdtemp(dir=self._ensure_dir("tmp")))
+            for relative_path, sha256 in manifest["files"].items():
+                target = staging / relative_path
+                target.parent.mkdir(parents=True, exist_ok=True)
+                self._link(self._object(source, relative_path, sha256), target)
+            (staging / MANIFEST_NAME).write_bytes(manifest_bytes)
+            try:
+                os.rename(staging, set_dir)
+            except OSError:
+                # Another replica sharing the cache finished the same set first
+                shutil.rmtree(staging, ignore_errors=True)
+
+        logging.info(f"Model set {model_name} v{model_version.version} available at {set_dir}")
+        return set_dir
+
+    def publish(self, base_path: str, model_name: str, alias: str | None = None, experiment_name: str = "oraculo-models") -> str:
+        """
+        Log the model set under `base_path` (see MODEL_SET_PATTERNS) with its manifest, register it as a
+        new version of `model_name` and point `alias` at it. Returns the version number.
+        """
+        base_path = Path(base_path)
+        files = sorted({p for pattern in MODEL_SET_PATTERNS for p in base_path.glob(pattern)})
+        if not files:
+            raise FileNotFoundError(f"No model files found under {base_path}")
+        if not (base_path / "tflite" / "manifest.json").exists():
+            logging.warning(f"No TFLite export under {base_path}, version {model_name} can only be served with INFERENCE_BACKEND=keras")
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "files": {p.relative_to(base_path).as_posix(): file_sha256(p) for p in files},
+        }
+
+        experiment = self.client.get_experiment_by_name(experiment_name)
+        experiment_id = experiment.experiment_id if experiment else self.client.create_experiment(experiment_name)
+        run = self.client.create_run(experiment_id, tags={"mlflow.runName": f"{model_name}-publish"})
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest_path = Path(tmp) / MANIFEST_NAME
+            manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+            self.client.log_artifact(run.info.run_id, str(manifest_path), "model_set")
+        for p in files:
+            self.client.log_artifact(run.info.run_id, str(p), f"model_set/{p.parent.relative_to(base_path).as_posix()}")
+        self.client.set_terminated(run.info.run_id)
+
+        try:
+            self.client.get_registered_model(model_name)
+        except mlflow.exceptions.MlflowException:
+            self.client.create_registered_model(model_name)
+        model_version = self.client.create_model_version(
+            model_name, source=f"{run.info.artifact_uri}/model_set", run_id=run.info.run_id)
+        if alias is not None:
+            self.client.set_registered_model_alias(model_name, alias, model_version.version)
+        return model_version.version
+
+    def _ensure_dir(self, name: str) -> Path:
+        path = self.cache_dir / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _object(self, source: str, relative_path: str, sha256: str) -> Path:
+        """Cached file for `sha256`, downloading and verifying it when missing or corrupt."""
+        path = self._ensure_dir("objects") / sha256
+        if path.exists() and file_sha256(path) == sha256:
+            return path
+
+        with tempfile.TemporaryDirectory(dir=self._ensure_dir("tmp")) as tmp:
+            downloaded = Path(mlflow.artifacts.download_artifacts(
+                artifact_uri=f"{source}/{relative_path}", dst_path=tmp, tracking_uri=self.tracking_uri))
+            actual = file_sha256(downloaded)
+            if actual != sha256:
+                raise ValueError(f"Checksum mismatch for {relative_path}: expected {sha256}, got {actual}")
+            os.replace(downloaded, path)
+        return path
+
+    @staticmethod
+    def _verify(set_dir: Path, manifest: dict) -> bool:
+        return all(
+            (set_dir / relative_path).exists() and file_sha256(set_dir / relative_path) == sha256
+            for relative_path, sha256 in manifest["files"].items()
+        )
+
+    @staticmethod
+    def _link(source: Path, target: Path):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
@@ -1,14 +1,24 @@
 import logging
+import os
 import requests
+from requests.adapters import HTTPAdapter
 
 from interfaces.rest_client import RESTClient
 
 class pfSenseClient(RESTClient):
 
-    def __init__(self, base_url, client, token):
+    def __init__(self, base_url, client, token, timeout=None, pool_size=4):
         self.__base_url = base_url
         self.__client = client
         self.__token = token
+        self.__timeout = timeout or float(os.getenv("PFSENSE_TIMEOUT_SECONDS", 5))
+        # One pooled, keep-alive session instead of a new TLS handshake per request
+        self.__session = requests.Session()
+        self.__session.headers['Authorization'] = f'{self.__client} {self.__token}'
+        self.__session.verify = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
 
     def __handle_response(self, response):
         try:
@@ -16,24 +26,12 @@ class pfSenseClient(RESTClient):
 
         # Handle HTTP errors
         except requests.exceptions.HTTPError as errh:
-            logging.error("HTTP Error:", errh)
-
-        # Handle connection errors
-        except requests.exceptions.ConnectionError as errc:
-            logging.error("Error Connecting:", errc)
-
-        # Handle timeouts
-        except requests.exceptions.Timeout as errt:
-            logging.error("Timeout Error:", errt)
-
-        # Handle other errors
-        except requests.exceptions.RequestException as err:
-            logging.error("Error:", err)
+            logging.error(f"HTTP Error: {errh}")
 
     def get(self, path='', params=None):
         url = f'{self.__base_url}/{path}'
         try:
-            response = requests.get(url, headers={'Authorization': f'{self.__client} {self.__token}'}, params=params, verify=False)
+            response = self.__session.get(url, params=params, timeout=self.__timeout)
             self.__handle_response(response)
 
             return response
@@ -44,10 +42,10 @@ class pfSenseClient(RESTClient):
     def post(self, path='', data=None):
         url = f'{self.__base_url}/{path}'
         try:
-            response = requests.post(url, headers={'Authorization': f'{self.__client} {self.__token}'}, json=data, verify=False)
+            response = self.__session.post(url, json=data, timeout=self.__timeout)
             self.__handle_response(response)
 
             return response
 
         except requests.RequestException as e:
-            logging.error(f"An error occurred during POST request: \n{str(e)}")
\ No newline at end of file
+            logging.error(f"An error occurred during POST request: \n{str(e)}")
@@ -11,7 +11,27 @@ class InMemoryDatabase(PackageRepository):
     def get_all(self):
         return self.data
 
-    def create(self, package_data):
+    def create(self, package_data, durable=False):
         self.data.append(package_data)
 
+    def query(self, ip=None, attack_type=None, since=None, until=None, limit=100, cursor=None):
+        # Same contract as PackageIndex.query: newest first, the cursor is the position (1-based) to continue below
+        matches = []
+        end = len(self.data) if cursor is None else min(cursor - 1, len(self.data))
+        for seq in range(end, 0, -1):
+            package = self.data[seq - 1]
+            if ip is not None and package.get("ip") != ip:
+                continue
+            if attack_type is not None and package.get("attack_type") != attack_type:
+                continue
+            timestamp = package.get("timestamp")
+            if since is not None and (timestamp is None or timestamp < since):
+                continue
+            if until is not None and (timestamp is None or timestamp > until):
+                continue
+            if len(matches) == limit:
+                return [package for _, package in matches], matches[-1][0]
+            matches.append((seq, package))
+        return [package for _, package in matches], None
+
 db = InMemoryDatabase()
\ No newline at end of file
@@ -1,40 +1,231 @@
 import logging
 import os
+import queue
 import socket
 import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import nullcontext
 from pathlib import Path
 
+from domain.entities.loggers.metrics import Timer
+from domain.entities.loggers.registry import RegistryLogger
+from domain.entities.loggers.tracing import TRACER
+from infrastructure.database.package_index import PackageIndex
 from interfaces.repositories.package_repository import PackageRepository
 
 
 class PersistentLogstashProducer(PackageRepository):
-    def __init__(self, file_path='logs.jsonl', logstash_host='logstash', logstash_port=5044):
+    """
+    Appends packages to a local JSONL file and ships them to Logstash as newline-delimited JSON.
+
+    `create` only enqueues: a background flusher drains the bounded queue in batches, appends them to
+    a file handle kept open (fsynced every `fsync_interval` seconds) and writes them to one long-lived
+    TCP connection. While Logstash is unreachable, unsent lines wait in a backlog of at most
+    `queue_size` lines and the connection is retried with exponential backoff. When the queue is full
+    new packages are dropped and counted. Queue depth, drops and flush latency go to the metrics registry.
+
+    Lines are dropped from the backlog once fully sent. When the connection breaks mid-line, that line
+    is sent again whole on the next connection, so Logstash may receive at most one torn document per
+    lost connection alongside the complete copy.
+
+    `create` returns before the package is on disk. With `durable` it returns a Future instead, resolved
+    once the package is fsynced: a batch carrying such packages is fsynced as soon as it is written
+    (a group commit) rather than on the `fsync_interval`. The Future fails when the queue is full or the
+    write fails, so RABBITMQ_ACK_MODE=manual can nack and requeue the message rather than ack a package
+    that never reached the disk. Other packages may still be lost in a crash (up to `queue_size` queued,
+    plus those written since the last fsync); `flush` waits for them.
+    """
+    def __init__(self, file_path='logs.jsonl', logstash_host='logstash', logstash_port=5044, queue_size=None,
+                 batch_size=500, flush_interval=0.5, fsync_interval=1.0):
         self.file_path = Path(file_path)
         self.logstash_host = logstash_host
         self.logstash_port = logstash_port
+        self.queue_size = queue_size or int(os.getenv("LOGSTASH_QUEUE_SIZE", 10000))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
         self.file_path.touch(exist_ok=True)
+        self.index = PackageIndex(self.file_path, os.getenv("PACKAGE_INDEX_PATH") or None)
+        self._logger = RegistryLogger(job="logstash_writer")
+        self._reset()
+
+    def _reset(self):
+        # Threads don't survive a fork, so each worker process gets its own queue and flusher
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._start_lock = threading.Lock()
+        self._flusher = None
+        self._stopping = False
+        self._file = None
+        self._socket = None
+        self._backlog = deque()
+        self._backoff = 1.0
+        self._next_connect = 0.0
+        self._last_fsync = time.monotonic()
+        self.dropped = 0
+        self.logstash_dropped = 0
+        self.reconnects = 0
+        self.last_flush_ns = 0
 
     def get_all(self):
         with self.file_path.open('r', encoding='utf-8') as f:
             return [json.loads(line.strip()) for line in f if line.strip()]
 
-    def create(self, package_data):
-        # Append to disk
-        with self.file_path.open('a', encoding='utf-8') as f:
-            f.write(json.dumps(package_data) + '\n')
+    def query(self, ip=None, attack_type=None, since=None, until=None, limit=100, cursor=None):
+        return self.index.query(ip, attack_type, since, until, limit, cursor)
 
-        # Send to Logstash
-        message = json.dumps(package_data)
+    def create(self, package_data, durable=False):
+        if self._pid != os.getpid():
+            self._reset()
+        self._ensure_flusher()
+        persisted = Future() if durable else None
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.logstash_host, self.logstash_port))
-                sock.sendall(message.encode('utf-8'))
-            logging.debug(f"Logged and pushed to Logstash: {message}")
-        except Exception as e:
-            logging.error(f"Failed to send to Logstash at {self.logstash_host}:{self.logstash_port} — {e}")
+            self._queue.put_nowait((json.dumps(package_data) + '\n', persisted))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logging.warning(f"Logstash writer queue is full, {self.dropped} packages dropped so far")
+            if persisted is not None:
+                persisted.set_exception(RuntimeError("Logstash writer queue is full"))
+        return persisted
+
+    def flush(self, timeout: float = 10.0):
+        """Wait until every package queued so far is written to disk (and sent, if Logstash is up)."""
+        deadline = time.monotonic() + timeout
+        while self._flusher is not None and self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
 
     def close(self):
-        pass
+        self.flush()
+        self._stopping = True
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval * 2)
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+        self._disconnect()
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._start_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="logstash-writer", daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                items = []
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [line for line, _ in items]
+            waiting = [persisted for _, persisted in items if persisted is not None]
+
+            try:
+                # Idle wake-ups (nothing to write) are not traced
+                with Timer() as timer, TRACER.trace("logstash_flush", len(lines)) if lines else nullcontext():
+                    self._write(lines, sync=bool(waiting))
+                for persisted in waiting:
+                    persisted.set_result(None)
+                waiting = []
+                if lines:
+                    self.last_flush_ns = timer.elapsed_time
+                    self._log_metrics()
+            except Exception as e:
+                logging.error(f"Logstash writer failed to flush {len(lines)} packages: {e}")
+                for persisted in waiting:
+                    persisted.set_exception(e)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _write(self, lines, sync=False):
+        if lines:
+            with TRACER.span("logstash_file_write", len(lines)):
+                if self._file is None:
+                    self._file = self.file_path.open('a', encoding='utf-8')
+                self._file.writelines(lines)
+                self._file.flush()
+            self._backlog.extend(line.encode('utf-8') for line in lines)
+            overflow = len(self._backlog) - self.queue_size
+            for _ in range(max(overflow, 0)):
+                self._backlog.popleft()
+                self.logstash_dropped += 1
+
+        now = time.monotonic()
+        if self._file is not None and (sync or now - self._last_fsync >= self.fsync_interval):
+            with TRACER.span("logstash_fsync"):
+                os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+        if self._backlog:
+            with TRACER.span("logstash_send", len(self._backlog)):
+                self._send()
+
+    def _send(self):
+        if self._socket is None:
+            if time.monotonic() < self._next_connect:
+                return
+            try:
+                self._socket = socket.create_connection((self.logstash_host, self.logstash_port), timeout=5)
+                self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                self._backoff = 1.0
+                self.reconnects += 1
+            except OSError as e:
+                self._retry_later(f"Failed to connect to Logstash at {self.logstash_host}:{self.logstash_port} — {e}")
+                return
+
+        payload = memoryview(b''.join(self._backlog))
+        sent = 0
+        try:
+            while sent < len(payload):
+                sent += self._socket.send(payload[sent:])
+            logging.debug(f"Pushed {sent} bytes to Logstash")
+        except OSError as e:
+            self._disconnect()
+            self._retry_later(f"Lost the connection to Logstash at {self.logstash_host}:{self.logstash_port} — {e}")
+        finally:
+            self._drop_sent(sent)
+
+    def _drop_sent(self, sent: int):
+        """Drop the lines fully covered by the first `sent` bytes; a partially sent line stays to be resent."""
+        while self._backlog and sent >= len(self._backlog[0]):
+            sent -= len(self._backlog.popleft())
+
+    def _retry_later(self, message):
+        logging.error(f"{message}; retrying in {self._backoff:.0f}s ({len(self._backlog)} packages waiting)")
+        self._next_connect = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, 30.0)
+
+    def _disconnect(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+    def _log_metrics(self):
+        self._logger.log(latency=self.last_flush_ns, variant="logstash_writer", metrics={
+            'queue_depth': self._queue.qsize(),
+            'dropped': self.dropped,
+            'logstash_backlog': len(self._backlog),
+            'logstash_dropped': self.logstash_dropped,
+            'logstash_connected': float(self._socket is not None),
+            'logstash_reconnects': self.reconnects,
+            'flush_seconds': self.last_flush_ns / 1e9,
+        })
 
 
 logstash_url = os.getenv("LOGSTASH_URL", "http://logstash:5044")
@@ -42,4 +233,4 @@ logstash_url = os.getenv("LOGSTASH_URL", "http://logstash:5044")
 splits = logstash_url.split(':')
 port = splits[2]
 host = splits[1][2:]
-db = PersistentLogstashProducer(logstash_host=host, logstash_port=int(port))
\ No newline at end of file
+db = PersistentLogstashProducer(logstash_host=host, logstash_port=int(port))
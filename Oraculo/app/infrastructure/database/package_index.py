@@ -0,0 +1,134 @@
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    seq INTEGER PRIMARY KEY,
+    ip TEXT,
+    attack_type TEXT,
+    ts TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS packages_ip ON packages (ip);
+CREATE INDEX IF NOT EXISTS packages_attack_type ON packages (attack_type);
+CREATE INDEX IF NOT EXISTS packages_ts ON packages (ts);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class PackageIndex:
+    """
+    SQLite index over the packages JSONL log, so queries only touch the matching rows.
+
+    The JSONL file stays the source of truth and is only ever appended to (by any number of worker
+    processes). The index remembers how many bytes of it it has ingested and, before every query,
+    catches up with what was appended since; the first sync backfills an existing log. A log that
+    shrank or was replaced (rotation) is reindexed from scratch.
+    """
+    READ_BLOCK = 8 << 20
+
+    def __init__(self, log_path: str | Path, db_path: str | Path | None = None):
+        self.log_path = Path(log_path)
+        self.db_path = Path(db_path) if db_path else self.log_path.with_suffix('.sqlite3')
+        conn = self._connect()
+        try:
+            # WAL lets the dashboard read while another process is indexing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per call: Flask serves requests from several threads
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def sync(self) -> int:
+        """Index the lines appended to the log since the last sync. Returns how many packages were added."""
+        try:
+            stat = self.log_path.stat()
+        except FileNotFoundError:
+            return 0
+
+        conn = self._connect()
+        try:
+            # IMMEDIATE serializes concurrent syncs (other threads or processes) on the offset
+            conn.execute("BEGIN IMMEDIATE")
+            meta = {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM meta")}
+            offset = int(meta.get("offset", 0))
+            identity = f"{stat.st_dev}:{stat.st_ino}"
+            if stat.st_size < offset or meta.get("identity", identity) != identity:
+                logging.warning(f"{self.log_path} was truncated or replaced, rebuilding the package index")
+                conn.execute("DELETE FROM packages")
+                offset = 0
+
+            added = 0
+            with self.log_path.open('rb') as f:
+                f.seek(offset)
+                pending = b""
+                while offset + len(pending) < stat.st_size:
+                    block = f.read(min(self.READ_BLOCK, stat.st_size - offset - len(pending)))
+                    if not block:
+                        break
+                    pending += block
+                    # Only whole lines: a writer may be in the middle of appending the last one
+                    end = pending.rfind(b"\n") + 1
+                    rows = self._rows(pending[:end])
+                    conn.executemany("INSERT INTO packages (ip, attack_type, ts, data) VALUES (?, ?, ?, ?)", rows)
+                    added += len(rows)
+                    offset += end
+                    pending = pending[end:]
+
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [("offset", str(offset)), ("identity", identity)])
+            conn.execute("COMMIT")
+            return added
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _rows(chunk: bytes) -> List[Tuple]:
+        rows = []
+        for line in chunk.splitlines():
+            if not line.strip():
+                continue
+            try:
+                package = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping malformed package line: {line[:100]!r}")
+                continue
+            rows.append((package.get("ip"), package.get("attack_type"), package.get("timestamp"), line.decode('utf-8')))
+        return rows
+
+    def query(self, ip: str | None = None, attack_type: str | None = None, since: str | None = None, until: str | None = None,
+              limit: int = 100, cursor: int | None = None) -> Tuple[List[Dict], int | None]:
+        """
+        Newest packages first, filtered by exact `ip`/`attack_type` and an ISO 8601 `since`/`until` range
+        on their timestamp. Returns at most `limit` packages and the cursor of the next page (None on the
+        last page); pass it back as `cursor` to continue.
+        """
+        self.sync()
+
+        clauses, params = [], []
+        for column, value in (("ip = ?", ip), ("attack_type = ?", attack_type), ("ts >= ?", since), ("ts <= ?", until), ("seq < ?", cursor)):
+            if value is not None:
+                clauses.append(column)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT seq, data FROM packages {where} ORDER BY seq DESC LIMIT ?", (*params, limit + 1)).fetchall()
+        finally:
+            conn.close()
+
+        next_cursor = rows[limit - 1]["seq"] if len(rows) > limit else None
+        return [json.loads(row["data"]) for row in rows[:limit]], next_cursor
@@ -1,9 +1,10 @@
 import os
-from flask import Flask
+from flask import Flask, Response
 from werkzeug.serving import make_server
 from .controllers.package_controller import PackageController, package_blueprint
 from infrastructure.database.logstash_producer import db 
 from application.package_service import PackageService
+from domain.entities.loggers.registry import REGISTRY
 
 class WebServer:
 
@@ -17,7 +18,15 @@ class WebServer:
         package_blueprint.add_url_rule('/', view_func=self.__package_controller.render, methods=['GET'])
         package_blueprint.add_url_rule('/api/get_packages', view_func=self.__package_controller.get_packages, methods=['GET'])
         package_blueprint.add_url_rule('/api/new_model', view_func=self.__package_controller.post_model, methods=['POST'])
+        package_blueprint.add_url_rule('/api/model_status', view_func=self.__package_controller.get_model_status, methods=['GET'])
         self.__app.register_blueprint(package_blueprint, url_prefix='/', package_service=self.__package_service)
+        self.__app.add_url_rule('/metrics', view_func=self.__metrics, methods=['GET'])
+
+    def __metrics(self):
+        return Response(REGISTRY.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    def attach_model_reloader(self, model_reload_service):
+        self.__package_controller.attach_model_reloader(model_reload_service)
 
     def run(self):
         host = os.getenv("API_RUN_HOST", "0.0.0.0")
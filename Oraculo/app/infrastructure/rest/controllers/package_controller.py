@@ -1,24 +1,78 @@
-from flask import Blueprint, render_template
+from datetime import datetime
+from flask import Blueprint, jsonify, render_template, request
 from application.package_service import PackageService
+from application.model_reload_service import ModelReloadService
+from domain.entities.predictor import MLFlowModelConfig, PathModelConfig
 
 package_blueprint = Blueprint('package', __name__)
 
+MAX_PAGE_SIZE = 1000
+
 class PackageController:
 
-    def __init__(self, package_service: PackageService):
+    def __init__(self, package_service: PackageService, model_reload_service: ModelReloadService | None = None):
         self.__package_service = package_service
+        self.__model_reload_service = model_reload_service
+
+    def attach_model_reloader(self, model_reload_service: ModelReloadService):
+        self.__model_reload_service = model_reload_service
 
     def render(self):
-        packages = self.__package_service.get_packages()
+        # The page only needs to know whether there is anything to show; the list is fetched by index.js
+        packages, _ = self.__package_service.get_packages(limit=1)
         return render_template("index.html", packages=packages)
     
     def get_packages(self):
-        packages = self.__package_service.get_packages()
-        return packages
+        """
+        Newest packages first. Query args: ip, attack_type, since/until (ISO 8601), limit (1-1000,
+        default 100) and cursor. When more packages match, the X-Next-Cursor header holds the cursor
+        of the next page.
+        """
+        args = request.args
+        try:
+            limit = int(args.get("limit", 100))
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            cursor = int(args["cursor"]) if args.get("cursor") else None
+            since = datetime.fromisoformat(args["since"]) if args.get("since") else None
+            until = datetime.fromisoformat(args["until"]) if args.get("until") else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        packages, next_cursor = self.__package_service.get_packages(args.get("ip"), args.get("attack_type"), since, until, limit, cursor)
+        response = jsonify(packages)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return response
     
     def post_model(self):
-        # CHECK IF IT'S POSSIBLE TO LOG THE MODEL AS KERAS WRAPPER OR IF IT'S NECESSARY TO USE THE KERAS LOGGER
-        # WE ALSO NEED TO MODIFY THE BEHAVIOR OF PREDICTOR SO WE CAN CHANGE MODELS ON LIVE, LIKELY INJECTING A PREDICTOR
-        # REFERENCE HERE
-        pass
-        
\ No newline at end of file
+        """
+        Build a new model set in the background and hot-swap it in once calibrated.
+        The body selects either a directory (`base_path`) or an MLflow registered model
+        (`model_name` with `alias`, `stage` or `version`).
+        """
+        if self.__model_reload_service is None:
+            return jsonify({"error": "Model reloading is not available yet"}), 503
+
+        payload = request.get_json(silent=True) or {}
+        try:
+            if payload.get("base_path"):
+                config = PathModelConfig(base_path=payload["base_path"])
+            elif payload.get("model_name"):
+                fields = {k: payload[k] for k in ("model_name", "alias", "stage", "version") if k in payload}
+                if "stage" in fields or "version" in fields:
+                    fields.setdefault("alias", None)  # Don't let the default alias shadow an explicit selector
+                config = MLFlowModelConfig(**fields)
+            else:
+                return jsonify({"error": "'base_path' or 'model_name' is required"}), 400
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if not self.__model_reload_service.request_reload(config):
+            return jsonify({"error": "A model reload is already in progress"}), 409
+        return jsonify({"status": "reloading", "source": ModelReloadService.describe(config)}), 202
+
+    def get_model_status(self):
+        if self.__model_reload_service is None:
+            return jsonify({"error": "Model reloading is not available yet"}), 503
+        return jsonify(self.__model_reload_service.status)
@@ -1,6 +1,6 @@
 // Function to fetch and append new items
 function fetchAndAppendItems() {
-    fetch('/api/get_packages')  // Fetch data from the Flask route
+    fetch('/api/get_packages?limit=50')  // Fetch the newest packages from the Flask route
         .then(response => response.json())
         .then(data => {
             if(Object.keys(data).length === 0) return 
@@ -26,6 +26,11 @@ function fetchAndAppendItems() {
                 listItem.appendChild(h3);
                 listItem.appendChild(p1);
                 listItem.appendChild(p2);
+                if (item.count > 1) {
+                    const p3 = document.createElement('p');
+                    p3.textContent = `Ocorrências: ${item.count} (${item.first_seen} – ${item.last_seen})`;
+                    listItem.appendChild(p3);
+                }
                 itemList.appendChild(listItem);
             });
             // data.forEach(item => {
@@ -14,6 +14,14 @@ class Messenger(ABC):
     def receive_message(self, queue_name, callback):
         pass
 
+    @abstractmethod
+    def receive_batch(self, queue_name, callback, batch_size, linger_ms):
+        pass
+
+    @abstractmethod
+    def stop_consuming(self):
+        pass
+
     @abstractmethod
     def close_connection(self):
         pass
@@ -7,5 +7,17 @@ class PackageRepository(ABC):
         pass
 
     @abstractmethod
-    def create(self, package_data):
-        pass
\ No newline at end of file
+    def create(self, package_data, durable=False):
+        """
+        Store a package. With `durable`, returns a concurrent.futures.Future resolved once the package is
+        persisted (or failed if it can't be), or None when it already is by the time `create` returns.
+        """
+        pass
+
+    @abstractmethod
+    def query(self, ip=None, attack_type=None, since=None, until=None, limit=100, cursor=None):
+        pass
+
+    def flush(self):
+        """Block until writes accepted so far are persisted. Repositories that write synchronously have nothing to do."""
+        pass
@@ -1,4 +1,5 @@
 import logging
+import os
 import threading
 import signal
 import sys
@@ -6,17 +7,21 @@ import time
 
 from infrastructure.rest.app import WebServer
 from infrastructure.database.logstash_producer import db 
-from domain.entities.predictor import Predictor
+from domain.entities.predictor import MLFlowModelConfig, PathModelConfig, Predictor
 from infrastructure.adapters.message_broker import MessageBroker
 from infrastructure.adapters.pfsense_client import pfSenseClient
 from application.messenger_service import MessengerService
 from application.firewall_service import FirewallService
 from application.package_service import PackageService
 from application.classification_service import ClassificationService
+from application.model_reload_service import ModelReloadService
+from application.worker_pool import WorkerPool
 from config import URL_FIREWALL, FIREWALL_CLIENT_ID, FIREWALL_TOKEN_ID
+from domain.entities.loggers.registry import REGISTRY, MetricsPusher
 from domain.entities.loggers.terminal import apply_colored_formatter
 # from socket import ConnectionResetError
 
+flask_app = None
 
 
 def start_flask_app():
@@ -32,27 +37,77 @@ def stop_application():
         flask_app.stop()
     sys.exit(0)
 
-def initialize_services():
-    predictor = Predictor().build()
+def model_config():
+    return MLFlowModelConfig() if os.getenv("MODEL_SOURCE", "path").lower() == "mlflow" else PathModelConfig(base_path='data/models')
+
+def initialize_services(predictor: Predictor | None = None, attach_reloader: bool = True):
+    predictor = predictor or Predictor(model_config()).build()
 
     message_broker = MessageBroker()
     pfSense_client = pfSenseClient(URL_FIREWALL, FIREWALL_CLIENT_ID, FIREWALL_TOKEN_ID)
     classification_service = ClassificationService(predictor)
     firewall_service = FirewallService(pfSense_client)
-    package_service = PackageService(db)
+    package_service = PackageService(db, durable=message_broker.manual_ack)
     messenger_service = MessengerService(message_broker, classification_service, firewall_service, package_service)
+    if flask_app and attach_reloader:
+        flask_app.attach_model_reloader(ModelReloadService(classification_service))
     return messenger_service
 
 def main():
+    # Metrics are scraped from the web server's /metrics; pushing is optional in single-process mode
+    push_interval = float(os.getenv("METRICS_PUSH_INTERVAL_SECONDS", 0))
+    if push_interval > 0:
+        MetricsPusher(push_interval).start()
     messenger_service = initialize_services()
     messenger_service.consume_message('model-queue')
 
+def run_worker(predictor: Predictor):
+    """Entry point of a worker process forked by the WorkerPool."""
+    # Start from zero rather than from what the supervisor recorded before forking
+    REGISTRY.reset()
+    # Nobody scrapes the workers, so they always push their own registry
+    MetricsPusher(float(os.getenv("METRICS_PUSH_INTERVAL_SECONDS", 0)) or 15).start()
+    messenger_service = initialize_services(predictor, attach_reloader=False)
+    signal.signal(signal.SIGTERM, lambda signum, frame: messenger_service.stop())
+    messenger_service.consume_message('model-queue')
+
+def main_workers(n_workers: int):
+    # The workers are forked from the supervisor's models, which must be TFLite (checked in _main)
+    pool = WorkerPool(n_workers, model_config(), run_worker, share_models=True)
+
+    def stop_workers(signum, frame):
+        pool.stop()
+        stop_application()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    try:
+        pool.start()
+    except Exception:
+        # e.g. a missing or stale TFLite export; don't leave the web server running without consumers
+        if flask_app:
+            flask_app.stop()
+        raise
+    if flask_app:
+        flask_app.attach_model_reloader(pool)
+    pool.supervise()
+
 def _main():
+    n_workers = int(os.getenv("ORACULO_WORKERS", 1))
+    if n_workers > 1 and os.getenv("INFERENCE_BACKEND", "keras").lower() != "tflite":
+        # Keras models can't be shared across forks (TensorFlow isn't fork-safe), and a copy per worker
+        # multiplies the memory of the whole model set
+        raise SystemExit("ORACULO_WORKERS > 1 needs INFERENCE_BACKEND=tflite and a TFLite export of the models "
+                         "(python export_models.py); run a single worker with INFERENCE_BACKEND=keras")
+
     flask_app, flask_thread = start_flask_app()
 
     signal.signal(signal.SIGINT, stop_application)
 
-    main()
+    if n_workers > 1:
+        main_workers(n_workers)
+    else:
+        main()
     
 if __name__ == '__main__':
     # try:
@@ -5,15 +5,26 @@ from .calibration import GateCalibrator
 from .predictors import MoEPredictor
 from .evaluation import MoEEvaluator
 from .gating_strategies import GatingStrategy
-from .losses import FocalLoss
-from .trainers import MoETrainer
 
-# Optional: Define __all__ for explicit exports
+# The training helpers need TensorFlow, so they are imported on first access rather than here:
+# inference with INFERENCE_BACKEND=tflite must not load it
+_KERAS_EXPORTS = {
+    'FocalLoss': '.losses',
+    'MoETrainer': '.trainers',
+}
+
+
+def __getattr__(name):
+    if name in _KERAS_EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(_KERAS_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Optional: Define __all__ for explicit exports (star imports skip the TensorFlow-only names)
 __all__ = [
     'GateCalibrator',
     'MoEPredictor',
     'MoEEvaluator',
     'GatingStrategy',
-    'FocalLoss',
-    'MoETrainer',
 ]
\ No newline at end of file
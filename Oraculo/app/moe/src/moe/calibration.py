@@ -1,6 +1,16 @@
+import logging
+import os
+import tempfile
+import joblib
+import numpy as np
+import sklearn
+from scipy.special import expit
 from sklearn.calibration import CalibratedClassifierCV
+from sklearn.preprocessing import LabelEncoder
 from ..utils import KerasGateWrapper
 
+CALIBRATOR_ARTIFACT_VERSION = 1
+
 class GateCalibrator:
     def __init__(self, gate_model, classes, method='isotonic'):
         self.method = method
@@ -15,4 +25,207 @@ class GateCalibrator:
 
     def calibrate(self, X_calibrate, y_calibrate):
         self.calibrator.fit(X_calibrate, y_calibrate)
-        return self.calibrator
\ No newline at end of file
+        return self.calibrator
+
+
+class ClosedFormCalibrator:
+    """
+    The maps of a fitted `CalibratedClassifierCV` (cv='prefit') as plain NumPy arrays.
+
+    Isotonic calibration keeps each class's breakpoints (`X_thresholds_`, `y_thresholds_`), packed
+    into padded (n_classes, max_breakpoints) arrays; sigmoid calibration keeps the Platt
+    coefficients (a, b) per class. `calibrate` applies them to the whole gate output matrix at once
+    (only the breakpoint search runs per class) and renormalizes exactly like sklearn, without its
+    per-call validation and estimator plumbing.
+    """
+    def __init__(self, model, classes, method: str, class_indices: np.ndarray, maps: list):
+        self.model = model
+        self.classes_ = classes
+        self.method = method
+        self.class_indices = class_indices
+        self.maps = maps
+
+        if method == 'isotonic':
+            dtype = maps[0][0].dtype
+            lengths = np.array([len(x) for x, _, _, _ in maps])
+            width = lengths.max()
+            self._x = np.stack([np.pad(x.astype(dtype), (0, width - len(x)), mode='edge') for x, _, _, _ in maps])
+            self._y = np.stack([np.pad(y.astype(dtype), (0, width - len(y)), mode='edge') for _, y, _, _ in maps])
+            self._x_min = np.array([x_min for _, _, x_min, _ in maps], dtype=dtype)
+            self._x_max = np.array([x_max for _, _, _, x_max in maps], dtype=dtype)
+            self._last = np.maximum(lengths - 1, 1)
+            self._constant = lengths == 1
+            self._dtype = dtype
+        else:
+            self._a = np.array([a for a, _ in maps])
+            self._b = np.array([b for _, b in maps])
+
+    @classmethod
+    def from_sklearn(cls, calibrated: CalibratedClassifierCV, gate_model) -> 'ClosedFormCalibrator':
+        if len(calibrated.calibrated_classifiers_) != 1:
+            raise ValueError("Only calibrators fitted with cv='prefit' can be converted")
+        cc = calibrated.calibrated_classifiers_[0]
+        # Same column mapping as sklearn's _CalibratedClassifier.predict_proba
+        class_indices = LabelEncoder().fit(cc.classes).transform(cc.estimator.classes_)
+        if cc.method == 'isotonic':
+            maps = [(c.X_thresholds_, c.y_thresholds_, c.X_min_, c.X_max_) for c in cc.calibrators]
+            if len({x.dtype for x, _, _, _ in maps}) != 1:
+                raise ValueError("Isotonic calibrators were fitted with different dtypes")
+        elif cc.method == 'sigmoid':
+            maps = [(c.a_, c.b_) for c in cc.calibrators]
+        else:
+            raise ValueError(f"Unsupported calibration method: {cc.method}")
+        return cls(gate_model, calibrated.classes_, cc.method, class_indices, maps)
+
+    def _isotonic(self, T: np.ndarray) -> np.ndarray:
+        # Mirrors IsotonicRegression(out_of_bounds='clip').predict per column: clip, then linear interpolation
+        T = np.clip(T.astype(self._dtype, copy=False), self._x_min, self._x_max)
+        hi = np.empty(T.shape, dtype=np.intp)
+        for j, (x, _, _, _) in enumerate(self.maps):
+            hi[:, j] = np.searchsorted(x, T[:, j])
+        hi = np.clip(hi, 1, self._last)
+        lo = hi - 1
+        cols = np.arange(T.shape[1])
+        x_lo, y_lo = self._x[cols, lo], self._y[cols, lo]
+        slope = (self._y[cols, hi] - y_lo) / (self._x[cols, hi] - x_lo)
+        res = slope * (T - x_lo) + y_lo
+        if self._constant.any():
+            res[:, self._constant] = self._y[self._constant, 0]
+        return res
+
+    def _sigmoid(self, T: np.ndarray) -> np.ndarray:
+        # Same result dtype as sklearn's expit(-(a_ * T + b_)) with scalar coefficients
+        dtype = np.result_type(self.maps[0][0], T)
+        return expit(-(self._a.astype(dtype) * T.astype(dtype, copy=False) + self._b.astype(dtype)))
+
+    def calibrate(self, gate_probs: np.ndarray) -> np.ndarray:
+        """Calibrated probabilities for a (n_samples, n_classes) matrix of raw gate outputs."""
+        n_classes = len(self.classes_)
+        predictions = gate_probs[:, 1:] if n_classes == 2 else gate_probs
+        proba = np.zeros((len(gate_probs), n_classes))
+        # Binary gates have a single calibrator, for the positive class
+        columns = self.class_indices[:len(self.maps)]
+        if n_classes == 2:
+            columns = columns + 1
+        proba[:, columns] = self._isotonic(predictions) if self.method == 'isotonic' else self._sigmoid(predictions)
+
+        if n_classes == 2:
+            proba[:, 0] = 1.0 - proba[:, 1]
+        else:
+            denominator = np.sum(proba, axis=1)[:, np.newaxis]
+            uniform_proba = np.full_like(proba, 1 / n_classes)
+            proba = np.divide(proba, denominator, out=uniform_proba, where=denominator != 0)
+        proba[(1.0 < proba) & (proba <= 1.0 + 1e-5)] = 1.0
+        return proba
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.calibrate(self.model.predict(X, verbose=0))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return np.argmax(self.predict_proba(X), axis=1)
+
+
+class _IdentityModel:
+    def predict(self, X, verbose=0):
+        return X
+
+
+def to_closed_form(calibrated, gate_model, n_samples: int = 10000, atol: float = 1e-6, seed: int = 0):
+    """
+    Convert a fitted calibrator to `ClosedFormCalibrator` and check it against sklearn on random
+    probability rows plus every breakpoint and the [0, 1] bounds. Returns the sklearn calibrator
+    unchanged (with a warning) if it cannot be converted or the outputs disagree by more than `atol`.
+    """
+    if not isinstance(calibrated, CalibratedClassifierCV):
+        return calibrated
+    try:
+        closed_form = ClosedFormCalibrator.from_sklearn(calibrated, _IdentityModel())
+    except ValueError as e:
+        logging.warning(f"Keeping the sklearn calibrator: {e}")
+        return calibrated
+
+    n_classes = len(calibrated.classes_)
+    rng = np.random.default_rng(seed)
+    P = rng.dirichlet(np.full(n_classes, 0.3), size=n_samples)
+    if closed_form.method == 'isotonic':
+        edges = np.concatenate([params[0] for params in closed_form.maps] + [np.array([0.0, 1.0])])
+        P = np.vstack([P, np.repeat(edges[:, None], n_classes, axis=1)])
+    P = P.astype(np.float32)
+
+    # Feed the probability rows straight through the sklearn calibrator by swapping the gate for an identity
+    wrappers = _gate_wrappers(calibrated)
+    models = [w.model for w in wrappers]
+    for w in wrappers:
+        w.model = _IdentityModel()
+    try:
+        expected = calibrated.predict_proba(P)
+    finally:
+        for w, model in zip(wrappers, models):
+            w.model = model
+
+    error = float(np.max(np.abs(closed_form.calibrate(P) - expected)))
+    if error > atol:
+        logging.warning(f"Closed-form calibration deviates from sklearn by {error:.2e}, keeping the sklearn calibrator")
+        return calibrated
+    closed_form.model = gate_model
+    return closed_form
+
+
+def _gate_wrappers(calibrator) -> list:
+    """Every KerasGateWrapper referenced by a fitted calibrator (the wrapper itself when uncalibrated)."""
+    if isinstance(calibrator, KerasGateWrapper):
+        return [calibrator]
+    wrappers = [calibrator.estimator] + [cc.estimator for cc in getattr(calibrator, 'calibrated_classifiers_', [])]
+    return list({id(w): w for w in wrappers if isinstance(w, KerasGateWrapper)}.values())
+
+
+def save_calibrator(calibrator, path: str, key: dict):
+    """
+    Persist a fitted calibrator with the `key` (input hashes, method, classes) it was fitted for.
+    The gate model is detached before pickling, so the artifact only holds the calibration maps.
+    """
+    wrappers = _gate_wrappers(calibrator)
+    models = [w.model for w in wrappers]
+    for w in wrappers:
+        w.model = None
+    try:
+        artifact = {
+            'version': CALIBRATOR_ARTIFACT_VERSION,
+            'key': {**key, 'sklearn': sklearn.__version__},
+            'calibrator': calibrator,
+        }
+        # A unique temporary file per writer, so concurrent saves never write into each other's file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                joblib.dump(artifact, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    finally:
+        for w, model in zip(wrappers, models):
+            w.model = model
+
+
+def load_calibrator(path: str, gate_model, key: dict, ignore: tuple = ()):
+    """
+    Load a calibrator saved by `save_calibrator` and attach `gate_model` to it.
+    Returns None when there is no artifact or it was fitted for a different `key`;
+    entries named in `ignore` are left out of the comparison.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        artifact = joblib.load(path)
+    except Exception as e:
+        logging.warning(f"Could not read calibrator artifact {path}: {e}")
+        return None
+    expected = {k: v for k, v in {**key, 'sklearn': sklearn.__version__}.items() if k not in ignore}
+    saved = {k: v for k, v in (artifact.get('key') or {}).items() if k not in ignore}
+    if artifact.get('version') != CALIBRATOR_ARTIFACT_VERSION or saved != expected:
+        return None
+    calibrator = artifact['calibrator']
+    for w in _gate_wrappers(calibrator):
+        w.model = gate_model
+    return calibrator
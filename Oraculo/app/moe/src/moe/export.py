@@ -0,0 +1,159 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+from functools import lru_cache
+from typing import Dict
+
+
+@lru_cache(maxsize=None)
+def _interpreter_class():
+    """
+    The TFLite interpreter, imported on first use so Keras-only processes never load it. The standalone
+    runtimes (ai-edge-litert, shipped with the service, or the older tflite-runtime) are much lighter
+    than TensorFlow, which is only the last resort.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            logging.warning("Neither ai-edge-litert nor tflite-runtime is installed, loading TensorFlow for the TFLite interpreter")
+            from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_tflite(model, output_path: str) -> str:
+    """
+    Convert a Keras model to a float32 TFLite flatbuffer (no quantization, so outputs stay
+    numerically close to Keras) and write it to `output_path`.
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = []
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+
+def max_abs_error(keras_model, tflite_model: 'TFLiteModel', X: np.ndarray) -> float:
+    """Largest absolute difference between the Keras and TFLite outputs on `X`."""
+    expected = keras_model.predict(X, verbose=0)
+    return float(np.max(np.abs(expected - tflite_model.predict(X))))
+
+
+def export_models(gate_model_path: str, experts_models_path: Dict[str, str], output_dir: str,
+                  tolerance: float = 1e-4, n_samples: int = 4096) -> dict:
+    """
+    Export the gate and every expert to TFLite under `output_dir` (gate/, experts/<class>/) and verify
+    each one against its Keras original on standard-normal inputs (the scale the models see after
+    the StandardScaler). Writes and returns a `manifest.json` with the source hashes and errors.
+
+    Raises:
+        ValueError: if any exported model deviates from Keras by more than `tolerance`.
+    """
+    from tensorflow.keras.models import load_model
+
+    def export_one(source_path: str, target_dir: str) -> dict:
+        keras_model = load_model(source_path)
+        target_path = export_tflite(keras_model, os.path.join(output_dir, target_dir, os.path.splitext(os.path.basename(source_path))[0] + '.tflite'))
+        tflite_model = TFLiteModel(target_path)
+        X = np.random.default_rng(42).standard_normal((n_samples, tflite_model.n_features)).astype(np.float32)
+        error = max_abs_error(keras_model, tflite_model, X)
+        print(f"{source_path} -> {target_path} (max abs error {error:.2e})")
+        return {
+            'source_sha256': file_sha256(source_path),
+            'path': os.path.relpath(target_path, output_dir),
+            'max_abs_error': error,
+        }
+
+    manifest = {
+        'format': 'tflite',
+        'tolerance': tolerance,
+        'gate': export_one(gate_model_path, 'gate'),
+        'experts': {name: export_one(path, os.path.join('experts', name)) for name, path in experts_models_path.items()},
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    failed = [name for name, entry in [('gate', manifest['gate']), *manifest['experts'].items()] if entry['max_abs_error'] > tolerance]
+    if failed:
+        raise ValueError(f"TFLite export deviates from Keras by more than {tolerance} for: {', '.join(failed)}")
+    return manifest
+
+
+class TFLiteModel:
+    """
+    Serves a TFLite model behind the subset of the Keras API used by the predictors (`predict`).
+
+    Inputs are padded up to power-of-two batch buckets (1, 2, 4, ... `max_batch_size`). Each bucket
+    gets its own interpreter whose tensors are allocated once, together with a reusable input
+    buffer, so steady-state inference neither resizes tensors nor allocates input arrays.
+    Interpreters are created lazily and per process: a forked worker builds its own instead of
+    sharing the parent's native state.
+    """
+    def __init__(self, model_path: str, max_batch_size: int = 1024, num_threads: int | None = None):
+        self.model_path = model_path
+        self.max_batch_size = 1 << max(int(max_batch_size) - 1, 0).bit_length()
+        self.num_threads = num_threads
+        with open(model_path, 'rb') as f:
+            self._model_content = f.read()
+        self.size_bytes = len(self._model_content)
+
+        probe = _interpreter_class()(model_content=self._model_content)
+        input_details = probe.get_input_details()[0]
+        self.n_features = int(input_details['shape'][-1])
+        self.input_dtype = input_details['dtype']
+        self.output_shape = tuple(int(d) for d in probe.get_output_details()[0]['shape'][1:])
+
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._buckets: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, n: int):
+        size = 1 << max(n - 1, 0).bit_length()
+        if size not in self._buckets:
+            interpreter = _interpreter_class()(model_content=self._model_content, num_threads=self.num_threads)
+            input_index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(input_index, [size, self.n_features], strict=False)
+            interpreter.allocate_tensors()
+            buffer = np.zeros((size, self.n_features), dtype=self.input_dtype)
+            self._buckets[size] = (interpreter, input_index, interpreter.get_output_details()[0]['index'], buffer)
+        return self._buckets[size]
+
+    def _invoke(self, X: np.ndarray) -> np.ndarray:
+        n = len(X)
+        interpreter, input_index, output_index, buffer = self._bucket(n)
+        buffer[:n] = X
+        buffer[n:] = 0
+        interpreter.set_tensor(input_index, buffer)
+        interpreter.invoke()
+        return interpreter.get_tensor(output_index)[:n].copy()
+
+    def predict(self, X: np.ndarray, verbose: int = 0, **kwargs) -> np.ndarray:
+        X = np.asarray(X, dtype=self.input_dtype).reshape(-1, self.n_features)
+        if len(X) == 0:
+            return np.zeros((0, *self.output_shape), dtype=np.float32)
+        if self._pid != os.getpid():
+            # Forked worker: never reuse interpreters or a lock inherited from the parent
+            self._reset()
+        with self._lock:
+            return np.concatenate([
+                self._invoke(X[i:i + self.max_batch_size]) for i in range(0, len(X), self.max_batch_size)
+            ])
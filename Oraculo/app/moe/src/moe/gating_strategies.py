@@ -17,4 +17,27 @@ class GatingStrategy:
     def top_k(gate_probs: np.ndarray, classes: List[str], k: int) -> List[Tuple[str, float]]:
         """Top-K expert selection"""
         top_k_indices = np.argsort(gate_probs)[-k:]
-        return [(classes[idx], gate_probs[idx]) for idx in top_k_indices if gate_probs[idx] > 0]
\ No newline at end of file
+        return [(classes[idx], gate_probs[idx]) for idx in top_k_indices if gate_probs[idx] > 0]
+
+    @staticmethod
+    def hard_batch(gate_probs: np.ndarray) -> np.ndarray:
+        """Hard gating over a (n_samples, n_classes) matrix - index of the selected expert per sample"""
+        return np.argmax(gate_probs, axis=1)
+
+    @staticmethod
+    def soft_batch(gate_probs: np.ndarray, threshold: float) -> np.ndarray:
+        """Soft gating over a (n_samples, n_classes) matrix - boolean mask of the selected experts"""
+        return gate_probs >= threshold
+
+    @staticmethod
+    def top_k_batch(gate_probs: np.ndarray, k: int) -> np.ndarray:
+        """Top-K selection over a (n_samples, n_classes) matrix - boolean mask of the selected experts.
+        Uses argpartition, so ties at the k-th probability may pick a different expert than `top_k`."""
+        n_classes = gate_probs.shape[1]
+        if k >= n_classes:
+            mask = np.ones(gate_probs.shape, dtype=bool)
+        else:
+            mask = np.zeros(gate_probs.shape, dtype=bool)
+            if k > 0:
+                np.put_along_axis(mask, np.argpartition(gate_probs, -k, axis=1)[:, -k:], True, axis=1)
+        return mask & (gate_probs > 0)
@@ -0,0 +1,102 @@
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+class FusedMoEGraph:
+    """
+    Runs every expert (and optionally the gate) over a batch in a single compiled call.
+
+    All experts are traced into one `tf.function`, so a batch pays one graph
+    dispatch instead of one Keras `.predict()` per expert. Every expert sees
+    every sample; the gating strategies then pick the scores they need from
+    the resulting `(n_samples, n_experts)` matrix.
+    """
+    def __init__(self, expert_models: Dict[str, object], classes: List[str], gate_model=None):
+        # Imported here so the combine functions below don't need TensorFlow
+        import tensorflow as tf
+
+        self._tf = tf
+        self.classes = classes
+        self.gate_model = gate_model
+        self._experts = [expert_models[cls_name] for cls_name in classes]
+        self._forward = tf.function(self._call, reduce_retracing=True)
+
+    def _call(self, x):
+        tf = self._tf
+        scores = tf.concat([tf.reshape(expert(x, training=False), (-1, 1)) for expert in self._experts], axis=1)
+        if self.gate_model is None:
+            return scores
+        return self.gate_model(x, training=False), scores
+
+    def __call__(self, X: np.ndarray) -> Tuple[np.ndarray | None, np.ndarray]:
+        """Returns `(gate_probs, expert_scores)`; `gate_probs` is None when the gate is not fused."""
+        outputs = self._forward(self._tf.convert_to_tensor(X, dtype=self._tf.float32))
+        if self.gate_model is None:
+            return None, outputs.numpy()
+        gate_probs, scores = outputs
+        return gate_probs.numpy(), scores.numpy()
+
+
+def _sequential_row_sum(values: np.ndarray) -> np.ndarray:
+    # Accumulate column by column, in class order, to reproduce the rounding of Python's sum() over a dict.
+    # That sum promotes the float32 expert scores to float64, so callers pass float64 values.
+    total = np.zeros(values.shape[0], dtype=values.dtype)
+    for j in range(values.shape[1]):
+        total += values[:, j]
+    return total
+
+
+def _normalize(scores: np.ndarray, selected: np.ndarray) -> np.ndarray:
+    masked = np.where(selected, scores, 0).astype(scores.dtype)
+    total = _sequential_row_sum(masked)
+    positive = total > 0
+    norm = masked.copy()
+    norm[positive] = masked[positive] / total[positive, None]
+    return norm
+
+
+def _best_selected(norm: np.ndarray, selected: np.ndarray) -> np.ndarray:
+    # argmax over the selected experts only; ties resolve to the first class, like max() over a dict
+    return np.where(selected, norm, -np.inf).argmax(axis=1)
+
+
+def soft_combine(gate_probs: np.ndarray, scores: np.ndarray, selected: np.ndarray, classes: List[str]) -> List[Tuple[str, float]]:
+    """
+    Soft strategy: normalize the selected experts' scores and keep the best one.
+    Samples with no selected expert fall back to the gate's argmax with zero confidence.
+    """
+    norm = _normalize(scores.astype(np.float64), selected)
+    best = _best_selected(norm, selected)
+    confidence = norm[np.arange(len(norm)), best]
+    fallback = np.argmax(gate_probs, axis=1)
+    any_selected = selected.any(axis=1)
+    return [
+        (classes[b], c) if has_expert else (classes[f], 0.0)
+        for b, c, f, has_expert in zip(best, confidence, fallback, any_selected)
+    ]
+
+
+def top_k_combine(scores: np.ndarray, selected: np.ndarray, classes: List[str]) -> List[Tuple[str, float]]:
+    """
+    Top-k strategy: normalize the queried experts' scores and keep the best one.
+    Samples with no queried expert are 'Unknown'.
+    """
+    norm = _normalize(scores.astype(np.float64), selected)
+    best = _best_selected(norm, selected)
+    confidence = norm[np.arange(len(norm)), best]
+    any_selected = selected.any(axis=1)
+    return [
+        (classes[b], float(c)) if has_expert else ('Unknown', 0.0)
+        for b, c, has_expert in zip(best, confidence, any_selected)
+    ]
+
+
+def hard_combine(expert_idx: np.ndarray, scores: np.ndarray, classes: List[str], threshold: float = 0.5) -> List[Tuple[str, float]]:
+    """
+    Hard strategy: the routed expert's probability decides between its class and 'Unknown' (with 1 - p).
+    `scores` holds one score per sample, from the expert in `expert_idx`.
+    """
+    return [
+        [classes[idx], p] if p >= threshold else ['Unknown', 1.0 - p]
+        for idx, p in zip(expert_idx, scores.astype(np.float64).tolist())
+    ]
@@ -1,21 +1,49 @@
+import sys
 import numpy as np
+from contextlib import nullcontext
 from tqdm import tqdm
-import tensorflow as tf
 from typing import List, Dict, Tuple
 from .gating_strategies import GatingStrategy
-import numpy as np
-from tqdm import tqdm
-import tensorflow as tf
+from .inference import FusedMoEGraph, hard_combine, soft_combine, top_k_combine
+from .calibration import ClosedFormCalibrator
+from ..utils import KerasGateWrapper
+
+
+class _NoTracer:
+    """Default tracer: every span is a shared no-op context."""
+    _span = nullcontext()
+
+    def span(self, stage: str, rows: int | None = None):
+        return self._span
+
 
 class MoEPredictor:
-    def __init__(self, calibrator, expert_models: Dict[str, object], classes: List[str]):
+    def __init__(self, calibrator, expert_models: Dict[str, object], classes: List[str], fused: bool = False,
+                 gate_confidence_bound: float | None = None, tracer=None):
         self.calibrator = calibrator
         self.expert_models = expert_models
         self.classes = classes
 
-        # Suppress TensorFlow verbose output
-        tf.get_logger().setLevel('ERROR')
-        tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
+        # Anything with a `span(stage, rows)` context factory; times the gate, calibration, routing,
+        # each expert and the final combination
+        self.tracer = tracer or _NoTracer()
+
+        # Samples whose top calibrated gate probability reaches the bound skip the experts entirely
+        self.gate_confidence_bound = gate_confidence_bound
+        self.last_gate_skipped = 0
+
+        # Uncalibrated and closed-form calibrated gates run inside the fused graph;
+        # sklearn calibrators still go through their own predict_proba
+        self.fused_graph = None
+        if fused:
+            gate_model = calibrator.model if isinstance(calibrator, (KerasGateWrapper, ClosedFormCalibrator)) else None
+            self.fused_graph = FusedMoEGraph(expert_models, classes, gate_model)
+
+        # Suppress TensorFlow verbose output, without importing it for TFLite-only models
+        if 'tensorflow' in sys.modules:
+            tf = sys.modules['tensorflow']
+            tf.get_logger().setLevel('ERROR')
+            tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
 
     def predict(self, X_input: np.ndarray, strategy: str = 'soft', threshold: float = 0.1, batch_size: int = 32, **kwargs) -> List[str]:
         """
@@ -24,7 +52,51 @@ class MoEPredictor:
         Args:
             batch_size: Number of samples to process at once.
         """
-        gate_probs = self.calibrator.predict_proba(X_input)
+        self.last_gate_skipped = 0
+        if self.gate_confidence_bound is not None:
+            return self._gate_bounded_predict(X_input, strategy, threshold, batch_size, **kwargs)
+        if self.fused_graph is not None:
+            return self._fused_predict(X_input, strategy, threshold, batch_size, **kwargs)
+        return self._experts_predict(X_input, self._gate_probs(X_input), strategy, threshold, batch_size, **kwargs)
+
+    def _gate_probs(self, X: np.ndarray) -> np.ndarray:
+        """Calibrated gate probabilities, timing the gate forward pass apart from a closed-form calibration."""
+        if isinstance(self.calibrator, ClosedFormCalibrator):
+            with self.tracer.span("gate", len(X)):
+                raw = self.calibrator.model.predict(X, verbose=0)
+            with self.tracer.span("calibration", len(X)):
+                return self.calibrator.calibrate(raw)
+        # sklearn calibrators run the gate and the calibration in one call
+        with self.tracer.span("gate", len(X)):
+            return self.calibrator.predict_proba(X)
+
+    def _gate_bounded_predict(self, X_input: np.ndarray, strategy: str, threshold: float, batch_size: int, **kwargs) -> List[Tuple[str, float]]:
+        """
+        Emit the gate's decision, with its calibrated probability as confidence, for every sample
+        whose top gate probability reaches `gate_confidence_bound`; only the rest go to the experts.
+        """
+        if strategy not in ('hard', 'soft', 'top_k'):
+            raise ValueError(f"Unknown strategy: {strategy}")
+
+        gate_probs = self._gate_probs(X_input)
+        gate_idx = GatingStrategy.hard_batch(gate_probs)
+        gate_conf = gate_probs[np.arange(len(gate_probs)), gate_idx]
+        confident = gate_conf >= self.gate_confidence_bound
+        predictions = [(self.classes[idx], float(p)) for idx, p in zip(gate_idx, gate_conf)]
+
+        rows = np.flatnonzero(~confident)
+        if rows.size:
+            if self.fused_graph is not None:
+                expert_preds = self._fused_predict(X_input[rows], strategy, threshold, batch_size, gate_probs=gate_probs[rows], **kwargs)
+            else:
+                expert_preds = self._experts_predict(X_input[rows], gate_probs[rows], strategy, threshold, batch_size, **kwargs)
+            for row, pred in zip(rows, expert_preds):
+                predictions[row] = pred
+
+        self.last_gate_skipped = int(confident.sum())
+        return predictions
+
+    def _experts_predict(self, X_input: np.ndarray, gate_probs: np.ndarray, strategy: str, threshold: float, batch_size: int, **kwargs) -> List[Tuple[str, float]]:
         predictions = []
         
         # Process in batches
@@ -34,13 +106,7 @@ class MoEPredictor:
             
             # Batch predictions for all experts
             if strategy == 'hard':
-                expert_names = [
-                    GatingStrategy.hard(prob, self.classes) for prob in batch_probs
-                ]
-                batch_preds = [
-                    self._hard_predict(x, expert_name)
-                    for x, expert_name in zip(batch_X, expert_names)
-                ]
+                batch_preds = self._batch_hard_predict(batch_X, batch_probs)
             elif strategy == 'soft':
                 batch_preds = self._batch_soft_predict(batch_X, batch_probs, threshold)
             elif strategy == 'top_k':
@@ -52,45 +118,77 @@ class MoEPredictor:
         
         return predictions
 
+    def _fused_predict(self, X_input: np.ndarray, strategy: str, threshold: float, batch_size: int,
+                       gate_probs: np.ndarray | None = None, **kwargs) -> List[Tuple[str, float]]:
+        """
+        Predict with the fused graph: one compiled call per batch for all experts (and the gate when
+        uncalibrated), then vectorized gating and normalization over the whole batch.
+        Precomputed `gate_probs` take precedence over the graph's gate.
+        """
+        if strategy not in ('hard', 'soft', 'top_k'):
+            raise ValueError(f"Unknown strategy: {strategy}")
+
+        predictions = []
+        for i in range(0, len(X_input), batch_size):
+            batch_X = X_input[i:i+batch_size]
+            with self.tracer.span("fused_graph", len(batch_X)):
+                batch_probs, scores = self.fused_graph(batch_X)
+            if gate_probs is not None:
+                batch_probs = gate_probs[i:i+batch_size]
+            elif batch_probs is None:
+                batch_probs = self._gate_probs(batch_X)
+            elif isinstance(self.calibrator, ClosedFormCalibrator):
+                with self.tracer.span("calibration", len(batch_X)):
+                    batch_probs = self.calibrator.calibrate(batch_probs)
+
+            with self.tracer.span("combine", len(batch_X)):
+                if strategy == 'hard':
+                    expert_idx = GatingStrategy.hard_batch(batch_probs)
+                    predictions.extend(hard_combine(expert_idx, scores[np.arange(len(scores)), expert_idx], self.classes))
+                elif strategy == 'soft':
+                    predictions.extend(soft_combine(batch_probs, scores, GatingStrategy.soft_batch(batch_probs, threshold), self.classes))
+                else:
+                    predictions.extend(top_k_combine(scores, GatingStrategy.top_k_batch(batch_probs, kwargs.get('k', 2)), self.classes))
+        return predictions
+
+    def _route(self, X: np.ndarray, selected: np.ndarray) -> np.ndarray:
+        """
+        Run each expert once on the samples routed to it by the (n_samples, n_experts) `selected` mask.
+        Returns the raw expert scores, zero where an expert was not queried.
+        """
+        scores = np.zeros(selected.shape, dtype=np.float32)
+        for j, cls_name in enumerate(self.classes):
+            rows = np.flatnonzero(selected[:, j])
+            if rows.size:
+                with self.tracer.span(f"expert.{cls_name}", rows.size):
+                    scores[rows, j] = self.expert_models[cls_name].predict(X[rows], verbose=0)[:, 0]
+        return scores
+
     def _batch_soft_predict(self, X: np.ndarray, gate_probs: np.ndarray, threshold: float) -> List[Tuple[str, float]]:
         """
         Perform batch predictions using the soft strategy.
         Returns a list of (predicted_label, confidence) tuples.
         """
-        expert_inputs = {cls_name: [] for cls_name in self.classes}
-        input_indices = {cls_name: [] for cls_name in self.classes}
-        
-        # Collect inputs for each expert
-        for idx, (x, probs) in enumerate(zip(X, gate_probs)):
-            experts = GatingStrategy.soft(probs, self.classes, threshold)
-            for cls_name, _ in experts:
-                expert_inputs[cls_name].append(x)
-                input_indices[cls_name].append(idx)
-        
-        # Perform batch predictions for each expert
-        aggregated_scores = [{} for _ in range(len(X))]
-        for cls_name, inputs in expert_inputs.items():
-            if inputs:
-                preds = self.expert_models[cls_name].predict(np.array(inputs), verbose=0)
-                for i, pred in zip(input_indices[cls_name], preds):
-                    aggregated_scores[i][cls_name] = pred[0]  # raw score
-        
-        # Normalize scores and pick class with highest score + confidence
-        predictions = []
-        for idx, scores in enumerate(aggregated_scores):
-            # total_weight = sum(scores.values())
-            # if total_weight > 0:
-            #     scores = {cls: val / total_weight for cls, val in scores.items()}
-            scores = self._normalize_scores(scores)
-            if scores:
-                best_class = max(scores, key=scores.get)
-                confidence = scores[best_class]
-                predictions.append((best_class, confidence))
-            else:
-                fallback_class = self.classes[np.argmax(gate_probs[idx])]
-                predictions.append((fallback_class, 0.0))
-        return predictions
+        with self.tracer.span("routing", len(X)):
+            selected = GatingStrategy.soft_batch(gate_probs, threshold)
+        scores = self._route(X, selected)
+        with self.tracer.span("combine", len(X)):
+            return soft_combine(gate_probs, scores, selected, self.classes)
+
 
+    def _batch_hard_predict(self, X: np.ndarray, gate_probs: np.ndarray, threshold: float = 0.5) -> List[Tuple[str, float]]:
+        """
+        Perform batch predictions using the hard strategy.
+        Samples are grouped by their argmax expert and each expert runs once on its group.
+        Same semantics as `_hard_predict`: [expert_name, p] if p >= threshold, else ['Unknown', 1 - p].
+        """
+        with self.tracer.span("routing", len(X)):
+            expert_idx = GatingStrategy.hard_batch(gate_probs)
+            selected = np.zeros(gate_probs.shape, dtype=bool)
+            selected[np.arange(len(expert_idx)), expert_idx] = True
+        scores = self._route(X, selected)
+        with self.tracer.span("combine", len(X)):
+            return hard_combine(expert_idx, scores[np.arange(len(expert_idx)), expert_idx], self.classes, threshold)
 
     def _hard_predict(self, x: np.ndarray, expert_name: str, threshold: float = 0.5) -> Tuple[str, float]:
         """
@@ -112,39 +210,8 @@ class MoEPredictor:
         Returns a list of (predicted_label, confidence), where confidence
         is the normalized score among the experts queried for that sample.
         """
-        expert_inputs = {cls_name: [] for cls_name in self.classes}
-        input_indices = {cls_name: [] for cls_name in self.classes}
-        
-        # Collect inputs for top-k experts
-        for idx, (x, probs) in enumerate(zip(X, gate_probs)):
-            experts = GatingStrategy.top_k(probs, self.classes, k)
-            for cls_name, _ in experts:
-                expert_inputs[cls_name].append(x)
-                input_indices[cls_name].append(idx)
-        
-        # Perform batch predictions for each expert
-        aggregated_scores = [{} for _ in range(len(X))]
-        for cls_name, inputs in expert_inputs.items():
-            if inputs:
-                preds = self.expert_models[cls_name].predict(np.array(inputs), verbose=0)
-                for i, pred in zip(input_indices[cls_name], preds):
-                    aggregated_scores[i][cls_name] = float(pred[0])  # raw score from this expert
-        
-        # Pick best class and include confidence
-        predictions: List[Tuple[str, float]] = []
-        for scores in aggregated_scores:
-            # scores = self._normalize_scores(scores)
-            if scores:
-                total = sum(scores.values())
-                norm = {c: (v / total) for c, v in scores.items()} if total > 0 else scores
-                best = max(norm, key=norm.get)
-                predictions.append((best, float(norm[best])))
-            else:
-                predictions.append(('Unknown', 0.0))
-        return predictions
-
-    def _normalize_scores(self, scores: dict) -> dict:
-        total = sum(scores.values())
-        if total > 0:
-            return {cls: val / total for cls, val in scores.items()}
-        return scores
+        with self.tracer.span("routing", len(X)):
+            selected = GatingStrategy.top_k_batch(gate_probs, k)
+        scores = self._route(X, selected)
+        with self.tracer.span("combine", len(X)):
+            return top_k_combine(scores, selected, self.classes)
@@ -1,8 +1,5 @@
-from tensorflow.keras import backend as K
-import tensorflow as tf 
 import glob
 import os
-from tensorflow.keras.models import load_model
 from sklearn.base import BaseEstimator, ClassifierMixin
 import numpy as np
 import pandas as pd
@@ -26,6 +23,8 @@ class KerasGateWrapper(BaseEstimator, ClassifierMixin):
         return np.argmax(self.predict_proba(X), axis=1)
 
 def load_expert_models(model_dir, classes):
+    from tensorflow.keras.models import load_model
+
     expert_models = {}
     for cls in classes:
         pattern = os.path.join(model_dir, f"model_*_{cls}.h5")
@@ -43,6 +42,8 @@ def load_expert_models(model_dir, classes):
     return expert_models
 
 def f2_score(y_true, y_pred):
+    from tensorflow.keras import backend as K
+
     beta = 2
     y_pred = K.round(y_pred)
     # Cast y_true and y_pred to float32
@@ -58,6 +59,9 @@ def f2_score(y_true, y_pred):
     return f2
 
 def multi_f2_score(y_true, y_pred):
+    import tensorflow as tf
+    from tensorflow.keras import backend as K
+
     beta = 2
     # Ensure y_true is rank 1 (squeeze if it's shape [batch, 1])
     if len(y_true.shape) == 2 and y_true.shape[-1] == 1:
@@ -0,0 +1,27 @@
+"""
+Publish the model set under the models directory to the MLflow model registry.
+
+Builds the Predictor first so the fitted calibrator is persisted next to the models, then registers
+gate, experts, scaler and calibrator (with their sha256 manifest) as a new version of --model-name
+and moves --alias to it. Serve it with MODEL_SOURCE=mlflow.
+
+Usage (from Oraculo/app):
+    python publish_model.py --base-path data/models --model-name oraculo-moe --alias production
+"""
+import argparse
+import os
+
+from domain.entities.predictor import PathModelConfig, Predictor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-path', default='data/models')
+    parser.add_argument('--model-name', default=os.getenv("MLFLOW_MODEL_NAME", "oraculo-moe"))
+    parser.add_argument('--alias', default=os.getenv("MLFLOW_MODEL_ALIAS", "production"))
+    parser.add_argument('--tracking-uri', default=os.getenv("MLFLOW_TRACKING_URI"))
+    args = parser.parse_args()
+
+    predictor = Predictor(PathModelConfig(base_path=args.base_path)).build()
+    version = predictor.publish_to_mlflow(args.model_name, args.alias, args.tracking_uri)
+    print(f"Published {args.base_path} as {args.model_name} version {version} (alias: {args.alias})")
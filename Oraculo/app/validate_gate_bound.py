@@ -0,0 +1,33 @@
+"""
+Quantify the gate-confidence fast path (GATE_CONFIDENCE_BOUND) on the calibration parquet.
+
+For each bound, prints accuracy, agreement with the full MoE, the share of samples that
+skipped the experts and throughput, so a bound can be chosen before enabling it.
+
+Usage (from Oraculo/app):
+    python validate_gate_bound.py --bounds 0.9 0.95 0.99 0.999 --sample-size 200000
+"""
+import argparse
+import os
+
+from domain.entities.predictor import Predictor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bounds', type=float, nargs='+', default=[0.9, 0.95, 0.99, 0.999])
+    parser.add_argument('--strategy', default=os.getenv("GATING_METHOD", 'soft'), choices=['hard', 'soft', 'top_k'])
+    parser.add_argument('--threshold', type=float, default=0.1, help='soft gating threshold')
+    parser.add_argument('--k', type=int, default=2, help='experts per sample for top_k')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--sample-size', type=int, default=None, help='random subsample of the calibration data')
+    args = parser.parse_args()
+
+    predictor = Predictor().build()
+    results = predictor.validate_gate_bound(args.bounds, strategy=args.strategy, threshold=args.threshold,
+                                            batch_size=args.batch_size, sample_size=args.sample_size, k=args.k)
+
+    print(f"{'bound':>8} {'accuracy':>9} {'agreement':>10} {'skip rate':>10} {'samples/s':>11}")
+    for row in results:
+        bound = 'off' if row['bound'] is None else f"{row['bound']:g}"
+        print(f"{bound:>8} {row['accuracy']:>9.4f} {row['agreement']:>10.4f} {row['skip_rate']:>10.2%} {row['samples_per_sec']:>11.1f}")
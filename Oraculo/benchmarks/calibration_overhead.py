@@ -0,0 +1,73 @@
+"""
+Per-call overhead of gate calibration: sklearn CalibratedClassifierCV vs ClosedFormCalibrator.
+
+Both calibrators are fitted on the same synthetic gate (a fixed softmax layer in NumPy, so the
+gate itself costs the same on both paths) and timed on identical batches.
+
+Usage (from the Oraculo directory):
+    python benchmarks/calibration_overhead.py --method isotonic --batch-sizes 1 64 1024 8192
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from moe.src.moe.calibration import GateCalibrator, to_closed_form  # noqa: E402
+
+N_FEATURES = 78
+
+
+class SoftmaxGate:
+    """Stand-in for the Keras gate: a fixed random linear layer followed by softmax."""
+    def __init__(self, n_classes: int, seed: int = 42):
+        self.W = np.random.default_rng(seed).normal(scale=0.3, size=(N_FEATURES, n_classes)).astype(np.float32)
+
+    def predict(self, X, verbose=0):
+        z = np.asarray(X, dtype=np.float32) @ self.W
+        z = np.exp(z - z.max(axis=1, keepdims=True))
+        return z / z.sum(axis=1, keepdims=True)
+
+
+def per_call_seconds(fn, X, min_time: float) -> float:
+    fn(X)  # warm-up
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default='isotonic', choices=['isotonic', 'sigmoid'])
+    parser.add_argument('--n-classes', type=int, default=15)
+    parser.add_argument('--n-calibration', type=int, default=50000, help='synthetic calibration rows')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64, 512, 4096, 8192])
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds spent timing each case')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    gate = SoftmaxGate(args.n_classes)
+    X_cal = rng.standard_normal((args.n_calibration, N_FEATURES)).astype(np.float32)
+    y_cal = gate.predict(X_cal).argmax(axis=1)
+    noisy = rng.random(len(y_cal)) < 0.2
+    y_cal[noisy] = rng.integers(0, args.n_classes, noisy.sum())
+
+    sklearn_calibrator = GateCalibrator(gate, list(range(args.n_classes)), method=args.method).calibrate(X_cal, y_cal)
+    closed_form = to_closed_form(sklearn_calibrator, gate)
+    if closed_form is sklearn_calibrator:
+        sys.exit("Closed-form conversion failed verification, see the warning above")
+
+    print(f"{'batch':>6} {'sklearn us/call':>16} {'closed-form us/call':>20} {'speedup':>8} {'max abs diff':>13}")
+    for batch_size in args.batch_sizes:
+        X = rng.standard_normal((batch_size, N_FEATURES)).astype(np.float32)
+        diff = np.max(np.abs(sklearn_calibrator.predict_proba(X) - closed_form.predict_proba(X)))
+        t_sklearn = per_call_seconds(sklearn_calibrator.predict_proba, X, args.min_time)
+        t_closed = per_call_seconds(closed_form.predict_proba, X, args.min_time)
+        print(f"{batch_size:>6} {t_sklearn * 1e6:>16.1f} {t_closed * 1e6:>20.1f} {t_sklearn / t_closed:>7.1f}x {diff:>13.1e}")
@@ -0,0 +1,323 @@
+"""
+End-to-end benchmark of the classification path: broker delivery -> MessengerService ->
+ClassificationService -> Predictor -> PackageService -> PersistentLogstashProducer.
+
+Flows are replayed from a CICIDS2018 parquet (--data) or, without one, drawn as synthetic vectors
+with the scaler's feature count and per-feature mean/scale. They are published to an in-process
+broker (benchmarks/inprocess_broker.py) and consumed by the real services with the real models.
+Logstash is a local TCP sink. With --firewall, blocks go to a local mock pfSense
+(benchmarks/mock_pfsense.py).
+
+Each gating strategy x batch size case reports:
+- throughput, in flows/s;
+- p50/p90/p99/max latency per message;
+- process CPU, as cores used and CPU ms per 1000 flows;
+- RSS at the end of the case, and peak RSS.
+
+Latency runs from dequeue to the message's callback returning. With --rate it runs from publish, so
+it also includes queueing. With --trace, every message is traced (see tracing.py) and each case also
+reports the mean time and call count per stage.
+
+Results are written as JSON to --output. With --baseline, the cases are compared against an earlier
+result file, and the exit status is 1 if throughput dropped by more than --max-regression.
+
+Usage (from the Oraculo directory):
+    python benchmarks/end_to_end.py --strategies hard soft top_k --batch-sizes 1 64 512 -n 5000
+    python benchmarks/end_to_end.py --baseline benchmarks/results/e2e-<commit>.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+ORACULO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ORACULO_DIR / "app"))
+sys.path.insert(0, str(ORACULO_DIR / "benchmarks"))
+
+QUEUE = 'model-queue'
+# Settings that change what is being measured, recorded with every result file
+RECORDED_ENV = ["INFERENCE_BACKEND", "MOE_FUSED_INFERENCE", "CALIBRATION_METHOD", "CALIBRATION_RUNTIME",
+                "GATE_CONFIDENCE_BOUND", "PREDICTION_CACHE_SIZE", "VERDICT_WINDOW_SECONDS", "EXPERT_CACHE_SIZE",
+                "TFLITE_NUM_THREADS", "TFLITE_MAX_BATCH_SIZE", "OMP_NUM_THREADS"]
+
+
+class _Sink(socketserver.BaseRequestHandler):
+    def handle(self):
+        while self.request.recv(1 << 16):
+            pass
+
+
+def start_logstash_sink() -> int:
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Sink)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="logstash-sink", daemon=True).start()
+    return server.server_address[1]
+
+
+def load_flows(data_path: str | None, scaler, n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n_features = getattr(scaler, "n_features_in_", 78)
+    if data_path:
+        import pandas as pd
+
+        df = pd.read_parquet(data_path).rename(columns={'label': 'Label'})
+        df = df.drop(columns=[c for c in ('Timestamp', 'Label') if c in df.columns])
+        X = df.apply(pd.to_numeric, errors='coerce').dropna().to_numpy(dtype=np.float32)
+        if X.shape[1] != n_features:
+            sys.exit(f"{data_path} has {X.shape[1]} features, the scaler expects {n_features}")
+        return X[rng.integers(0, len(X), n)]
+    mean = getattr(scaler, "mean_", np.zeros(n_features))
+    scale = getattr(scaler, "scale_", np.ones(n_features))
+    return (mean + scale * rng.standard_normal((n, n_features))).astype(np.float32)
+
+
+def encode_messages(X: np.ndarray, wire_format: str, flows_per_message: int, distinct_ips: int):
+    """(body, content_type) pairs in the producer's JSON schema or the binary flow-batch format."""
+    from application import flow_codec
+
+    ips = [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(distinct_ips)]
+    ip_src = [ips[i % distinct_ips] for i in range(len(X))]
+    ids = [f"bench-{i}" for i in range(len(X))]
+    if wire_format == "json":
+        return [(json.dumps({"IP Src": ip_src[i], "Port Src": 40000 + i % 20000, "IP Dst": "192.168.0.1",
+                             "id": ids[i], "features": X[i].tolist()}).encode(), None) for i in range(len(X))]
+    messages = []
+    for i in range(0, len(X), flows_per_message):
+        rows = slice(i, i + flows_per_message)
+        n_rows = len(X[rows])
+        messages.append((flow_codec.encode_flow_batch(ip_src[rows], ["192.168.0.1"] * n_rows,
+                                                      [40000 + j % 20000 for j in range(i, i + n_rows)],
+                                                      ids[rows], X[rows]), flow_codec.CONTENT_TYPE))
+    return messages
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def stage_totals() -> dict:
+    from domain.entities.loggers.registry import REGISTRY
+
+    family = REGISTRY.histogram("stage_latency_seconds", "Latency of the stages of sampled traces.", ["stage"])
+    totals = {}
+    for (stage,), histogram in family.children():
+        _, total, count = histogram.snapshot()
+        totals[stage] = (total, count)
+    return totals
+
+
+def run_stream(broker, messenger_service, db, messages, rate: float) -> tuple[float, float]:
+    """
+    Publish `messages` (all upfront, or paced at `rate` msgs/s from another thread) and consume them
+    until every package is written. Returns the wall and CPU seconds from the start of consumption.
+    """
+    def publish():
+        start = time.perf_counter()
+        for i, (body, content_type) in enumerate(messages):
+            if rate > 0:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            broker.publish_message(QUEUE, body, content_type)
+        broker.end_of_stream(QUEUE)
+
+    publisher = threading.Thread(target=publish, name="publisher", daemon=True)
+    if rate <= 0:
+        publish()
+    cpu_before, wall_before = os.times(), time.perf_counter()
+    if rate > 0:
+        publisher.start()
+    messenger_service.consume_message(QUEUE)
+    db.flush()
+    wall = time.perf_counter() - wall_before
+    cpu_after = os.times()
+    if rate > 0:
+        publisher.join()
+    return wall, (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+
+
+def run_case(predictor, db, firewall_service, strategy: str, batch_size: int, messages, warmup, args) -> dict:
+    from application.classification_service import ClassificationService
+    from application.messenger_service import MessengerService
+    from application.package_service import PackageService
+    from inprocess_broker import InProcessBroker
+
+    # Read by the services' constructors, like in the container
+    os.environ["GATING_METHOD"] = strategy
+    os.environ["BATCH_SIZE"] = str(batch_size)
+    os.environ["BATCH_LINGER_MS"] = str(args.linger_ms)
+    broker = InProcessBroker()
+    messenger_service = MessengerService(broker, ClassificationService(predictor), firewall_service, PackageService(db))
+
+    run_stream(broker, messenger_service, db, warmup, args.rate)
+    broker.deliveries.clear()
+    stages_before = stage_totals()
+    wall, cpu = run_stream(broker, messenger_service, db, messages, args.rate)
+
+    flows_per_message = 1 if args.format == "json" else args.flows_per_message
+    n_flows = args.n
+    start = 0 if args.rate > 0 else 1  # measured from publish when paced, from dequeue otherwise
+    latencies_ms = np.array([(handled - stamps[start]) / 1e6 for *stamps, handled in broker.deliveries])
+    p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99]) if len(latencies_ms) else (0.0, 0.0, 0.0)
+
+    result = {
+        "strategy": strategy,
+        "batch_size": batch_size,
+        "format": args.format,
+        "flows_per_message": flows_per_message,
+        "messages": len(messages),
+        "flows": n_flows,
+        "failed_messages": broker.failed,
+        "seconds": round(wall, 4),
+        "throughput_flows_per_s": round(n_flows / wall, 1),
+        "latency_ms": {"p50": round(p50, 3), "p90": round(p90, 3), "p99": round(p99, 3),
+                       "max": round(float(latencies_ms.max()), 3) if len(latencies_ms) else 0.0},
+        "cpu_cores": round(cpu / wall, 2),
+        "cpu_ms_per_1k_flows": round(cpu * 1e6 / max(n_flows, 1), 2),
+        "rss_mib": round(rss_bytes() / 2**20, 1),
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.trace:
+        stages = {}
+        for stage, (total, count) in sorted(stage_totals().items()):
+            total -= stages_before.get(stage, (0.0, 0))[0]
+            count -= stages_before.get(stage, (0.0, 0))[1]
+            if count:
+                stages[stage] = {"calls": int(count), "mean_ms": round(total / count * 1e3, 4)}
+        result["stages"] = stages
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ORACULO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(case: dict):
+    return case["strategy"], case["batch_size"], case["format"], case["flows_per_message"]
+
+
+def compare(results: list[dict], baseline_path: str, max_regression: float) -> bool:
+    """Print throughput and p99 changes against `baseline_path`; False if any case regressed too much."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {case_key(case): case for case in baseline["results"]}
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit')}):")
+    ok = True
+    for case in results:
+        old = previous.get(case_key(case))
+        if old is None:
+            continue
+        change = case["throughput_flows_per_s"] / old["throughput_flows_per_s"] - 1
+        p99_change = case["latency_ms"]["p99"] / old["latency_ms"]["p99"] - 1 if old["latency_ms"]["p99"] else 0.0
+        regressed = change < -max_regression
+        ok &= not regressed
+        print(f"{case['strategy']:>6} {case['batch_size']:>6}  throughput {change:+7.1%}  p99 {p99_change:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default=str(ORACULO_DIR / "app" / "data" / "models"))
+    parser.add_argument('--data', help='parquet to replay rows from (default: synthetic flows)')
+    parser.add_argument('--strategies', nargs='+', default=['hard', 'soft', 'top_k'], choices=['hard', 'soft', 'top_k'])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 256], help='BATCH_SIZE of the consumer')
+    parser.add_argument('--linger-ms', type=int, default=50)
+    parser.add_argument('-n', type=int, default=2000, help='flows per case')
+    parser.add_argument('--warmup', type=int, default=200, help='flows replayed before each case, not measured')
+    parser.add_argument('--format', default='json', choices=['json', 'binary'], help='message wire format')
+    parser.add_argument('--flows-per-message', type=int, default=64, help='flows per binary message')
+    parser.add_argument('--distinct-ips', type=int, default=1024, help='source IPs the flows are spread over')
+    parser.add_argument('--rate', type=float, default=0, help='publish rate in msgs/s (default: all upfront)')
+    parser.add_argument('--firewall', action='store_true', help='block non-benign sources on a local mock pfSense')
+    parser.add_argument('--trace', action='store_true', help='trace every message and report per-stage times')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='result file (default: benchmarks/results/e2e-<commit>.json)')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.10, help='tolerated throughput drop vs the baseline')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    output = Path(args.output or ORACULO_DIR / "benchmarks" / "results" / f"e2e-{commit or 'unknown'}.json").resolve()
+    for name in ("model_dir", "data", "baseline"):
+        if getattr(args, name):
+            setattr(args, name, str(Path(getattr(args, name)).resolve()))
+
+    # Packages, their index and the Logstash stream stay out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="oraculo-e2e-"))
+    os.environ.pop("PACKAGE_INDEX_PATH", None)
+    os.environ["LOGSTASH_URL"] = f"http://127.0.0.1:{start_logstash_sink()}"
+    os.environ["FIREWALL_BLOCKING"] = "true" if args.firewall else "false"
+    if args.trace:
+        os.environ["TRACE_SAMPLE_RATE"] = "1"
+
+    from application.classification_service import ClassificationService
+    from application.firewall_service import FirewallService
+    from domain.entities.predictor import PathModelConfig, Predictor
+    from infrastructure.adapters.pfsense_client import pfSenseClient
+    from infrastructure.database.logstash_producer import db
+
+    pfsense_url = "http://127.0.0.1:9"
+    if args.firewall:
+        from mock_pfsense import MockPfSense
+
+        pfsense = MockPfSense(("127.0.0.1", 0), latency_ms=20)
+        threading.Thread(target=pfsense.serve_forever, name="mock-pfsense", daemon=True).start()
+        pfsense_url = f"http://127.0.0.1:{pfsense.server_address[1]}/api/v1/firewall/rule"
+    firewall_service = FirewallService(pfSenseClient(pfsense_url, "bench", "bench"))
+
+    build_start = time.perf_counter()
+    predictor = Predictor(PathModelConfig(base_path=args.model_dir)).build()
+    build_seconds = time.perf_counter() - build_start
+    scaler = ClassificationService.load_scaler(predictor.model_dir)
+
+    X = load_flows(args.data, scaler, args.n + args.warmup, args.seed)
+    warmup = encode_messages(X[:args.warmup], args.format, args.flows_per_message, args.distinct_ips)
+    messages = encode_messages(X[args.warmup:], args.format, args.flows_per_message, args.distinct_ips)
+
+    results = []
+    print(f"{'strategy':>8} {'batch':>6} {'flows/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'cores':>6} {'RSS MiB':>8}")
+    for strategy in args.strategies:
+        for batch_size in args.batch_sizes:
+            case = run_case(predictor, db, firewall_service, strategy, batch_size, messages, warmup, args)
+            results.append(case)
+            print(f"{strategy:>8} {batch_size:>6} {case['throughput_flows_per_s']:>10.1f} {case['latency_ms']['p50']:>9.2f} "
+                  f"{case['latency_ms']['p99']:>9.2f} {case['cpu_cores']:>6.2f} {case['rss_mib']:>8.1f}")
+    firewall_service.flush()
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "benchmark": "end_to_end",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": {"hostname": platform.node(), "python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "env": {key: os.environ[key] for key in RECORDED_ENV if key in os.environ},
+        "model_build_seconds": round(build_seconds, 2),
+        "results": results,
+    }
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.baseline and not compare(results, args.baseline, args.max_regression):
+        sys.exit(1)
@@ -0,0 +1,110 @@
+"""
+In-process stand-in for MessageBroker, to drive MessengerService without RabbitMQ.
+
+Queues live in memory. `receive_message` and `receive_batch` deliver to the same callbacks, with the
+same size/linger batching, as the real broker, and return once `end_of_stream` is reached or
+`stop_consuming` is called. Every delivery is recorded as (published, dequeued, handled)
+perf_counter_ns timestamps in `deliveries`, so latencies can be measured from either end.
+"""
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from interfaces.messenger import Messenger  # noqa: E402
+
+_END = object()
+
+
+class InProcessBroker(Messenger):
+
+    def __init__(self):
+        self._queues: dict[str, queue.Queue] = defaultdict(queue.Queue)
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._delivery_tag = 0
+        self.deliveries: list[tuple[int, int, int]] = []
+        self.failed = 0
+
+    def connect(self):
+        pass
+
+    def publish_message(self, queue_name, message, content_type=None):
+        properties = SimpleNamespace(content_type=content_type)
+        self._queues[queue_name].put((time.perf_counter_ns(), properties, message))
+
+    def end_of_stream(self, queue_name):
+        """Make the consumer of `queue_name` return once everything published so far is handled."""
+        self._queues[queue_name].put(_END)
+
+    def receive_message(self, queue_name, callback):
+        self._stopping = False
+        for item in self._drain(queue_name):
+            published, properties, body = item
+            dequeued = time.perf_counter_ns()
+            method = SimpleNamespace(delivery_tag=self._next_tag(), redelivered=False)
+            try:
+                callback(None, method, properties, body)
+            except Exception as e:
+                logging.error(f"Error handling message {method.delivery_tag}: {str(e)}")
+                self.failed += 1
+            self.deliveries.append((published, dequeued, time.perf_counter_ns()))
+
+    def receive_batch(self, queue_name, callback, batch_size=64, linger_ms=50):
+        self._stopping = False
+        q = self._queues[queue_name]
+        linger = max(0, linger_ms) / 1000
+        while not self._stopping:
+            item = q.get()
+            if item is _END:
+                return
+            batch, stamps = [], []
+            deadline = time.monotonic() + linger
+            while True:
+                published, properties, body = item
+                batch.append((properties, body))
+                stamps.append((published, time.perf_counter_ns()))
+                if len(batch) >= batch_size:
+                    break
+                try:
+                    item = q.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _END:
+                    # Flush what was buffered, then stop like at a regular end of stream
+                    q.put(_END)
+                    break
+            try:
+                callback(batch)
+            except Exception as e:
+                logging.error(f"Error handling batch of {len(batch)} messages: {str(e)}")
+                self.failed += len(batch)
+            handled = time.perf_counter_ns()
+            self.deliveries.extend((published, dequeued, handled) for published, dequeued in stamps)
+
+    def stop_consuming(self):
+        self._stopping = True
+        for q in list(self._queues.values()):
+            q.put(_END)
+
+    def close_connection(self):
+        pass
+
+    def _drain(self, queue_name):
+        q = self._queues[queue_name]
+        while not self._stopping:
+            item = q.get()
+            if item is _END:
+                return
+            yield item
+
+    def _next_tag(self) -> int:
+        with self._lock:
+            self._delivery_tag += 1
+            return self._delivery_tag
@@ -0,0 +1,93 @@
+"""
+Local stand-in for the pfSense REST API, to exercise FirewallService without a firewall.
+
+Accepts POSTs of firewall rules on any path, answers after --latency-ms like a real appliance and
+keeps what it received. GET /stats returns the number of rules, filter applies and distinct source
+IPs; GET /rules returns the rules themselves.
+
+Usage (from the Oraculo directory):
+    python benchmarks/mock_pfsense.py --port 8443 --latency-ms 80
+    URL_FIREWALL=http://localhost:8443/api/v1/firewall/rule FIREWALL_BLOCKING=true python app/main.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockPfSense(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 50, fail_rate: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency_ms / 1000
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.rules = []
+        self.applies = 0
+        self.requests = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "rules": len(self.rules),
+                "applies": self.applies,
+                "distinct_ips": len({rule.get("src") for rule in self.rules}),
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like pfSense behind nginx
+
+    def do_POST(self):
+        server: MockPfSense = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            # Deterministic: every (1 / fail_rate)-th request fails
+            failed = server.fail_rate > 0 and server.requests % max(round(1 / server.fail_rate), 1) == 0
+            if not failed:
+                server.rules.append(body)
+                server.applies += bool(body.get("apply"))
+        if failed:
+            self._reply(500, {"status": "server error", "code": 500, "return": 1, "message": "mock failure"})
+        else:
+            self._reply(200, {"status": "ok", "code": 200, "return": 0, "message": "Success", "data": body})
+
+    def do_GET(self):
+        server: MockPfSense = self.server
+        if self.path.rstrip("/").endswith("rules"):
+            with server.lock:
+                self._reply(200, list(server.rules))
+        else:
+            self._reply(200, server.stats())
+
+    def _reply(self, status: int, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--latency-ms', type=float, default=50, help='delay before each response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with HTTP 500')
+    args = parser.parse_args()
+
+    server = MockPfSense((args.host, args.port), args.latency_ms, args.fail_rate)
+    print(f"Mock pfSense listening on http://{args.host}:{args.port} ({args.latency_ms} ms per request)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
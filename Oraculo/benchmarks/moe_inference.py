@@ -0,0 +1,208 @@
+"""
+Micro-benchmarks of MoE inference on synthetic models, without the trained CICIDS2018 artifacts.
+
+The gate and the experts are built with ModelBuilderGate / ModelBuilderExpert and keep their
+random initial weights. By default they use the architectures of the shipped model set: an
+mlp_residual gate, and one attention, cnn or lstm expert per class, as in data/models/experts. The
+gate is calibrated on synthetic rows labelled by its own argmax with 20% noise, then timed on
+identical batches:
+
+- GatingStrategy.hard_batch / soft_batch / top_k_batch, on the calibrated gate probabilities;
+- GateCalibrator.predict_proba (sklearn), and the ClosedFormCalibrator the service runs by default;
+- MoEPredictor.predict, for each strategy.
+
+Each case reports us/call and samples/s. Per-call overhead is estimated from the smallest and largest
+batch as the time of a call minus its rows times the marginal us/sample. Random gates route
+differently from the trained one, so predict cases also report the experts queried per sample. The
+tqdm bar of MoEPredictor still runs, but its output goes to /dev/null.
+
+Usage (from the Oraculo directory):
+    python benchmarks/moe_inference.py --batch-sizes 1 64 1024 8192
+    python benchmarks/moe_inference.py --backend tflite --expert-arch mlp_residual --output benchmarks/results/moe.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+import numpy as np  # noqa: E402
+
+ORACULO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ORACULO_DIR / "app"))
+sys.path.insert(0, str(ORACULO_DIR / "benchmarks"))
+
+from calibration_overhead import N_FEATURES, per_call_seconds  # noqa: E402
+
+# Architecture of each expert in the shipped model set (data/models/experts/<class>/model_<arch>_<class>.h5)
+DEPLOYED_EXPERTS = {
+    "Benign": "lstm",
+    "Bot": "attention",
+    "Brute Force -Web": "cnn",
+    "Brute Force -XSS": "cnn",
+    "DDOS attack-HOIC": "lstm",
+    "DDOS attack-LOIC-UDP": "attention",
+    "DDoS attacks-LOIC-HTTP": "lstm",
+    "DoS attacks-GoldenEye": "lstm",
+    "DoS attacks-Hulk": "cnn",
+    "DoS attacks-SlowHTTPTest": "cnn",
+    "DoS attacks-Slowloris": "lstm",
+    "FTP-BruteForce": "attention",
+    "Infilteration": "lstm",
+    "SQL Injection": "cnn",
+    "SSH-Bruteforce": "lstm",
+}
+ARCHITECTURES = ["mlp_residual", "cnn", "lstm", "attention"]
+
+
+def build_models(classes, expert_archs: dict, gate_arch: str, seed: int):
+    import tensorflow as tf
+    from moe.src.models import ModelBuilderExpert, ModelBuilderGate
+
+    tf.keras.utils.set_random_seed(seed)
+    strategy = tf.distribute.get_strategy()
+    gate_builder = ModelBuilderGate(input_shape=N_FEATURES, num_classes=len(classes), strategy=strategy)
+    expert_builder = ModelBuilderExpert(input_shape=N_FEATURES, strategy=strategy)
+    gate = getattr(gate_builder, f"build_{gate_arch}_model")()
+    experts = {}
+    for cls in classes:
+        build = getattr(expert_builder, f"build_{expert_archs[cls]}_model")
+        # The experts were trained with 2 attention heads (moe/src/experts/expert_train.py)
+        experts[cls] = build(num_heads=2) if expert_archs[cls] == "attention" else build()
+    return gate, experts
+
+
+def to_tflite(gate, experts, max_batch_size: int):
+    from moe.src.moe.export import TFLiteModel, export_tflite
+
+    workdir = tempfile.mkdtemp(prefix="moe-bench-")
+    num_threads = int(os.getenv("TFLITE_NUM_THREADS")) if os.getenv("TFLITE_NUM_THREADS") else None
+
+    def load(model, name):
+        return TFLiteModel(export_tflite(model, os.path.join(workdir, f"{name}.tflite")), max_batch_size, num_threads)
+
+    return load(gate, "gate"), {cls: load(model, f"expert_{i}") for i, (cls, model) in enumerate(experts.items())}
+
+
+def calibrate(gate, classes, method: str, n_rows: int, seed: int):
+    """The sklearn calibrator fitted on synthetic rows, and its closed-form conversion."""
+    from moe.src.moe.calibration import GateCalibrator, to_closed_form
+
+    rng = np.random.default_rng(seed)
+    X_cal = rng.standard_normal((n_rows, N_FEATURES)).astype(np.float32)
+    y_cal = gate.predict(X_cal, verbose=0).argmax(axis=1)
+    noisy = rng.random(len(y_cal)) < 0.2
+    y_cal[noisy] = rng.integers(0, len(classes), noisy.sum())
+    sklearn_calibrator = GateCalibrator(gate, list(range(len(classes))), method=method).calibrate(X_cal, y_cal)
+    return sklearn_calibrator, to_closed_form(sklearn_calibrator, gate)
+
+
+def timed(fn, X, min_time: float, quiet: bool = False) -> float:
+    if not quiet:
+        return per_call_seconds(fn, X, min_time)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        return per_call_seconds(fn, X, min_time)
+
+
+def overhead(cases: list[dict]) -> tuple[float, float]:
+    """Fixed us per call and marginal us per sample, from the smallest and largest batch of `cases`."""
+    small, large = min(cases, key=lambda c: c["batch_size"]), max(cases, key=lambda c: c["batch_size"])
+    if large["batch_size"] == small["batch_size"]:
+        return small["us_per_call"], 0.0
+    marginal = (large["us_per_call"] - small["us_per_call"]) / (large["batch_size"] - small["batch_size"])
+    return max(small["us_per_call"] - marginal * small["batch_size"], 0.0), marginal
+
+
+def report(title: str, cases: list[dict], extra: str | None = None) -> dict:
+    print(f"\n{title}")
+    print(f"{'batch':>6} {'us/call':>12} {'samples/s':>12}" + (f" {extra:>16}" if extra else ""))
+    for case in cases:
+        print(f"{case['batch_size']:>6} {case['us_per_call']:>12.1f} {case['samples_per_s']:>12.0f}"
+              + (f" {case[extra]:>16.2f}" if extra else ""))
+    fixed, marginal = overhead(cases)
+    print(f"per-call overhead ~{fixed:.1f} us, marginal {marginal:.3f} us/sample")
+    return {"name": title, "overhead_us_per_call": round(fixed, 2), "marginal_us_per_sample": round(marginal, 4),
+            "cases": cases}
+
+
+def case(batch_size: int, seconds: float, **extra) -> dict:
+    return {"batch_size": batch_size, "us_per_call": round(seconds * 1e6, 2),
+            "samples_per_s": round(batch_size / seconds, 1), **extra}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64, 512, 4096, 8192])
+    parser.add_argument('--strategies', nargs='+', default=['hard', 'soft', 'top_k'], choices=['hard', 'soft', 'top_k'])
+    parser.add_argument('--threshold', type=float, default=0.1, help='soft gating threshold')
+    parser.add_argument('--k', type=int, default=2, help='experts per sample for top_k')
+    parser.add_argument('--gate-arch', default='mlp_residual', choices=ARCHITECTURES)
+    parser.add_argument('--expert-arch', choices=ARCHITECTURES, help='one architecture for every expert (default: as shipped)')
+    parser.add_argument('--n-experts', type=int, default=len(DEPLOYED_EXPERTS))
+    parser.add_argument('--backend', default='keras', choices=['keras', 'tflite'])
+    parser.add_argument('--fused', action='store_true', help='run MoEPredictor with the fused graph (keras only)')
+    parser.add_argument('--calibration', default='isotonic', choices=['isotonic', 'sigmoid'])
+    parser.add_argument('--n-calibration', type=int, default=20000, help='synthetic calibration rows')
+    parser.add_argument('--gate-confidence-bound', type=float, help='as GATE_CONFIDENCE_BOUND')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds spent timing each case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+    if args.fused and args.backend != 'keras':
+        parser.error("--fused needs the keras backend")
+
+    from moe.src.moe.gating_strategies import GatingStrategy
+    from moe.src.moe.predictors import MoEPredictor
+
+    classes = list(DEPLOYED_EXPERTS)[:args.n_experts] + [f"class_{i}" for i in range(len(DEPLOYED_EXPERTS), args.n_experts)]
+    expert_archs = {cls: args.expert_arch or DEPLOYED_EXPERTS.get(cls, "mlp_residual") for cls in classes}
+    gate, experts = build_models(classes, expert_archs, args.gate_arch, args.seed)
+    if args.backend == 'tflite':
+        gate, experts = to_tflite(gate, experts, max(args.batch_sizes))
+    sklearn_calibrator, closed_form = calibrate(gate, classes, args.calibration, args.n_calibration, args.seed)
+
+    rng = np.random.default_rng(args.seed)
+    X_all = rng.standard_normal((max(args.batch_sizes), N_FEATURES)).astype(np.float32)
+    probs_all = closed_form.predict_proba(X_all)
+    results = {"config": vars(args), "expert_architectures": expert_archs, "benchmarks": []}
+
+    gating = {
+        "hard": lambda P: GatingStrategy.hard_batch(P),
+        "soft": lambda P: GatingStrategy.soft_batch(P, args.threshold),
+        "top_k": lambda P: GatingStrategy.top_k_batch(P, args.k),
+    }
+    for strategy in args.strategies:
+        cases = [case(n, timed(gating[strategy], probs_all[:n], args.min_time)) for n in args.batch_sizes]
+        results["benchmarks"].append(report(f"GatingStrategy.{strategy}_batch", cases))
+
+    calibrators = [("GateCalibrator.predict_proba (sklearn)", sklearn_calibrator)]
+    if closed_form is not sklearn_calibrator:
+        calibrators.append(("ClosedFormCalibrator.predict_proba", closed_form))
+    for name, calibrator in calibrators:
+        cases = [case(n, timed(calibrator.predict_proba, X_all[:n], args.min_time)) for n in args.batch_sizes]
+        results["benchmarks"].append(report(name, cases))
+
+    predictor = MoEPredictor(closed_form, experts, classes, fused=args.fused, gate_confidence_bound=args.gate_confidence_bound)
+    selected = {
+        "hard": lambda P: np.ones(len(P)),
+        "soft": lambda P: GatingStrategy.soft_batch(P, args.threshold).sum(axis=1),
+        "top_k": lambda P: GatingStrategy.top_k_batch(P, args.k).sum(axis=1),
+    }
+    for strategy in args.strategies:
+        cases = []
+        for n in args.batch_sizes:
+            predict = lambda X: predictor.predict(X, strategy, args.threshold, batch_size=n, k=args.k)
+            seconds = timed(predict, X_all[:n], args.min_time, quiet=True)
+            cases.append(case(n, seconds, experts_per_sample=round(float(selected[strategy](probs_all[:n]).mean()), 2)))
+        results["benchmarks"].append(report(f"MoEPredictor.predict ({strategy}, {args.backend}{', fused' if args.fused else ''})",
+                                            cases, extra="experts_per_sample"))
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {output}")
@@ -1,17 +1,16 @@
-import gc
 import pika
 import pandas as pd
 import json
 import time
-from sklearn.preprocessing import StandardScaler
 
 # === Configuration ===
 RABBITMQ_HOST = 'rabbitmq'        # Change if needed
 RABBITMQ_PORT = 5672
-QUEUE_NAME = 'fluxos'
+QUEUE_NAME = 'model-queue'        # The queue Oraculo consumes (see app/main.py)
 DATA_PATH = 'app/data/models/calibrate/CICIDS2018_preprocessed_test.parquet'
 NUM_SAMPLES = 5
 MOCK_IP = "192.168.1.123"
+MOCK_DST_IP = "192.168.0.1"
 ATTACK_LABEL = "SSH-Bruteforce"  # Change this to test different attack classes
 
 # === Load and preprocess data ===
@@ -30,14 +29,8 @@ df_attack = df[df['Label'] == ATTACK_LABEL]
 if df_attack.empty:
     raise ValueError(f"No samples found with label '{ATTACK_LABEL}'")
 
-# Remove label column and fit scaler
-X = df_attack.drop(columns=['Label'])
-cols = X.columns.tolist()
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
-
-# Create scaled DataFrame
-df_scaled = pd.DataFrame(X_scaled, columns=cols)
+# Oraculo scales the features itself, with the scaler shipped with the models, so they are sent raw
+X = df_attack.drop(columns=['Label']).astype(float)
 
 # === Connect to RabbitMQ ===
 credentials = pika.PlainCredentials('guest', 'guest')
@@ -51,14 +44,15 @@ connection = pika.BlockingConnection(params)
 channel = connection.channel()
 
 # Queue must match durability config with consumer
-channel.queue_declare(queue=QUEUE_NAME, durable=False)
+channel.queue_declare(queue=QUEUE_NAME, durable=True)
 
 # === Send messages ===
 print(f"Sending {NUM_SAMPLES} attack samples to queue '{QUEUE_NAME}'...")
 
 for i in range(NUM_SAMPLES):
-    sample = df_scaled.sample(n=1, random_state=i).iloc[0].to_dict()
-    message = {"ip": MOCK_IP, **sample}
+    features = X.sample(n=1, random_state=i).iloc[0].tolist()
+    # Same schema as the CICFlowMeter producer
+    message = {"IP Src": MOCK_IP, "Port Src": 40000 + i, "IP Dst": MOCK_DST_IP, "id": f"send-to-oraculo-{i}", "features": features}
 
     channel.basic_publish(
         exchange='',
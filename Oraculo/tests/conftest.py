@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The application imports its modules relative to Oraculo/app, as in the container
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+
+@pytest.fixture(autouse=True)
+def scratch_cwd(tmp_path, monkeypatch):
+    # Modules like logstash_producer create files (logs.jsonl) relative to the working directory on import
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from application.firewall_service import FirewallService
+
+
+class FakePfSense:
+    def __init__(self, failing_applies=0):
+        self.rules = []
+        self.failing_applies = failing_applies
+
+    def post(self, path='', data=None):
+        if data["apply"] and self.failing_applies:
+            self.failing_applies -= 1
+            return SimpleNamespace(ok=False)
+        self.rules.append(data)
+        return SimpleNamespace(ok=True)
+
+
+def block_all(service, ips):
+    for ip in ips:
+        service.block_source_ip(ip)
+    service.flush()
+
+
+def test_batch_is_applied_once_and_deduplicated():
+    pfsense = FakePfSense()
+    service = FirewallService(pfsense, batch_size=10, linger_ms=200)
+    block_all(service, ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+    block_all(service, ["10.0.0.1"])
+
+    assert [rule["src"] for rule in pfsense.rules] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert [rule["apply"] for rule in pfsense.rules] == [False, False, True]
+    assert service.blocked == 3 and service.deduplicated == 1
+
+
+def test_apply_is_retried_once():
+    pfsense = FakePfSense(failing_applies=1)
+    service = FirewallService(pfsense, batch_size=10, linger_ms=200)
+    block_all(service, ["10.0.0.1", "10.0.0.2"])
+
+    assert [(rule["src"], rule["apply"]) for rule in pfsense.rules] == [("10.0.0.1", False), ("10.0.0.2", True)]
+    assert service.blocked == 2 and service.failed == 0
+
+
+def test_unapplied_batch_is_not_recorded_as_blocked():
+    pfsense = FakePfSense(failing_applies=2)
+    service = FirewallService(pfsense, batch_size=10, linger_ms=200)
+    block_all(service, ["10.0.0.1", "10.0.0.2"])
+    assert service.blocked == 0 and service.failed == 2
+
+    # A later verdict for the same IPs tries again instead of being deduplicated
+    block_all(service, ["10.0.0.1", "10.0.0.2"])
+    assert service.deduplicated == 0 and service.blocked == 2
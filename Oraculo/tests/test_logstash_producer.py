@@ -0,0 +1,83 @@
+import json
+import socket
+
+import pytest
+
+
+class FakeConnection:
+    def __init__(self, accept_bytes=None):
+        self.received = b""
+        self.accept_bytes = accept_bytes
+
+    def setsockopt(self, *args):
+        pass
+
+    def send(self, data):
+        if self.accept_bytes is not None and len(self.received) >= self.accept_bytes:
+            raise ConnectionResetError("connection reset by peer")
+        # Short writes, as a congested socket does
+        n = min(len(data), 7, *([self.accept_bytes - len(self.received)] if self.accept_bytes is not None else []))
+        self.received += bytes(data[:n])
+        return n
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def producer(tmp_path):
+    # Imported here, inside the scratch directory of conftest.scratch_cwd: the module builds its own producer
+    from infrastructure.database.logstash_producer import PersistentLogstashProducer
+
+    producer = PersistentLogstashProducer(tmp_path / "logs.jsonl", "logstash", 5044, flush_interval=0.05)
+    yield producer
+    producer.close()
+
+
+def documents(data):
+    return [json.loads(line) for line in data.decode().splitlines()]
+
+
+def test_broken_connection_resends_only_unsent_lines(producer, monkeypatch):
+    connections = [FakeConnection(accept_bytes=60), FakeConnection()]
+    monkeypatch.setattr(socket, "create_connection", lambda *args, **kwargs: connections[producer.reconnects])
+
+    packages = [{"ip": "10.0.0.1", "id": f"flow-{i}"} for i in range(5)]
+    for package in packages:
+        producer.create(package)
+    producer.flush()
+    # Reconnect right away instead of after the backoff, and ship the backlog
+    producer._next_connect = 0
+    producer.create({"ip": "10.0.0.1", "id": "flow-5"})
+    producer.flush()
+
+    first, second = connections
+    complete = len(first.received.rsplit(b"\n", 1)[0]) + 1
+    assert [p["id"] for p in documents(first.received[:complete])] == ["flow-0"]
+    # Only the torn line is sent again, whole, on the new connection
+    assert [p["id"] for p in documents(second.received)] == [f"flow-{i}" for i in range(1, 6)]
+    assert len(producer.get_all()) == 6
+
+
+def test_durable_create_resolves_once_the_package_is_fsynced(producer, monkeypatch):
+    monkeypatch.setattr(socket, "create_connection", lambda *args, **kwargs: FakeConnection())
+    synced = []
+    monkeypatch.setattr("os.fsync", lambda fd: synced.append(producer.file_path.read_bytes()))
+
+    assert producer.create({"ip": "10.0.0.1", "id": "flow-0"}) is None
+    persisted = producer.create({"ip": "10.0.0.1", "id": "flow-1"}, durable=True)
+    assert persisted.result(timeout=5) is None
+    # The batch was fsynced right away, with the package in it, rather than on the fsync interval
+    assert [p["id"] for p in documents(synced[0])] == ["flow-0", "flow-1"]
+
+
+def test_durable_create_fails_when_the_queue_is_full(tmp_path):
+    from infrastructure.database.logstash_producer import PersistentLogstashProducer
+
+    producer = PersistentLogstashProducer(tmp_path / "logs.jsonl", "logstash", 5044, queue_size=1)
+    # Keep the flusher from draining the queue
+    producer._flusher = object()
+    producer.create({"id": "flow-0"})
+    persisted = producer.create({"id": "flow-1"}, durable=True)
+    assert isinstance(persisted.exception(timeout=0), RuntimeError)
+    assert producer.dropped == 1
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+mlflow = pytest.importorskip("mlflow")
+
+
+MODEL_SET = {
+    "gate/gate.h5": b"gate weights",
+    "experts/dos/expert.h5": b"dos expert weights",
+    "experts/bot/expert.h5": b"bot expert weights",
+    "preprocessor/pipeline.pkl": b"scaler",
+    "preprocessor/calibrator.pkl": b"calibrator",
+    "tflite/manifest.json": b"{}",
+    "tflite/gate/gate.tflite": b"gate flatbuffer",
+    "tflite/experts/dos/expert.tflite": b"dos expert flatbuffer",
+    "tflite/experts/bot/expert.tflite": b"bot expert flatbuffer",
+}
+
+
+def write_model_set(base_path, files):
+    for relative_path, content in files.items():
+        path = base_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return base_path
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    from infrastructure.adapters.mlflow_registry import MLflowModelRegistry
+
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    return MLflowModelRegistry(f"file:{tmp_path / 'mlruns'}", cache_dir=tmp_path / "cache")
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """The artifact paths `fetch` downloads, relative to the model set."""
+    paths = []
+    download_artifacts = mlflow.artifacts.download_artifacts
+
+    def counting(artifact_uri, **kwargs):
+        paths.append(artifact_uri.split("/model_set/", 1)[1])
+        return download_artifacts(artifact_uri=artifact_uri, **kwargs)
+
+    monkeypatch.setattr(mlflow.artifacts, "download_artifacts", counting)
+    return paths
+
+
+def read_set(set_dir):
+    # Everything but the registry's own manifest at the top of the set
+    return {path.relative_to(set_dir).as_posix(): path.read_bytes() for path in set_dir.rglob("*")
+            if path.is_file() and path != set_dir / "manifest.json"}
+
+
+def test_publish_then_resolve_and_fetch_by_version_and_alias(registry, tmp_path, downloads):
+    version = registry.publish(write_model_set(tmp_path / "set", MODEL_SET), "oraculo", alias="production")
+
+    assert registry.resolve("oraculo", version=version).version == version
+    assert registry.resolve("oraculo", alias="production").version == version
+    with pytest.raises(ValueError):
+        registry.resolve("oraculo")
+
+    set_dir = registry.fetch("oraculo", alias="production")
+    assert read_set(set_dir) == MODEL_SET
+    manifest = json.loads((set_dir / "manifest.json").read_bytes())
+    assert sorted(manifest["files"]) == sorted(MODEL_SET)
+    assert sorted(downloads) == sorted(["manifest.json", *MODEL_SET])
+
+
+def test_fetch_reuses_the_content_addressed_cache(registry, tmp_path, downloads):
+    first = registry.publish(write_model_set(tmp_path / "v1", MODEL_SET), "oraculo")
+    set_dir = registry.fetch("oraculo", version=first)
+
+    # Nothing changed: only the manifest is fetched again
+    downloads.clear()
+    assert registry.fetch("oraculo", version=first) == set_dir
+    assert downloads == ["manifest.json"]
+
+    # A new version that only retrains one expert only downloads that file
+    retrained = dict(MODEL_SET, **{"experts/dos/expert.h5": b"retrained dos expert weights"})
+    second = registry.publish(write_model_set(tmp_path / "v2", retrained), "oraculo")
+    downloads.clear()
+    second_dir = registry.fetch("oraculo", version=second)
+    assert second_dir != set_dir
+    assert read_set(second_dir) == retrained
+    assert downloads == ["manifest.json", "experts/dos/expert.h5"]
+
+
+def test_fetch_replaces_corrupted_cached_files(registry, tmp_path, downloads):
+    version = registry.publish(write_model_set(tmp_path / "set", MODEL_SET), "oraculo")
+    set_dir = registry.fetch("oraculo", version=version)
+    (set_dir / "gate/gate.h5").write_bytes(b"truncated")
+
+    downloads.clear()
+    assert registry.fetch("oraculo", version=version) == set_dir
+    assert read_set(set_dir) == MODEL_SET
+    assert downloads == ["manifest.json", "gate/gate.h5"]
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from infrastructure.database.in_memory_database import InMemoryDatabase
+from infrastructure.database.package_index import PackageIndex
+
+
+def package(i, ip="10.0.0.1", attack_type="DDoS"):
+    return {"ids": "oraculo", "ip": ip, "id": f"flow-{i}", "attack_type": attack_type, "confidence": 0.9,
+            "timestamp": f"2026-01-01T00:00:{i:02d}"}
+
+
+def append(path, packages, tail=b""):
+    with open(path, "ab") as f:
+        f.write(b"".join(json.dumps(p).encode() + b"\n" for p in packages) + tail)
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "logs.jsonl"
+    path.touch()
+    return path
+
+
+def test_backfills_an_existing_log(log):
+    append(log, [package(i) for i in range(10)])
+    index = PackageIndex(log)
+
+    assert index.sync() == 10
+    assert index.sync() == 0
+    items, cursor = index.query(limit=100)
+    assert [p["id"] for p in items] == [f"flow-{i}" for i in reversed(range(10))]
+    assert cursor is None
+
+
+def test_torn_last_line_is_indexed_once_complete(log):
+    torn = json.dumps(package(1)).encode()
+    append(log, [package(0)], tail=torn[:20])
+    index = PackageIndex(log)
+
+    assert index.sync() == 1
+    with open(log, "ab") as f:
+        f.write(torn[20:] + b"\n")
+    assert index.sync() == 1
+    assert [p["id"] for p in index.query()[0]] == ["flow-1", "flow-0"]
+
+
+def test_truncated_log_is_rebuilt(log):
+    append(log, [package(i) for i in range(5)])
+    index = PackageIndex(log)
+    index.sync()
+
+    log.write_bytes(b"")
+    append(log, [package(42)])
+    items, _ = index.query()
+    assert [p["id"] for p in items] == ["flow-42"]
+
+
+def test_replaced_log_is_rebuilt(log, tmp_path):
+    append(log, [package(i) for i in range(3)])
+    index = PackageIndex(log, tmp_path / "index.sqlite3")
+    index.sync()
+
+    rotated = tmp_path / "new.jsonl"
+    append(rotated, [package(i) for i in range(3, 8)])
+    rotated.replace(log)
+    assert [p["id"] for p in index.query()[0]] == [f"flow-{i}" for i in reversed(range(3, 8))]
+
+
+@pytest.mark.parametrize("repository", ["index", "in_memory"])
+def test_cursor_paging_with_filters(log, repository):
+    packages = [package(i, ip=f"10.0.0.{i % 2}", attack_type="DDoS" if i % 3 else "Bot") for i in range(30)]
+    if repository == "index":
+        append(log, packages)
+        db = PackageIndex(log)
+    else:
+        db = InMemoryDatabase()
+        for p in packages:
+            db.create(p)
+
+    expected = [p["id"] for p in reversed(packages) if p["ip"] == "10.0.0.1" and p["attack_type"] == "DDoS"
+                and "2026-01-01T00:00:05" <= p["timestamp"] <= "2026-01-01T00:00:25"]
+    seen, cursor = [], None
+    while True:
+        items, cursor = db.query(ip="10.0.0.1", attack_type="DDoS", since="2026-01-01T00:00:05",
+                                 until="2026-01-01T00:00:25", limit=3, cursor=cursor)
+        seen += [p["id"] for p in items]
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_in_memory_database_is_instantiable():
+    db = InMemoryDatabase()
+    db.create(package(0))
+    assert db.query() == ([package(0)], None)
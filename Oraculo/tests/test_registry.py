@@ -0,0 +1,41 @@
+import os
+
+from domain.entities.loggers.registry import MetricsRegistry
+
+
+def test_reset_zeroes_counters_and_histograms_but_keeps_gauges():
+    registry = MetricsRegistry()
+    counter = registry.counter("flows", "Flows.")
+    histogram = registry.histogram("latency_seconds", "Latency.", ["stage"])
+    gauge = registry.gauge("queue_depth", "Queue depth.")
+    counter.inc(3)
+    histogram.labels("gate").observe(0.01)
+    gauge.set(7)
+
+    registry.reset()
+    counter.inc()
+
+    assert counter.value == 1
+    assert histogram.labels("gate").snapshot()[2] == 0
+    assert gauge.value == 7
+
+
+def test_forked_child_reports_only_its_own_values():
+    registry = MetricsRegistry()
+    counter = registry.counter("flows", "Flows.")
+    counter.inc(5)
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            registry.reset()
+            counter.inc(2)
+            os.write(write_fd, str(counter.value).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        assert float(f.read()) == 2
+    assert counter.value == 5
@@ -0,0 +1,67 @@
+import threading
+
+from domain.entities.verdict_aggregator import VerdictAggregator
+
+
+class FakeClock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def flusher_threads():
+    return [t for t in threading.enumerate() if t.name == "verdict-flusher"]
+
+
+def test_opening_verdict_is_emitted_at_once_and_later_ones_are_summarized():
+    clock, emitted = FakeClock(), []
+
+    def emit(window):
+        emitted.append(window)
+        return f"persisted-{window.first_id}"
+
+    aggregator = VerdictAggregator(5, emit, clock=clock)
+
+    assert aggregator.add("10.0.0.1", "id-1", "DoS attacks-Hulk", 0.6) == "persisted-id-1"
+    aggregator.add("10.0.0.2", "id-2", "DoS attacks-Hulk", 0.8)
+    assert [(w.ip, w.first_id, w.count) for w in emitted] == [("10.0.0.1", "id-1", 1), ("10.0.0.2", "id-2", 1)]
+
+    clock.now += 1
+    # A rolled-up verdict gets what emitting its window's opening verdict returned
+    assert aggregator.add("10.0.0.1", "id-3", "DoS attacks-Hulk", 0.9) == "persisted-id-1"
+    clock.now += 1
+    aggregator.add("10.0.0.1", "id-4", "DoS attacks-Hulk", 0.7)
+    assert aggregator.flush() == 0 and len(emitted) == 2
+
+    clock.now += 3
+    # Only the window that rolled up later verdicts is emitted again, as its summary
+    assert aggregator.flush() == 1
+    summary = emitted[-1]
+    assert (summary.ip, summary.first_id, summary.count, summary.max_confidence) == ("10.0.0.1", "id-1", 3, 0.9)
+    assert (summary.first_seen, summary.last_seen) == (1_000.0, 1_002.0)
+    aggregator.stop()
+
+    # The key opens a new window, whose first verdict is emitted right away again
+    aggregator.add("10.0.0.1", "id-5", "DoS attacks-Hulk", 0.5)
+    assert (emitted[-1].first_id, emitted[-1].count) == ("id-5", 1)
+    aggregator.stop()
+
+
+def test_stop_joins_the_flusher_and_summarizes_open_windows():
+    emitted = []
+    aggregator = VerdictAggregator(60, emitted.append, clock=FakeClock())
+    aggregator.add("10.0.0.1", "id-1", "Bot", 0.9)
+    aggregator.add("10.0.0.1", "id-2", "Bot", 0.9)
+    assert len(flusher_threads()) == 1
+
+    assert aggregator.stop() == 1
+    assert [window.count for window in emitted] == [1, 2]
+    assert flusher_threads() == []
+
+    # Verdicts after a stop start a new flusher
+    aggregator.add("10.0.0.1", "id-3", "Bot", 0.9)
+    assert len(flusher_threads()) == 1
+    assert aggregator.stop() == 0
+    assert len(emitted) == 3 and flusher_threads() == []